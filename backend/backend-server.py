@@ -1,66 +1,429 @@
+import time
+BOOT_STARTED = time.perf_counter()
+
 import os
-import json
 import base64
-import requests
-from flask import Flask, request, jsonify
+import atexit
+import argparse
+import functools
+from contextlib import contextmanager
+from services.thread_budget import ThreadBudget
+
+
+def parse_server_args():
+    """Serving options; every flag can also be set through its PARKER_* environment variable."""
+    parser = argparse.ArgumentParser(description="Parker analysis API server")
+    parser.add_argument('--mode', choices=['dev', 'production'],
+                        default=os.environ.get('PARKER_SERVER_MODE', 'dev'),
+                        help="dev: Flask development server; production: gevent WSGI server")
+    parser.add_argument('--host', default=os.environ.get('PARKER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PARKER_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PARKER_ANALYSIS_WORKERS', 0)),
+                        help="Analysis worker processes (0 runs analysis in the request handler)")
+    parser.add_argument('--max-connections', type=int,
+                        default=int(os.environ.get('PARKER_MAX_CONNECTIONS', 1000)),
+                        help="Concurrent connections served by the gevent front end")
+    parser.add_argument('--io-threads', type=int, default=int(os.environ.get('PARKER_IO_THREADS', 16)),
+                        help="Threads the gevent front end waits on blocking calls with")
+    parser.add_argument('--preload', action='store_true',
+                        default=os.environ.get('PARKER_PRELOAD', '').lower() in ('1', 'true', 'yes'),
+                        help="Import the analysis libraries before forking workers (shared copy-on-write)")
+    parser.add_argument('--warm-up', action=argparse.BooleanOptionalAction, default=None,
+                        help="Analyze a synthetic vowel before serving so numba kernels are compiled "
+                             "(default: PARKER_WARM_UP, else on in production mode)")
+    args = parser.parse_args()
+    if args.warm_up is None:
+        warm_up = os.environ.get('PARKER_WARM_UP')
+        args.warm_up = warm_up.lower() in ('1', 'true', 'yes') if warm_up else args.mode == 'production'
+    if args.mode == 'production' and args.workers <= 0:
+        # Inline analysis would block every greenlet of the gevent front end
+        args.workers = os.cpu_count() or 1
+    return args
+
+
+server_args = parse_server_args() if __name__ == '__main__' else None
+
+# Thread budget has to reach the BLAS/OpenMP/numba env vars before numpy is imported
+thread_budget = ThreadBudget(workers=server_args.workers if server_args else None)
+thread_budget.configure_environment()
+
+# Compiled librosa kernels survive restarts (must be set before numba is imported)
+from services import startup
+startup.configure_jit_cache()
+
+from io import BytesIO
+from flask import Flask, Response, copy_current_request_context, g, request, jsonify, send_file
 from services import handwriting_service, speech_service
+from services.noise_profile import NoiseProfileStore
+from services.handwriting_session import HandwritingSessionRegistry
+from services.trend_renderer import TrendRenderer
+from services.ocr_client import DocumentAIClient
+from services.image_preprocessor import ImagePreprocessor
+from services.writing_pipeline import WritingPipeline
+from services.json_provider import NumpyJSONProvider
+from services.worker_pool import AnalysisWorkerPool
+from services import analysis_tasks
+from services.metrics import AnalysisMetrics, CONTENT_TYPE
+from services.admission import AdmissionController, Rejected
+from services.single_flight import IdempotencyCache, IdempotencyConflict, SingleFlight, request_key
+from services.longitudinal_store import LongitudinalStore, handwriting_metrics, speech_metrics
+from google.api_core.exceptions import GoogleAPICallError
 from datetime import datetime
 
 app = Flask(__name__)
+# NumPy values (e.g. the UPDRS score, token columns) are encoded natively
+app.json = NumpyJSONProvider(app)
+thread_budget.apply()
 
 # Initialize your proprietary services
-gcloud_key = os.environ['GOOGLE_APPLICATION_CREDENTIALS']
-handwriting_service = handwriting_service.HandwritingAnalysisService()
-speech_service = speech_service.SpeechAnalysisService() 
+# Only needed for Google-hosted OCR; DocumentAIClient reads it when it connects
+gcloud_key = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+handwriting_service = handwriting_service.HandwritingAnalysisService(
+    renderer=TrendRenderer(cache_dir=os.environ.get('PARKER_PLOT_CACHE_DIR'))
+)
+speech_service = speech_service.SpeechAnalysisService(
+    noise_profiles=NoiseProfileStore(directory=os.environ.get('PARKER_NOISE_PROFILE_DIR'))
+)
 # speech_service = SpeechAnalysisService()
+writing_sessions = HandwritingSessionRegistry(handwriting_service)
+# Images are preprocessed by the pipeline, so the OCR client itself doesn't
+ocr_client = DocumentAIClient.from_environment(preprocessor=None)
+# Uploads from PARKER_EXTRACT_MIN_PAGES pages / PARKER_EXTRACT_MIN_TOKENS tokens are extracted on all workers
+writing_pipeline = WritingPipeline(handwriting_service, ocr_client, ImagePreprocessor.from_environment(),
+                                   parallel_min_pages=int(os.environ.get('PARKER_EXTRACT_MIN_PAGES', 8)),
+                                   parallel_min_tokens=int(os.environ.get('PARKER_EXTRACT_MIN_TOKENS', 20000)))
+# CPU-bound analysis runs in worker processes forked from this, fully initialized, process
+analysis_tasks.configure(handwriting_service, speech_service, writing_pipeline, thread_budget)
+if server_args:
+    worker_pool = AnalysisWorkerPool(workers=server_args.workers, io_threads=server_args.io_threads)
+else:
+    worker_pool = AnalysisWorkerPool.from_environment()
+# Startup time and memory, filled in when run as a server
+boot_report = None
+
+# Bounded concurrency + wait queue per analysis endpoint (PARKER_SPEECH_*/PARKER_WRITING_* limits)
+analysis_slots = max(1, worker_pool.workers or thread_budget.cpu_count)
+admission = {
+    'speech': AdmissionController.from_environment('speech', max_concurrent=analysis_slots,
+                                                   max_queue=2 * analysis_slots),
+    # A writing slot spans the OCR call as well as extraction and trends
+    'writing': AdmissionController.from_environment('writing', max_concurrent=analysis_slots,
+                                                    max_queue=2 * analysis_slots),
+}
+
+# Identical in-flight requests share one analysis; Idempotency-Key replays completed ones
+single_flight = SingleFlight()
+idempotency = IdempotencyCache.from_environment()
+
+# Per-patient scores and trend metrics over time (PARKER_LONGITUDINAL_DB), written in batches
+longitudinal_store = LongitudinalStore.from_environment()
+atexit.register(longitudinal_store.close)
+
+metrics = AnalysisMetrics()
+metrics.sampled_counter('requests_coalesced_total', "Requests answered by an identical request already in flight.",
+                        lambda: [((), single_flight.status()["coalesced"])])
+metrics.sampled_counter('idempotent_replays_total', "Requests answered from the Idempotency-Key cache.",
+                        lambda: [((), idempotency.status()["hits"])])
+metrics.gauge('admission_running', "Requests holding an analysis slot.",
+              lambda: [((name,), controller.status()["running"]) for name, controller in admission.items()],
+              ('endpoint',))
+metrics.gauge('admission_waiting', "Requests waiting for an analysis slot.",
+              lambda: [((name,), controller.status()["waiting"]) for name, controller in admission.items()],
+              ('endpoint',))
+metrics.gauge('worker_tasks_in_flight', "Analysis tasks submitted and not finished.",
+              lambda: [((), worker_pool.status()["in_flight"])])
+metrics.gauge('worker_queue_depth', "Analysis tasks waiting for a free worker process.",
+              lambda: [((), max(0, worker_pool.status()["in_flight"] - worker_pool.workers)
+                        if worker_pool.workers else 0)])
+metrics.gauge('worker_processes', "Analysis worker processes (0: analysis runs in the request handler).",
+              lambda: [((), worker_pool.workers)])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Route templates, not paths, keep the label set small
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe_request(endpoint, response.status_code, time.perf_counter() - started,
+                                request.content_length or 0, response.calculate_content_length() or 0)
+    return response
+
+def request_user():
+    """Who a request counts against for per-user rate limits."""
+    user = request.headers.get('X-User-Id')
+    if not user and request.is_json:
+        user = (request.get_json(silent=True) or {}).get('user_id')
+    return str(user or request.remote_addr)
+
+@contextmanager
+def admission_slot(name):
+    """Hold one of the named endpoint's slots; the user's rate and the queue are checked first (Rejected)."""
+    controller = admission[name]
+    user = request_user() if controller.limiter is not None else None
+    with controller.admit(user) as waited:
+        metrics.observe_admission(request.url_rule.rule, waited)
+        yield
+
+def run_admitted(name, task, *args):
+    """Run an analysis task on the worker pool once the named AdmissionController admits the request."""
+    with admission_slot(name):
+        return worker_pool.run(task, *args)
+
+def admitted(*names):
+    """Fail fast when a named endpoint's queue is full; Rejected becomes 429/503 with Retry-After."""
+    controllers = [admission[name] for name in names]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                # Refuse before the upload is parsed when the queue is already full
+                for controller in controllers:
+                    controller.check_capacity()
+                return view(*args, **kwargs)
+            except Rejected as e:
+                return error_response(e)
+        return wrapper
+    return decorator
+
+def idempotent_result(endpoint, key, run):
+    """
+    `run()`'s result for this request, coalesced with identical requests in
+    flight (by `key`) and replayed for a repeated Idempotency-Key.
+
+    Returns (result, how) where how is None, "coalesced" or "replayed".
+    Raises IdempotencyConflict when the Idempotency-Key belongs to another request.
+    """
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        idempotency_key = f"{endpoint}:{idempotency_key}"
+        cached = idempotency.get(idempotency_key, key)
+        if cached is not None:
+            return cached, "replayed"
+    result, shared = single_flight.do(key, run)
+    if idempotency_key:
+        idempotency.put(idempotency_key, key, result)
+    return result, "coalesced" if shared else None
+
+def record_longitudinal(user_id, values):
+    """Add an analysis to the patient's history; a failing store never fails the analysis."""
+    if not user_id:
+        return
+    try:
+        longitudinal_store.record(str(user_id), values)
+    except Exception as e:
+        print(f"Longitudinal store write failed for user {user_id}: {e}")
+
+def extract_in_parallel(documents, recognition):
+    """
+    Tokens of a large upload, its page runs extracted on the analysis workers
+    at once; None below the pipeline's thresholds (the analysis task then
+    extracts them itself).
+    """
+    runs = writing_pipeline.split_pages(documents, worker_pool.workers)
+    if runs is None:
+        return None
+    started = time.perf_counter()
+    outcomes = worker_pool.gather({number: functools.partial(worker_pool.run, analysis_tasks.extract_page_run, run)
+                                   for number, run in enumerate(runs)})
+    results = []
+    for number in range(len(runs)):
+        result, error = outcomes[number]
+        if error is not None:
+            raise error
+        results.append(result)
+    token_data = writing_pipeline.merge_pages(runs, results)
+    elapsed = time.perf_counter() - started
+    recognition["timings"]["extract"] = elapsed
+    recognition["seconds"] += elapsed
+    return token_data
+
+# Only the leader of coalesced requests runs these, so an analysis is recorded once
+def analyze_pages(pages, user_id=None):
+    # The slot is taken before OCR: a request over its rate or beyond the queue
+    # costs no Document AI call, and OCR in flight is bounded with the analyses.
+    # Decode/preprocess/OCR wait run in this process (I/O threads); only
+    # extraction and trends use analysis workers.
+    with admission_slot('writing'):
+        documents, recognition = worker_pool.run_blocking(writing_pipeline.recognize, pages)
+        metrics.record_worker(analysis_tasks.worker_stats())
+        token_data = extract_in_parallel(documents, recognition)
+        result, artifacts = worker_pool.run(analysis_tasks.analyze_writing, documents, recognition, token_data)
+    metrics.record_worker(result.pop("worker", None))
+    metrics.observe_stages('writing', result.get("timings_ms"), scale=0.001)
+    writing_pipeline.register(result, artifacts)
+    record_longitudinal(user_id, handwriting_metrics(result))
+    return result, artifacts
+
+def analyze_recording(raw_content, noise_key, user_id=None):
+    result = run_admitted('speech', analysis_tasks.analyze_speech, raw_content, noise_key)
+    metrics.record_worker(result.get("worker"))
+    metrics.observe_stages('speech', result.get("timings"))
+    record_longitudinal(user_id, speech_metrics(result))
+    return result
+
+def writing_result(data, endpoint='writing'):
+    """
+    Analyze the handwriting payload of a request (shared with identical
+    requests in flight) and shape it to the requested detail.
+
+    Returns (result, how) as idempotent_result; raises ValueError for a malformed payload.
+    """
+    pages = writing_pipeline.pages_from_request(data)
+    detail = writing_pipeline.detail_from_request(data, request.args)
+    user_id = data.get('user_id')
+    key = request_key('writing', user_id,
+                      *(part for page in pages for part in (page["content"], page["mimeType"])))
+    (result, artifacts), how = idempotent_result(endpoint, key, lambda: analyze_pages(pages, user_id))
+    # The analysis may be shared with other requests, so shape a copy
+    return writing_pipeline.shape(result, artifacts, detail), how
+
+def speech_result(data, endpoint='speech'):
+    """Score the recording of a request (shared with identical requests in flight); returns (result, how)."""
+    if 'content' not in data:
+        raise ValueError("Missing required field: content")
+    raw_content = base64.b64decode(data['content'])
+    # Recordings from the same user/device share a learned noise profile
+    noise_key = None
+    user_id = data.get('user_id')
+    if user_id:
+        noise_key = f"{user_id}:{data.get('device_id', 'default')}"
+    key = request_key('speech', raw_content, noise_key, user_id)
+    result, how = idempotent_result(endpoint, key, lambda: analyze_recording(raw_content, noise_key, user_id))
+    return {"score": result["score"]}, how
+
+def failure(e):
+    """(HTTP status, JSON body) for an analysis that raised `e`."""
+    if isinstance(e, Rejected):
+        metrics.observe_rejection(request.url_rule.rule, e.reason)
+        return e.status, {"error": f"{e}", "reason": e.reason, "retry_after": e.retry_after, "status": "rejected"}
+    if isinstance(e, IdempotencyConflict):
+        return 422, {"error": f"{e}", "status": "failed"}
+    if isinstance(e, ValueError):
+        return 400, {"error": f"{e}", "status": "failed"}
+    if isinstance(e, GoogleAPICallError):
+        return 502, {"error": f"OCR failed: {e}", "status": "failed"}
+    return 500, {"error": f"{e}", "status": "failed"}
+
+def error_response(e):
+    """failure(e) as the JSON response of an endpoint, with Retry-After when it was rejected."""
+    status, body = failure(e)
+    response = jsonify(body)
+    response.status_code = status
+    if isinstance(e, Rejected):
+        response.headers['Retry-After'] = e.retry_after_header
+    return response
+
+def mark_shared(response, how):
+    """Tell the client its result came from another identical request or the idempotency cache."""
+    if how == "coalesced":
+        response.headers['X-Coalesced'] = 'true'
+    elif how == "replayed":
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of the server's counters and histograms"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
 
 @app.route('/writing-analysis', methods=['POST'])
+@admitted('writing')
 def analyze_writing():
     """
     Endpoint to analyze handwriting samples
     
-    Expected JSON request format:
+    Expected JSON request format (one page):
+    {
+        "content": "base64_encoded_image",
+        "mimeType": "image/jpeg"
+    }
+    or several pages:
     {
-        "sample_id": "unique_identifier",
-        "image_data": "base64_encoded_image_or_file_path",
-        "parameters": {
-            "detail_level": "high|medium|low",
-            "additional_options": {}
-        }
+        "pages": [{"content": "...", "mimeType": "image/jpeg"}, ...]
     }
+
+    Optional "detail" (or ?detail=): "summary" (default), "lines" to include
+    every line's trends, "tokens" to also include the token and spacing columns.
+    With "user_id", the trends are added to the patient's longitudinal history.
     """
     if not request.is_json:
         return jsonify({"error": "Request must be JSON"}), 400
     
     data = request.get_json()
     
-    # Validate required fields
-    required_fields = ["content", "mimeType"]
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Missing required field: {field}"}), 400
+    # Malformed pages or detail raise ValueError (400) before any OCR
+    try:
+        result, how = writing_result(data)
+        result["timestamp_utc"] = str(datetime.now())
+        result["status"] = "success"
+        return mark_shared(jsonify(result), how)
     
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/writing-analysis/<doc_hash>/visualization', methods=['GET'])
+def writing_visualization(doc_hash):
+    """Trend plot (PNG) of a previous analysis, rendered on first request and cached"""
     try:
+        image = handwriting_service.renderer.render(
+            doc_hash, render_png=lambda *document: worker_pool.run(analysis_tasks.render_trends, *document)
+        )
+    except Exception as e:
+        return error_response(e)
+    if image is None:
+        return jsonify({"error": f"Unknown document: {doc_hash}"}), 404
+    return send_file(BytesIO(image), mimetype='image/png')
 
-        # Use your proprietary service to analyze the handwriting
-        token_data = handwriting_service.extract_token_data()
-        spacing_data = handwriting_service.calculate_spacing(token_data)
-        trends = handwriting_service.analyze_trends(token_data, spacing_data)
-        
-        
-        return jsonify({
-            "trends": json.dumps(trends).encode('utf-8'),
-            "timestamp_utc": str(datetime.now()), 
-            "status": "success"
-        })
+@app.route('/writing-session', methods=['POST'])
+def create_writing_session():
+    """Start an incremental handwriting session that pages can be appended to."""
+    return jsonify({
+        "session_id": writing_sessions.create(),
+        "status": "success"
+    }), 201
+
+@app.route('/writing-session/<session_id>/pages', methods=['POST'])
+@admitted('writing')
+def append_writing_pages(session_id):
+    """
+    Append new page(s) to a handwriting session and return the updated trends
+
+    Token extraction runs on an analysis worker under the writing admission
+    limit; only the incremental trend update happens in the session.
+
+    Expected JSON request format:
+    {
+        "document": { ...Document AI response for the new page(s)... }
+    }
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    
+    data = request.get_json()
+    if "document" not in data:
+        return jsonify({"error": "Missing required field: document"}), 400
+    
+    session = writing_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": f"Unknown session: {session_id}"}), 404
+    
+    try:
+        tokens, page_count = run_admitted('writing', analysis_tasks.extract_session_pages, data["document"])
+        result = session.append_extracted(tokens, page_count)
+        result["timestamp_utc"] = str(datetime.now())
+        result["status"] = "success"
+        return jsonify(result)
     
     except Exception as e:
-        return jsonify({
-            "error": f"{e}",
-            "status": "failed"
-        }), 500
+        return error_response(e)
 
 @app.route('/speech-analysis', methods=['POST'])
+@admitted('speech')
 def speech_analysis():
 
     if not request.is_json:
@@ -68,27 +431,116 @@ def speech_analysis():
     
     data = request.get_json()
     
-    required_fields = ["content"]
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Missing required field: {field}"}), 400
-        
+    # A missing or undecodable content raises ValueError (400)
     try: 
-        base64_content = data.get('content')
-        raw_content = base64.b64decode(base64_content)
-        analyzed_audio = speech_service.analyze_audio(raw_content)
-        updrs_score = speech_service.calculate_updrs_score(analyzed_audio)
-        return jsonify({
-            "score": updrs_score,
+        result, how = speech_result(data)
+        return mark_shared(jsonify({
+            "score": result["score"],
             "timestamp_utc": str(datetime.now()),
             "status": "success"
-        })
+        }), how)
     
     except Exception as e:
-        return jsonify({
-            "error": f"{e}",
-            "status": "failed"
-        }), 500
+        return error_response(e)
+
+@app.route('/assessment', methods=['POST'])
+@admitted('speech', 'writing')
+def assessment():
+    """
+    Endpoint to analyze a recording and a handwriting sample together
+
+    Expected JSON request format:
+    {
+        "user_id": "...",                      (optional, applies to both)
+        "speech": {"content": "base64_encoded_wav"},
+        "writing": {"content": "base64_encoded_image", "mimeType": "image/jpeg"}
+                   (or {"pages": [...]}, as /writing-analysis)
+    }
+
+    Both modalities are analyzed at the same time, so OCR of the handwriting
+    (in this process) overlaps the speech DSP (in a worker) and the response
+    takes as long as the slower of the two. When either endpoint's queue is
+    full the request is refused before the body is read. If one fails, the other's result is still returned with
+    "status": "partial" and the failure under its modality.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    
+    data = request.get_json()
+    analyses = {'speech': speech_result, 'writing': writing_result}
+    payloads = {name: data[name] for name in analyses if data.get(name) is not None}
+    if not payloads:
+        return jsonify({"error": "Missing required field: speech or writing"}), 400
+    for name, payload in payloads.items():
+        if not isinstance(payload, dict):
+            return jsonify({"error": f"'{name}' must be an object"}), 400
+        if data.get('user_id') and 'user_id' not in payload:
+            payloads[name] = dict(payload, user_id=data['user_id'])
+
+    def timed(name):
+        @copy_current_request_context
+        def run():
+            started = time.perf_counter()
+            try:
+                return analyses[name](payloads[name], f'assessment.{name}')
+            finally:
+                elapsed[name] = round((time.perf_counter() - started) * 1000, 3)
+        return run
+
+    started = time.perf_counter()
+    elapsed = {}
+    outcomes = worker_pool.gather({name: timed(name) for name in payloads})
+
+    response = {}
+    failed = {}
+    for name, (outcome, error) in outcomes.items():
+        if error is None:
+            result, how = outcome
+            result["status"] = "success"
+            if how:
+                result["shared"] = how
+        else:
+            failed[name], result = failure(error)
+        response[name] = result
+    response["timings_ms"] = dict(elapsed, total=round((time.perf_counter() - started) * 1000, 3))
+    response["timestamp_utc"] = str(datetime.now())
+
+    if len(failed) < len(outcomes):
+        response["status"] = "partial" if failed else "success"
+        return jsonify(response)
+    # Nothing succeeded: answer with the failures' common status, if they share one
+    response["status"] = "failed"
+    statuses = set(failed.values())
+    response = jsonify(response)
+    response.status_code = statuses.pop() if len(statuses) == 1 else 500
+    rejections = [error for _, error in outcomes.values() if isinstance(error, Rejected)]
+    if rejections:
+        response.headers['Retry-After'] = max(rejections, key=lambda e: e.retry_after).retry_after_header
+    return response
+
+@app.route('/patients/<user_id>/trajectory', methods=['GET'])
+def patient_trajectory(user_id):
+    """
+    A patient's speech and handwriting metrics over time: per metric the last
+    value, its change from the previous and first session and from the
+    rolling mean, the slope per day and change points.
+
+    Optional ?metrics=speech.score,handwriting.spacing_slope (default: all)
+    and ?points=N for the last N observations of each metric.
+    """
+    metric_names = [name for name in request.args.get('metrics', '').split(',') if name] or None
+    try:
+        points = min(max(0, int(request.args.get('points', 0))), 1000)
+    except ValueError:
+        return jsonify({"error": "points must be an integer"}), 400
+    try:
+        result = longitudinal_store.trajectory(user_id, metric_names, points)
+    except Exception as e:
+        return error_response(e)
+    if not result["metrics"]:
+        return jsonify({"error": f"No history for user: {user_id}"}), 404
+    result["status"] = "success"
+    return jsonify(result)
 
 # Add a basic health check endpoint
 @app.route('/health', methods=['GET'])
@@ -97,10 +549,48 @@ def health_check():
         "status": "ok",
         "services": {
             "handwriting_analysis": handwriting_service.status(),
-            # "speech_analysis": speech_service.status()
-        }
+            "speech_analysis": speech_service.status()
+        },
+        "thread_budget": thread_budget.status(),
+        "ocr": ocr_client.status(),
+        "workers": worker_pool.status(),
+        "admission": {name: controller.status() for name, controller in admission.items()},
+        "single_flight": single_flight.status(),
+        "idempotency": idempotency.status(),
+        "longitudinal": longitudinal_store.status(),
+        "boot": boot_report
     })
 
+def boot():
+    """Preload and warm up (optionally), fork the analysis workers and log startup time and memory."""
+    global boot_report
+    preloaded = startup.preload() if server_args.preload else None
+    # Warmed up before the fork, the workers inherit the compiled kernels
+    warm_up = speech_service.warm_up() if server_args.warm_up else None
+    # Fork the analysis workers before any connection (or gRPC channel) exists
+    worker_pool.start()
+    boot_report = startup.boot_report(BOOT_STARTED, worker_pool.worker_pids(), preloaded, warm_up)
+    print(startup.format_boot_line(boot_report))
+
 if __name__ == '__main__':
-    # For development only - use a proper WSGI server in production
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    if server_args.mode == 'production':
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+
+        worker_pool.cooperative = True
+        for controller in admission.values():
+            controller.cooperative = True
+        single_flight.cooperative = True
+        boot()
+        print(f"Serving on {server_args.host}:{server_args.port} with {server_args.workers} analysis "
+              f"worker(s) and up to {server_args.max_connections} connections")
+        server = WSGIServer((server_args.host, server_args.port), app,
+                            spawn=Pool(server_args.max_connections))
+        try:
+            server.serve_forever()
+        finally:
+            worker_pool.shutdown()
+    else:
+        # For development only - use --mode production to serve real traffic
+        boot()
+        app.run(host=server_args.host, port=server_args.port, debug=False)
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Scaling benchmark for the handwriting analysis pipeline.
+
+Builds synthetic Document AI responses from the recorded samples in
+test-data/ (10 to 100k tokens over 1 to 100 pages), optionally with a
+controlled shrinking trend, and times every stage of
+HandwritingAnalysisService plus the end-to-end analyze_handwriting_compression.
+Results are written as JSON for regression tracking.
+
+    python backend/handwriting-benchmark.py --output benchmark.json
+    python backend/handwriting-benchmark.py --tokens 1000 10000 --pages 1 10 --shrink 0.3
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from services.handwriting_service import HandwritingAnalysisService  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test-data')
+TEMPLATES = ('horse-text.json', 'lamb-text.json')
+
+
+def load_templates(test_data=TEST_DATA):
+    """Word shapes (text, width, height, break type) and page size from the recorded samples."""
+    service = HandwritingAnalysisService()
+    words = []
+    dimension = None
+    for name in TEMPLATES:
+        document = service.load_document_ai_response(os.path.join(test_data, name))
+        tokens = service.extract_token_data(document)
+        for text, width, height, break_type in zip(tokens.text, tokens['width'], tokens['height'], tokens.break_type):
+            words.append((text.strip() or 'x', float(width), float(height), break_type or 'SPACE'))
+        dimension = dimension or document['pages'][0].get('dimension')
+    return words, dimension
+
+
+def synthesize(words, dimension, n_tokens, n_pages, shrink=0.0, seed=0):
+    """
+    Synthetic Document AI response laid out like handwriting on `n_pages` pages.
+
+    Word sizes are drawn from the templates with ±10% jitter, and token i is
+    scaled by 1 - shrink * i / (n_tokens - 1): `shrink=0.3` makes the last
+    words (and the gaps between them) 30% smaller than the first.
+    """
+    rng = random.Random(seed)
+    page_width = dimension['width']
+    margin = page_width * 0.05
+    per_page = [n_tokens // n_pages + (1 if p < n_tokens % n_pages else 0) for p in range(n_pages)]
+
+    text_parts = []
+    offset = 0
+    pages = []
+    token_number = 0
+    for page_index, count in enumerate(per_page):
+        tokens = []
+        x, y = margin, margin
+        line_height = 0.0
+        for _ in range(count):
+            word, width, height, break_type = rng.choice(words)
+            scale = 1.0 - shrink * token_number / max(n_tokens - 1, 1)
+            width *= scale * rng.uniform(0.9, 1.1)
+            height *= scale * rng.uniform(0.9, 1.1)
+            gap = width * 0.15 + 10 * scale
+
+            if x + width > page_width - margin:
+                x = margin
+                y += line_height * 1.3
+                line_height = 0.0
+            line_height = max(line_height, height)
+
+            piece = word + ' '
+            text_parts.append(piece)
+            segment = {'startIndex': str(offset), 'endIndex': str(offset + len(piece))}
+            offset += len(piece)
+            top = y + rng.uniform(-0.05, 0.05) * height
+            vertices = [
+                {'x': round(x), 'y': round(top)},
+                {'x': round(x + width), 'y': round(top)},
+                {'x': round(x + width), 'y': round(top + height)},
+                {'x': round(x), 'y': round(top + height)},
+            ]
+            tokens.append({
+                'layout': {
+                    'textAnchor': {'textSegments': [segment]},
+                    'boundingPoly': {'vertices': vertices},
+                    'confidence': rng.uniform(0.8, 1.0),
+                },
+                'detectedBreak': {'type': break_type},
+            })
+            x += width + gap
+            token_number += 1
+        pages.append({'pageNumber': page_index + 1, 'dimension': dict(dimension), 'tokens': tokens})
+
+    return {'text': ''.join(text_parts), 'pages': pages}
+
+
+def timed(function, repeat):
+    """(result of the last call, list of wall-clock seconds per call)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return result, times
+
+
+def summarize_times(times):
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'runs': len(times)}
+
+
+def run_case(service, words, dimension, n_tokens, n_pages, shrink, repeat, visualize_limit, seed):
+    document = synthesize(words, dimension, n_tokens, n_pages, shrink, seed)
+    payload = json.dumps(document)
+    stages = {}
+
+    parsed, times = timed(lambda: service.load_document_ai_response(payload), repeat)
+    stages['load_document_ai_response'] = summarize_times(times)
+    tokens, times = timed(lambda: service.extract_token_data(parsed), repeat)
+    stages['extract_token_data'] = summarize_times(times)
+    spacing, times = timed(lambda: service.calculate_spacing(tokens), repeat)
+    stages['calculate_spacing'] = summarize_times(times)
+    trends, times = timed(lambda: service.analyze_trends(tokens, spacing), repeat)
+    stages['analyze_trends'] = summarize_times(times)
+
+    if len(tokens) > 1 and len(tokens) <= visualize_limit:
+        fd, path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        try:
+            _, times = timed(lambda: service.visualize_trends(tokens, spacing, path), repeat)
+            stages['visualize_trends'] = summarize_times(times)
+        finally:
+            os.remove(path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result, times = timed(lambda: service.analyze_handwriting_compression(payload), repeat)
+    stages['analyze_handwriting_compression'] = summarize_times(times)
+
+    detected = result.get('trends', {})
+    width_slope = detected.get('token_width_slope')
+    height_slope = detected.get('token_height_slope')
+    if shrink > 0:
+        trend_ok = width_slope is not None and width_slope < 0 and height_slope is not None and height_slope < 0
+    else:
+        trend_ok = None  # no ground truth for an unbiased document
+
+    return {
+        'tokens_requested': n_tokens,
+        'tokens': len(tokens),
+        'pages': n_pages,
+        'spacing_pairs': len(spacing),
+        'shrink': shrink,
+        'json_bytes': len(payload),
+        'stages': stages,
+        'detected': {
+            'token_width_trend': detected.get('token_width_trend'),
+            'token_height_trend': detected.get('token_height_trend'),
+            'spacing_trend': detected.get('spacing_trend'),
+            'token_width_slope': width_slope,
+            'token_height_slope': height_slope,
+            'spacing_slope': detected.get('spacing_slope'),
+        },
+        'trend_ok': trend_ok,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the handwriting analysis pipeline")
+    parser.add_argument('--tokens', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--shrink', type=float, nargs='+', default=[0.0, 0.3],
+                        help="Injected fractional shrinking from first to last token")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--visualize-limit', type=int, default=20000,
+                        help="Skip visualize_trends above this many tokens")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='handwriting-benchmark.json')
+    parser.add_argument('--strict', action='store_true',
+                        help="Exit with status 1 if an injected trend is not detected")
+    args = parser.parse_args()
+
+    service = HandwritingAnalysisService()
+    words, dimension = load_templates()
+    results = []
+    for n_tokens in args.tokens:
+        for n_pages in args.pages:
+            if n_pages > n_tokens:
+                continue
+            for shrink in args.shrink:
+                case = run_case(service, words, dimension, n_tokens, n_pages, shrink,
+                                args.repeat, args.visualize_limit, args.seed)
+                results.append(case)
+                end_to_end = case['stages']['analyze_handwriting_compression']['median_s']
+                status = {True: 'ok', False: 'WRONG TREND', None: '-'}[case['trend_ok']]
+                print(f"{n_tokens:>7} tokens {n_pages:>4} pages shrink={shrink:<4} "
+                      f"end-to-end {end_to_end * 1000:9.1f} ms  trend {status}")
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    missed = [case for case in results if case['trend_ok'] is False]
+    if missed:
+        # Token positions restart on every page, so short pages can hide a document-wide trend
+        print(f"Injected trend not detected in {len(missed)} case(s)")
+        if args.strict:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+"""
+Load test for the analysis API.
+
+Replays synthesized recordings (sustained vowels of configurable lengths)
+and handwriting page images against /speech-analysis, /writing-analysis,
+/assessment and /health with open-loop Poisson arrivals: requests are sent
+at their scheduled times whether or not earlier ones have finished, and
+latency is measured from the scheduled time, so a saturated server shows up
+as growing latency instead of a slower request rate.
+
+OCR is served by the local Document AI stub (services/fake_document_ai.py),
+which answers with the recorded responses in test-data/. By default the
+server is started as a subprocess pointed at the stub and its memory
+(master + analysis workers) is sampled while the test runs; --in-process
+drives the Flask app directly instead, and --target an already running
+server (which must then be configured with PARKER_DOCUMENT_AI_ENDPOINT).
+
+Reports throughput, p50/p95/p99 latency and error rates per endpoint plus
+a timeline of request rate, p95 and server RSS, and writes them as JSON.
+An /assessment answer only counts as ok when both of its analyses
+succeeded; "partial" ones are counted separately and "failed" ones are
+errors, whatever the HTTP status.
+
+    python backend/load-test.py --rate speech=1 writing=2 health=5 --duration 60
+    python backend/load-test.py --server-args "--mode production --workers 2" --audio-seconds 3 10
+    python backend/load-test.py --target http://localhost:5000 --server-pid 1234 --rate health=50
+"""
+import argparse
+import http.client
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from services.fake_document_ai import FakeDocumentAIServer  # noqa: E402
+from services.speech_service import SpeechAnalysisService  # noqa: E402
+from services.startup import memory_usage  # noqa: E402
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend-server.py')
+# name -> (method, path)
+ENDPOINTS = {
+    'speech': ('POST', '/speech-analysis'),
+    'writing': ('POST', '/writing-analysis'),
+    'assessment': ('POST', '/assessment'),
+    'health': ('GET', '/health'),
+}
+# Endpoints that can answer 200 with only part of the work done; their body's "status" is checked
+PARTIAL_ENDPOINTS = {'assessment'}
+
+
+def page_image(seed, size=(1200, 1600)):
+    """JPEG bytes of a page of pen-like strokes; every seed gives a different image (and OCR cache key)."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    for line in range(height // 80 - 1):
+        y = 60 + line * 80
+        x = 60
+        while x < width - 120:
+            word = rng.randint(30, 110)
+            points = [(x + i * word / 8, y + rng.uniform(-12, 12)) for i in range(9)]
+            draw.line(points, fill=rng.randint(0, 60), width=3)
+            x += word + rng.randint(15, 35)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+class Payloads:
+    """Request bodies, built once before the test so generating them doesn't skew the timings."""
+
+    def __init__(self, audio_seconds, speech_samples, writing_samples, image_size, users, seed):
+        import base64
+
+        self.rng = random.Random(seed)
+        self.users = [f"load-test-{number}" for number in range(users)]
+        self.recordings = []
+        for seconds in audio_seconds:
+            for sample in range(speech_samples):
+                wav = SpeechAnalysisService.synthetic_vowel(seconds, f0=100.0 + 5 * sample, seed=seed + sample)
+                self.recordings.append(base64.b64encode(wav).decode('ascii'))
+        self.pages = [base64.b64encode(page_image(seed + sample, image_size)).decode('ascii')
+                      for sample in range(writing_samples)]
+
+    def speech(self):
+        return {"content": self.rng.choice(self.recordings)}
+
+    def writing(self):
+        return {"content": self.rng.choice(self.pages), "mimeType": "image/jpeg"}
+
+    def body(self, name):
+        """JSON body for one request to the endpoint `name` (None for GETs)."""
+        if name == 'health':
+            return None
+        user = self.rng.choice(self.users)
+        if name == 'speech':
+            return json.dumps(dict(self.speech(), user_id=user)).encode()
+        if name == 'writing':
+            return json.dumps(dict(self.writing(), user_id=user)).encode()
+        return json.dumps({"user_id": user, "speech": self.speech(), "writing": self.writing()}).encode()
+
+
+class HttpTarget:
+    """Sends requests to a server over HTTP, one keep-alive connection per client thread."""
+
+    def __init__(self, url, timeout):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'} if body else {})
+            response = connection.getresponse()
+            return response.status, response.read()
+        except Exception:
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+class InProcessTarget:
+    """Calls the Flask app in this process through its test client (no sockets; analysis runs inline)."""
+
+    def __init__(self, ocr_endpoint):
+        os.environ['PARKER_DOCUMENT_AI_ENDPOINT'] = ocr_endpoint
+        os.environ.setdefault('PARKER_LONGITUDINAL_DB', os.path.join(tempfile.mkdtemp(), 'load-test.sqlite3'))
+        spec = importlib.util.spec_from_file_location('backend_server', SERVER)
+        self.server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.server)
+
+    def request(self, method, path, body):
+        response = self.server.app.test_client().open(path, method=method, data=body,
+                                                      content_type='application/json')
+        return response.status_code, response.get_data()
+
+    def close(self):
+        # Close the gRPC channel before the OCR stub goes away, or interpreter exit can hang on it
+        self.server.ocr_client.close()
+        self.server.longitudinal_store.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(server_args, ocr_endpoint, log_path, boot_timeout):
+    """Start backend-server.py on a free port against the OCR stub; returns (process, url)."""
+    port = free_port()
+    env = dict(os.environ, PARKER_DOCUMENT_AI_ENDPOINT=ocr_endpoint)
+    # Keep the test's patients out of the real longitudinal history
+    env.setdefault('PARKER_LONGITUDINAL_DB', os.path.join(tempfile.mkdtemp(), 'load-test.sqlite3'))
+    log = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, SERVER, '--host', '127.0.0.1', '--port', str(port),
+                                *shlex.split(server_args)], stdout=log, stderr=subprocess.STDOUT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    target = HttpTarget(url, timeout=5)
+    deadline = time.monotonic() + boot_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}, see {log_path}")
+        try:
+            if target.request('GET', '/health', None)[0] == 200:
+                return process, url
+        except OSError:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"Server did not answer /health within {boot_timeout}s, see {log_path}")
+
+
+def process_tree(pid):
+    """`pid` and all its descendants (Linux)."""
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f"/proc/{parent}/task"):
+                with open(f"/proc/{parent}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class MemorySampler(threading.Thread):
+    """Samples RSS and PSS (MB) summed over a process and its children every `interval` seconds."""
+
+    def __init__(self, pid, interval, started):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.started = started
+        self.samples = []
+        self._finished = threading.Event()
+
+    def sample(self):
+        usages = [memory_usage(pid) for pid in process_tree(self.pid)]
+        rss = [usage["rss_mb"] for usage in usages if usage["rss_mb"] is not None]
+        pss = [usage["pss_mb"] for usage in usages if usage["pss_mb"] is not None]
+        self.samples.append({
+            "t": round(time.perf_counter() - self.started, 3),
+            "processes": len(usages),
+            "rss_mb": round(sum(rss), 1) if rss else None,
+            "pss_mb": round(sum(pss), 1) if pss else None,
+        })
+
+    def run(self):
+        while not self._finished.is_set():
+            self.sample()
+            self._finished.wait(self.interval)
+
+    def stop(self):
+        self._finished.set()
+        self.join()
+        self.sample()
+
+
+def schedule(rates, duration, seed):
+    """Poisson arrival times: [(seconds from start, endpoint name)] for every endpoint with a rate."""
+    rng = random.Random(seed)
+    arrivals = []
+    for name, rate in rates.items():
+        t = rng.expovariate(rate)
+        while t < duration:
+            arrivals.append((t, name))
+            t += rng.expovariate(rate)
+    return sorted(arrivals)
+
+
+def run_load(target, payloads, arrivals, max_in_flight, drain_timeout):
+    """Send every scheduled request at its time; returns the per-request records and the start time."""
+    records = []
+    lock = threading.Lock()
+
+    def send(scheduled, name, body):
+        method, path = ENDPOINTS[name]
+        status, size, error, result = None, 0, None, None
+        try:
+            status, content = target.request(method, path, body)
+            size = len(content)
+            if name in PARTIAL_ENDPOINTS and status < 400:
+                result = response_status(content)
+        except Exception as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        with lock:
+            records.append({"endpoint": name, "t": scheduled, "latency": finished - (started + scheduled),
+                            "status": status, "result": result, "bytes": size, "error": error})
+
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    futures = []
+    started = time.perf_counter()
+    for scheduled, name in arrivals:
+        body = payloads.body(name)
+        delay = started + scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        futures.append(executor.submit(send, scheduled, name, body))
+
+    deadline = time.monotonic() + drain_timeout
+    for future in futures:
+        try:
+            future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception:
+            pass
+    executor.shutdown(wait=False, cancel_futures=True)
+    with lock:
+        unfinished = len(arrivals) - len(records)
+    return list(records), unfinished, started
+
+
+def response_status(content):
+    """The "status" of a JSON response body ("success", "partial", "failed"), "unparsable" if there is none."""
+    try:
+        return json.loads(content).get("status") or "unparsable"
+    except (ValueError, AttributeError):
+        return "unparsable"
+
+
+def outcome(record):
+    """"ok", "partial" or "failed": an HTTP success only counts as ok when the whole analysis succeeded."""
+    if record["status"] is None or record["status"] >= 400:
+        return "failed"
+    if record["result"] in (None, "success"):
+        return "ok"
+    return "partial" if record["result"] == "partial" else "failed"
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1),
+            "max_ms": round(max(latencies) * 1000, 1)}
+
+
+def summarize(records, sent, elapsed):
+    """Per-endpoint throughput, latency percentiles and error rates."""
+    summary = {}
+    for name in sorted(sent):
+        mine = [record for record in records if record["endpoint"] == name]
+        outcomes = [outcome(record) for record in mine]
+        ok = [record for record, kind in zip(mine, outcomes) if kind == "ok"]
+        partial = outcomes.count("partial")
+        statuses = {}
+        for record in mine:
+            key = str(record["status"]) if record["status"] is not None else record["error"]
+            if record["result"] not in (None, "success"):
+                # A 200 whose body reports partial or failed analysis
+                key = f"{key} {record['result']}"
+            statuses[key] = statuses.get(key, 0) + 1
+        rejected = sum(1 for record in mine if record["status"] in (429, 503))
+        summary[name] = {
+            "sent": sent[name],
+            "completed": len(mine),
+            "ok": len(ok),
+            "partial": partial,
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+            "error_rate": round(1 - (len(ok) + partial) / sent[name], 4) if sent[name] else None,
+            "partial_rate": round(partial / sent[name], 4) if sent[name] else None,
+            "rejected_rate": round(rejected / sent[name], 4) if sent[name] else None,
+            "statuses": statuses,
+            **percentiles([record["latency"] for record in ok]),
+        }
+    return summary
+
+
+def timeline(records, memory, interval, duration):
+    """Requests started, success rate and p95 per `interval` seconds, with the server memory at the time."""
+    windows = []
+    for number in range(int(np.ceil(duration / interval))):
+        start, end = number * interval, (number + 1) * interval
+        mine = [record for record in records if start <= record["t"] < end]
+        outcomes = [outcome(record) for record in mine]
+        ok = [record["latency"] for record, kind in zip(mine, outcomes) if kind == "ok"]
+        samples = [sample for sample in memory if sample["t"] < end + interval / 2]
+        windows.append({
+            "t": start,
+            "sent_rps": round(len(mine) / interval, 2),
+            "ok": len(ok),
+            "partial": outcomes.count("partial"),
+            "errors": outcomes.count("failed"),
+            "p95_ms": percentiles(ok)["p95_ms"],
+            "rss_mb": samples[-1]["rss_mb"] if samples else None,
+        })
+    return windows
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def parse_rates(values):
+    rates = {}
+    for value in values:
+        name, _, rate = value.partition('=')
+        if name not in ENDPOINTS or not rate:
+            raise argparse.ArgumentTypeError(f"--rate expects NAME=REQUESTS_PER_SECOND with NAME in "
+                                             f"{', '.join(ENDPOINTS)}, got {value!r}")
+        if float(rate) > 0:
+            rates[name] = float(rate)
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test of the analysis API")
+    parser.add_argument('--rate', nargs='+', default=['speech=0.5', 'writing=1', 'health=2'],
+                        help="Mean arrivals per second per endpoint, e.g. speech=1 writing=2 assessment=0.5 health=5")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument('--audio-seconds', type=float, nargs='+', default=[3.0],
+                        help="Lengths of the synthesized recordings")
+    parser.add_argument('--speech-samples', type=int, default=4,
+                        help="Distinct recordings per length (repeats exercise coalescing and caches)")
+    parser.add_argument('--writing-samples', type=int, default=8, help="Distinct page images")
+    parser.add_argument('--image-size', default='1200x1600', help="Page image WIDTHxHEIGHT")
+    parser.add_argument('--users', type=int, default=20, help="Distinct user_ids the requests come from")
+    parser.add_argument('--ocr-latency', type=float, default=0.5, help="Seconds the OCR stub takes per call")
+    parser.add_argument('--server-args', default='--mode production',
+                        help="Arguments for the spawned backend-server.py")
+    parser.add_argument('--server-log', default='load-test-server.log')
+    parser.add_argument('--boot-timeout', type=float, default=180.0)
+    parser.add_argument('--target', help="URL of an already running server instead of spawning one")
+    parser.add_argument('--server-pid', type=int, help="PID of the --target server, to sample its memory")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Call the Flask app in this process instead of over HTTP")
+    parser.add_argument('--max-in-flight', type=int, default=256, help="Client threads (concurrent requests)")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout")
+    parser.add_argument('--drain-timeout', type=float, default=120.0,
+                        help="How long to wait for outstanding requests after the last arrival")
+    parser.add_argument('--sample-interval', type=float, default=1.0, help="Seconds between memory samples")
+    parser.add_argument('--report-interval', type=float, default=5.0, help="Seconds per timeline row")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load-test.json')
+    args = parser.parse_args()
+    rates = parse_rates(args.rate)
+    if not rates:
+        parser.error("no endpoint has a positive --rate")
+
+    width, height = (int(part) for part in args.image_size.split('x'))
+    payloads = Payloads(args.audio_seconds, args.speech_samples, args.writing_samples, (width, height),
+                        args.users, args.seed)
+    arrivals = schedule(rates, args.duration, args.seed)
+    sent = {}
+    for _, name in arrivals:
+        sent[name] = sent.get(name, 0) + 1
+
+    ocr = FakeDocumentAIServer(latency=args.ocr_latency).start()
+    process = in_process = None
+    try:
+        if args.target:
+            target, server_pid = HttpTarget(args.target, args.timeout), args.server_pid
+            print(f"Target {args.target}; it must use PARKER_DOCUMENT_AI_ENDPOINT={ocr.endpoint} "
+                  f"for the OCR stub")
+        elif args.in_process:
+            target = in_process = InProcessTarget(ocr.endpoint)
+            server_pid = os.getpid()
+        else:
+            process, url = start_server(args.server_args, ocr.endpoint, args.server_log, args.boot_timeout)
+            target, server_pid = HttpTarget(url, args.timeout), process.pid
+            print(f"Server {url} (pid {process.pid}, {args.server_args}); log in {args.server_log}")
+
+        print(f"Sending {len(arrivals)} requests over {args.duration:.0f}s: "
+              + ", ".join(f"{name} {rate}/s" for name, rate in rates.items()))
+        memory = MemorySampler(server_pid, args.sample_interval, time.perf_counter()) if server_pid else None
+        if memory:
+            memory.start()
+        records, unfinished, started = run_load(target, payloads, arrivals, args.max_in_flight, args.drain_timeout)
+        elapsed = time.perf_counter() - started
+        if memory:
+            memory.stop()
+    finally:
+        if in_process is not None:
+            in_process.close()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        ocr.stop()
+
+    samples = memory.samples if memory else []
+    summary = summarize(records, sent, elapsed)
+    windows = timeline(records, samples, args.report_interval, args.duration)
+
+    print(f"\n{'endpoint':<11}{'sent':>6}{'ok':>6}{'partial':>8}{'rps':>8}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}")
+    for name, stats in summary.items():
+        print(f"{name:<11}{stats['sent']:>6}{stats['ok']:>6}{stats['partial']:>8}{stats['throughput_rps']:>8.2f}"
+              f"{stats['error_rate']:>8.1%}{stats['p50_ms'] or 0:>9.1f}{stats['p95_ms'] or 0:>9.1f}"
+              f"{stats['p99_ms'] or 0:>9.1f}  {stats['statuses']}")
+    if unfinished:
+        print(f"{unfinished} request(s) still unanswered after the drain timeout")
+    print(f"\n{'t s':>6}{'sent/s':>8}{'ok':>6}{'partial':>8}{'errors':>8}{'p95 ms':>9}{'RSS MB':>9}")
+    for window in windows:
+        print(f"{window['t']:>6.0f}{window['sent_rps']:>8.2f}{window['ok']:>6}{window['partial']:>8}"
+              f"{window['errors']:>8}"
+              f"{window['p95_ms'] or 0:>9.1f}{window['rss_mb'] or 0:>9.1f}")
+    if samples:
+        peak = max((sample for sample in samples if sample["rss_mb"] is not None),
+                   key=lambda sample: sample["rss_mb"], default=None)
+        if peak:
+            print(f"Peak server RSS {peak['rss_mb']} MB (PSS {peak['pss_mb']} MB) over {peak['processes']} process(es)")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'environment': environment(),
+            'config': vars(args),
+            'elapsed_s': round(elapsed, 3),
+            'unfinished': unfinished,
+            'endpoints': summary,
+            'timeline': windows,
+            'memory': samples,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.in_process:
+        # Once the app has used both gRPC and numba in this process, their native
+        # threads can deadlock interpreter shutdown; everything is written and closed
+        sys.stdout.flush()
+        os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
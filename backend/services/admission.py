@@ -0,0 +1,192 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class Rejected(Exception):
+    """A request was not admitted; answer with `status` and a Retry-After of `retry_after` seconds."""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(f"{reason} (retry after {retry_after:.0f}s)")
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucketLimiter:
+    """
+    Per-key (user) token buckets: `rate` requests per second on average with
+    bursts of up to `burst`. The least recently seen keys are forgotten
+    beyond `max_keys`, which only ever makes a limit more lenient.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0, max_keys: int = 10000):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Spend one token for `key`; 0 if allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded wait queue for one analysis endpoint.
+
+    At most `max_concurrent` requests run; up to `max_queue` more wait for a
+    slot, each for at most `queue_timeout` seconds. Anything beyond that is
+    rejected right away with 503 and a Retry-After estimated from the recent
+    service time, instead of every request slowing down together and holding
+    its upload in memory. With `rate` set, each user is additionally limited
+    by a token bucket (429 when empty).
+
+    In `cooperative` mode (gevent front end without monkey patching) waiting
+    uses a gevent semaphore, so a queued request only parks its own greenlet.
+    """
+
+    def __init__(self, name: str, max_concurrent: int = 4, max_queue: int = 8, queue_timeout: float = 30.0,
+                 rate: Optional[float] = None, burst: float = 1.0, cooperative: bool = False):
+        """
+        Args:
+            name: Endpoint name, used in messages and metrics.
+            max_concurrent: Requests analyzed at the same time.
+            max_queue: Requests allowed to wait for a slot (0: reject when all slots are busy).
+            queue_timeout: Longest wait for a slot before a request is rejected.
+            rate: Per-user requests per second (None: no per-user limit).
+            burst: Per-user burst size.
+            cooperative: Wait on gevent primitives (set before the first request).
+        """
+        self.name = name
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = queue_timeout
+        self.limiter = TokenBucketLimiter(rate, burst) if rate else None
+        self.cooperative = cooperative
+        self._slots = None
+        self._lock = threading.Lock()
+        self._pending = 0  # running + waiting
+        self._running = 0
+        self._service_time = None  # moving average, seconds
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    @classmethod
+    def from_environment(cls, name: str, **defaults) -> 'AdmissionController':
+        """Limits from PARKER_<NAME>_MAX_CONCURRENT/_MAX_QUEUE/_QUEUE_TIMEOUT/_RATE/_BURST, else `defaults`."""
+        prefix = f"PARKER_{name.upper()}_"
+        settings = dict(defaults)
+        for key, env, convert in (('max_concurrent', 'MAX_CONCURRENT', int),
+                                  ('max_queue', 'MAX_QUEUE', int),
+                                  ('queue_timeout', 'QUEUE_TIMEOUT', float),
+                                  ('rate', 'RATE', float),
+                                  ('burst', 'BURST', float)):
+            if os.environ.get(prefix + env):
+                settings[key] = convert(os.environ[prefix + env])
+        return cls(name, **settings)
+
+    def _semaphore(self):
+        if self._slots is None:
+            with self._lock:
+                if self._slots is None:
+                    if self.cooperative:
+                        from gevent.lock import Semaphore
+                        self._slots = Semaphore(self.max_concurrent)
+                    else:
+                        self._slots = threading.Semaphore(self.max_concurrent)
+        return self._slots
+
+    def _reject(self, status: int, reason: str, retry_after: float):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise Rejected(status, reason, retry_after)
+
+    def _overload_retry_after(self) -> float:
+        """Roughly how long until the current queue has drained."""
+        service_time = self._service_time or 1.0
+        return service_time * max(1, self._pending) / self.max_concurrent
+
+    def check_capacity(self):
+        """Fail fast, before the request body is read, when the queue is already full."""
+        if self._pending >= self.max_concurrent + self.max_queue:
+            self._reject(503, "queue_full", self._overload_retry_after())
+
+    def check_rate(self, user: Optional[str]):
+        if self.limiter is not None and user:
+            wait = self.limiter.take(user)
+            if wait > 0:
+                self._reject(429, "rate_limited", wait)
+
+    @contextmanager
+    def admit(self, user: Optional[str] = None):
+        """
+        Hold a slot for the duration of the block; yields the seconds spent waiting for it.
+
+        Raises Rejected when the user is over their rate, the queue is full or
+        no slot frees up within queue_timeout.
+        """
+        self.check_rate(user)
+        with self._lock:
+            if self._pending >= self.max_concurrent + self.max_queue:
+                full = True
+            else:
+                full = False
+                self._pending += 1
+        if full:
+            self._reject(503, "queue_full", self._overload_retry_after())
+
+        started = time.perf_counter()
+        if not self._semaphore().acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._pending -= 1
+            self._reject(503, "queue_timeout", self._overload_retry_after())
+        waited = time.perf_counter() - started
+
+        with self._lock:
+            self._running += 1
+            self.admitted += 1
+        service_started = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            elapsed = time.perf_counter() - service_started
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self._service_time = elapsed if self._service_time is None else 0.8 * self._service_time + 0.2 * elapsed
+            self._slots.release()
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "waiting": self._pending - self._running,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "per_user_rate": self.limiter.rate if self.limiter else None,
+                "mean_service_s": self._service_time,
+            }
@@ -0,0 +1,95 @@
+"""
+Module-level analysis tasks that AnalysisWorkerPool can send to worker processes.
+
+The front end calls configure() with its service instances before the pool
+is forked, so every worker inherits the same, already initialized services
+(and loaded libraries) without pickling them. Arguments and return values are
+plain data, TokenTables and trend statistics. Results carry the worker's
+stage timings and cache counters for the front end's /metrics.
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from .handwriting_session import HandwritingSession
+from .token_table import TokenTable
+
+_services: Dict[str, Any] = {}
+
+
+def configure(handwriting_service=None, speech_service=None, writing_pipeline=None, thread_budget=None):
+    _services.update({
+        'handwriting': handwriting_service,
+        'speech': speech_service,
+        'writing_pipeline': writing_pipeline,
+        'thread_budget': thread_budget,
+    })
+
+
+def _service(name: str):
+    service = _services.get(name)
+    if service is None:
+        raise RuntimeError(f"analysis_tasks.configure() was not given a {name} service")
+    return service
+
+
+def worker_stats() -> Dict[str, Any]:
+    """
+    This process' cache counters, for AnalysisMetrics.record_worker. OCR runs
+    in the front end, so its cache counts come from the front end's own call.
+    """
+    caches = {}
+    writing_pipeline = _services.get('writing_pipeline')
+    if writing_pipeline is not None and writing_pipeline.ocr_client.cache is not None:
+        status = writing_pipeline.ocr_client.cache.status()
+        caches['ocr'] = {"hits": status["hits"], "misses": status["misses"]}
+    speech_service = _services.get('speech')
+    if speech_service is not None:
+        status = speech_service.noise_profiles.status()
+        caches['noise_profile'] = {"hits": status["hits"], "misses": status["misses"]}
+    return {"pid": os.getpid(), "caches": caches}
+
+
+def analyze_speech(audio_bytes: bytes, noise_key: Optional[str] = None) -> Dict[str, Any]:
+    """Denoise and analyze a recording; returns the UPDRS score, the scalar features and stage timings."""
+    speech_service = _service('speech')
+    thread_budget = _services.get('thread_budget')
+    if thread_budget is not None:
+        with thread_budget.limit():
+            analyzed_audio = speech_service.analyze_audio(audio_bytes, noise_key=noise_key)
+    else:
+        analyzed_audio = speech_service.analyze_audio(audio_bytes, noise_key=noise_key)
+    return {
+        "score": speech_service.calculate_updrs_score(analyzed_audio),
+        "features": {name: value for name, value in (analyzed_audio or {}).items()
+                     if name not in ('y', 'sr', 'timings')},
+        "timings": analyzed_audio.get('timings') if analyzed_audio else None,
+        "worker": worker_stats(),
+    }
+
+
+def analyze_writing(documents, recognition, token_data=None) -> Tuple[Dict[str, Any], Optional[tuple]]:
+    """
+    Tokens, spacing and trends of already OCR'd pages; see WritingPipeline.extract.
+    The result carries "worker" stats.
+    """
+    result, artifacts = _service('writing_pipeline').extract(documents, recognition, token_data)
+    result["worker"] = worker_stats()
+    return result, artifacts
+
+
+def extract_page_run(run) -> List[Tuple[TokenTable, int, bool]]:
+    """Tokens of one run of pages of a large upload; see WritingPipeline.split_pages."""
+    return _service('writing_pipeline').extract_page_run(run)
+
+
+def extract_session_pages(doc_ai_response) -> Tuple[TokenTable, int]:
+    """
+    Tokens and page count of a Document AI response for a handwriting
+    session; see HandwritingSession.extract. The front end appends them.
+    """
+    return HandwritingSession(_service('handwriting')).extract(doc_ai_response)
+
+
+def render_trends(tokens, spacing, fits) -> bytes:
+    """PNG of the trend plots of one analysis."""
+    return _service('handwriting').renderer.render_png(tokens, spacing, fits)
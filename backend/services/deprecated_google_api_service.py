@@ -1,4 +1,6 @@
 
+from functools import lru_cache
+
 from google.api_core.client_options import ClientOptions
 from google.auth.credentials import Credentials
 from google.cloud import documentai  # type: ignore
@@ -9,16 +11,21 @@ location = "us"  # Format is "us" or "eu"
 file_path = "../test.json"
 processor_display_name = "" # Must be unique per project, e.g.: "My Processor"
 
+@lru_cache(maxsize=None)
+def get_client(location: str) -> documentai.DocumentProcessorServiceClient:
+    """One client (and gRPC channel) per location, shared by every call."""
+    # You must set the `api_endpoint`if you use a location other than "us".
+    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+    return documentai.DocumentProcessorServiceClient(client_options=opts)
+
+
 def quickstart(
     project_id: str,
     location: str,
     file_path: str,
     processor_display_name: str = "My Processor",
 ):
-    # You must set the `api_endpoint`if you use a location other than "us".
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    client = get_client(location)
 
     # The full resource name of the location, e.g.:
     # `projects/{project_id}/locations/{location}`
@@ -54,4 +61,6 @@ def quickstart(
     print(document.text)
     
 
-quickstart(project_id, location, file_path, processor_display_name)
\ No newline at end of file
+
+if __name__ == "__main__":
+    quickstart(project_id, location, file_path, processor_display_name)
\ No newline at end of file
@@ -0,0 +1,217 @@
+import re
+import json
+from typing import Any, Callable, Dict, List, Tuple, TypedDict
+
+
+class TokenSubset(TypedDict, total=False):
+    layout: Dict[str, Any]
+    detectedBreak: Dict[str, Any]
+
+
+class PageSubset(TypedDict, total=False):
+    pageNumber: int
+    dimension: Dict[str, Any]
+    tokens: List[TokenSubset]
+
+
+class DocumentSubset(TypedDict, total=False):
+    text: str
+    pages: List[PageSubset]
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SCALAR = re.compile(r'[^,\]}\s]+')
+
+_decoder = json.JSONDecoder()
+
+Handler = Callable[[int], Tuple[Any, int]]
+
+
+class SelectiveDocumentParser:
+    """
+    Pulls only the fields the handwriting analysis reads out of a Document AI
+    JSON response, without building the full document.
+
+    Kept fields are `text`, `pages[].pageNumber`, `pages[].dimension` and
+    `pages[].tokens[].layout` / `detectedBreak`. Everything else (page images,
+    blocks, paragraphs, lines, entities, ...) is skipped while scanning and
+    never becomes part of the result. A `document` wrapper (a full
+    ProcessResponse) is unwrapped.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+        page_fields = {
+            'pageNumber': self.decode,
+            'dimension': self.decode,
+            'tokens': self.decode_tokens,
+        }
+        self.document_fields: Dict[str, Handler] = {
+            'text': self.decode,
+            'pages': lambda pos: self.parse_array(pos, lambda p: self.parse_object(p, page_fields)),
+        }
+        self.document_fields['document'] = lambda pos: self.parse_object(pos, self.document_fields)
+
+    def parse(self) -> DocumentSubset:
+        pos = self._ws(0)
+        document, pos = self.parse_object(pos, self.document_fields)
+        if self._ws(pos) != len(self.text):
+            raise self._error("Extra data after JSON document", pos)
+
+        # Flatten a {"document": {...}} response to the document itself
+        if 'document' in document:
+            inner = document.pop('document')
+            document.update(inner)
+        return document
+
+    def _ws(self, pos: int) -> int:
+        return _WHITESPACE.match(self.text, pos).end()
+
+    def _error(self, message: str, pos: int) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self.text, pos)
+
+    def _peek(self, pos: int) -> str:
+        """The character at `pos`; running out of input means the document is truncated."""
+        if pos >= len(self.text):
+            raise self._error("Unexpected end of document", pos)
+        return self.text[pos]
+
+    def _expect(self, pos: int, char: str) -> None:
+        if self._peek(pos) != char:
+            raise self._error(f"Expected '{char}'", pos)
+
+    def _string_end(self, pos: int) -> int:
+        """Position just past the string starting at `pos` (uses str.find, so base64 blobs skip at memchr speed)."""
+        text = self.text
+        end = text.find('"', pos + 1)
+        while end != -1:
+            # A quote preceded by an odd number of backslashes is escaped
+            backslash = end - 1
+            while text[backslash] == '\\':
+                backslash -= 1
+            if (end - 1 - backslash) % 2 == 0:
+                return end + 1
+            end = text.find('"', end + 1)
+        raise self._error("Unterminated string", pos)
+
+    def decode(self, pos: int) -> Tuple[Any, int]:
+        """Fully decode the value at `pos` (used for the small fields we keep)."""
+        return _decoder.raw_decode(self.text, pos)
+
+    def decode_tokens(self, pos: int) -> Tuple[List[TokenSubset], int]:
+        """
+        Decode a page's token array and keep only `layout` and `detectedBreak`.
+
+        Tokens are small and almost entirely made of fields we keep, so one C
+        decode of the array followed by pruning beats walking them key by key.
+        """
+        tokens, end = _decoder.raw_decode(self.text, pos)
+        subsets = []
+        for token in tokens:
+            subset = {'layout': token.get('layout', {})}
+            if 'detectedBreak' in token:
+                subset['detectedBreak'] = token['detectedBreak']
+            subsets.append(subset)
+        return subsets, end
+
+    def skip(self, pos: int, walk_depth: int = 2) -> int:
+        """
+        Return the position just past the value at `pos` without keeping it.
+
+        Strings (e.g. base64 page images) are skipped with a regex. Objects are
+        walked key by key down to `walk_depth` levels so large strings inside
+        them are skipped the same way. Arrays (`blocks`, `lines`, `entities`, ...)
+        are handed to the C decoder and dropped straight away, which is far
+        cheaper than matching their brackets in Python; only one such array is
+        ever alive at a time.
+        """
+        text = self.text
+        char = self._peek(pos)
+        if char == '"':
+            return self._string_end(pos)
+        if char == '{' and walk_depth > 0:
+            return self.parse_object(pos, {}, walk_depth - 1)[1]
+        if char in '{[':
+            return _decoder.raw_decode(text, pos)[1]
+        match = _SCALAR.match(text, pos)
+        if match is None:
+            raise self._error("Expected a value", pos)
+        return match.end()
+
+    def parse_object(self, pos: int, fields: Dict[str, Handler], walk_depth: int = 2) -> Tuple[Dict[str, Any], int]:
+        """Parse the object at `pos`, keeping only `fields` (decoded by their handler)."""
+        text = self.text
+        self._expect(pos, '{')
+        result = {}
+        pos = self._ws(pos + 1)
+        if self._peek(pos) == '}':
+            return result, pos + 1
+
+        while True:
+            self._expect(pos, '"')
+            key_end = self._string_end(pos)
+            key = text[pos + 1:key_end - 1]
+            if '\\' in key:
+                key = json.loads(text[pos:key_end])
+
+            pos = self._ws(key_end)
+            self._expect(pos, ':')
+            pos = self._ws(pos + 1)
+
+            handler = fields.get(key)
+            if handler is None:
+                pos = self.skip(pos, walk_depth)
+            else:
+                result[key], pos = handler(pos)
+
+            pos = self._ws(pos)
+            char = self._peek(pos)
+            if char == ',':
+                pos = self._ws(pos + 1)
+            elif char == '}':
+                return result, pos + 1
+            else:
+                raise self._error("Expected ',' or '}'", pos)
+
+    def parse_array(self, pos: int, item: Handler) -> Tuple[List[Any], int]:
+        """Parse the array at `pos`, converting each element with `item`."""
+        self._expect(pos, '[')
+        result = []
+        pos = self._ws(pos + 1)
+        if self._peek(pos) == ']':
+            return result, pos + 1
+
+        while True:
+            value, pos = item(pos)
+            result.append(value)
+            pos = self._ws(pos)
+            char = self._peek(pos)
+            if char == ',':
+                pos = self._ws(pos + 1)
+            elif char == ']':
+                return result, pos + 1
+            else:
+                raise self._error("Expected ',' or ']'", pos)
+
+
+def parse_document_ai_json(data) -> DocumentSubset:
+    """
+    Selectively parse a Document AI JSON response given as str or bytes.
+
+    Raises json.JSONDecodeError for malformed or truncated input.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    return SelectiveDocumentParser(data).parse()
+
+
+def load_document_ai_file(path: str) -> DocumentSubset:
+    """
+    Selectively parse a Document AI JSON response stored at `path`.
+
+    The file is read into memory whole; parsing is selective (only the kept
+    fields are built), not streaming.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_document_ai_json(f.read())
@@ -5,11 +5,8 @@ from google.cloud import documentai_v1 as documentai
 from google.oauth2 import service_account
 from google.api_core.exceptions import InvalidArgument
 
-# Set up logging
-logging.basicConfig(
-    level=logging.DEBUG,  # Set to DEBUG for maximum verbosity
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logging is configured by the application; importing this module must not
+# reset the root logger (use ocr_client.DocumentAIClient for new code)
 logger = logging.getLogger('GoogleDocAIClient')
 
 
@@ -271,6 +268,11 @@ def test_client(credentials_path, test_file=None):
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG,  # Set to DEBUG for maximum verbosity
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
     # Replace with your credentials path
     creds_path = "path/to/your/credentials.json"
     
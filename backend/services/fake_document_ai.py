@@ -0,0 +1,126 @@
+import glob
+import hashlib
+import os
+import threading
+import time
+from concurrent import futures
+from typing import Dict, List, Optional
+
+import grpc
+from google.cloud import documentai_v1 as documentai
+
+DEFAULT_RESPONSES_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'test-data')
+SERVICE_NAME = 'google.cloud.documentai.v1.DocumentProcessorService'
+
+
+class FakeDocumentAIServer:
+    """
+    Local stand-in for the Document AI ProcessDocument RPC.
+
+    Serves the recorded responses in `test-data/` over plain-text gRPC so the
+    OCR client can be exercised without credentials or network access. The
+    response for a request is picked from the image bytes: an exact match
+    registered with `add_response`, otherwise a stable choice among the
+    recorded files.
+
+    `latency` delays every call and `fail_first` makes the first N calls
+    return UNAVAILABLE, to exercise concurrency, deadlines and retries.
+
+        with FakeDocumentAIServer() as server:
+            client = DocumentAIClient(endpoint=server.endpoint)
+    """
+
+    def __init__(self, responses_dir: str = DEFAULT_RESPONSES_DIR, latency: float = 0.0,
+                 fail_first: int = 0, max_workers: int = 16):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.max_workers = max_workers
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._by_content: Dict[bytes, documentai.Document] = {}
+        self._recorded: List[documentai.Document] = []
+        for path in sorted(glob.glob(os.path.join(responses_dir, '*.json'))):
+            self._recorded.append(self.load_document(path))
+        self._server: Optional[grpc.Server] = None
+        self.port: Optional[int] = None
+
+    @staticmethod
+    def load_document(path: str) -> documentai.Document:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = f.read()
+        return documentai.Document.from_json(data, ignore_unknown_fields=True)
+
+    def add_response(self, content: bytes, document_path: str):
+        """Always answer requests for exactly `content` with the document at `document_path`."""
+        self._by_content[content] = self.load_document(document_path)
+
+    @property
+    def endpoint(self) -> str:
+        return f"localhost:{self.port}"
+
+    def _pick(self, content: bytes) -> documentai.Document:
+        if content in self._by_content:
+            return self._by_content[content]
+        if not self._recorded:
+            return documentai.Document()
+        digest = hashlib.sha256(content).digest()
+        return self._recorded[digest[0] % len(self._recorded)]
+
+    def process_document(self, request: documentai.ProcessRequest, context) -> documentai.ProcessResponse:
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if call <= self.fail_first:
+                context.abort(grpc.StatusCode.UNAVAILABLE, "Injected failure")
+            return documentai.ProcessResponse(document=self._pick(request.raw_document.content))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def start(self, port: int = 0) -> 'FakeDocumentAIServer':
+        handler = grpc.method_handlers_generic_handler(SERVICE_NAME, {
+            'ProcessDocument': grpc.unary_unary_rpc_method_handler(
+                self.process_document,
+                request_deserializer=documentai.ProcessRequest.deserialize,
+                response_serializer=documentai.ProcessResponse.serialize,
+            ),
+        })
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=self.max_workers),
+                                   options=[('grpc.max_receive_message_length', -1),
+                                            ('grpc.max_send_message_length', -1)])
+        self._server.add_generic_rpc_handlers((handler,))
+        self.port = self._server.add_insecure_port(f"localhost:{port}")
+        self._server.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop(grace=None)
+            self._server = None
+
+    def __enter__(self) -> 'FakeDocumentAIServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve recorded Document AI responses over gRPC")
+    parser.add_argument('--port', type=int, default=50051)
+    parser.add_argument('--responses-dir', default=DEFAULT_RESPONSES_DIR)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeDocumentAIServer(args.responses_dir, latency=args.latency).start(args.port)
+    print(f"Fake Document AI listening on {server.endpoint} (PARKER_DOCUMENT_AI_ENDPOINT={server.endpoint})")
+    server._server.wait_for_termination()
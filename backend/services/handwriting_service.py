@@ -1,42 +1,52 @@
-import re
-import json
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-from typing import List, Dict, Tuple, Any
+from typing import Dict, Tuple, Any
+from .document_ai_parser import parse_document_ai_json, load_document_ai_file
+from .token_table import TokenTable, SpacingTable
+from .trend_engine import DocumentTrends, classify_trend
+from .trend_renderer import TrendRenderer
+from .line_index import LineIndex
 
 class HandwritingAnalysisService:
   """Service handles analyzing handwriting samples."""
     
-  def __init__(self):
-      pass
+  def __init__(self, renderer: TrendRenderer = None):
+      # Plots are rendered lazily, on request, from registered analyses
+      self.renderer = renderer or TrendRenderer()
       
   def status(self):
       return "Service is running."
 
   def load_document_ai_response(self, json_string_or_path):
-      """Load Document AI JSON response from string or file path."""
+      """
+      Load Document AI JSON response from string, bytes or file path.
+
+      JSON input is parsed selectively: only the text, page dimensions and
+      token layouts used by the analysis are kept, everything else in the
+      response (page images, blocks, lines, entities, ...) is skipped.
+      """
+      if isinstance(json_string_or_path, (bytes, bytearray)):
+          return parse_document_ai_json(json_string_or_path)
       if isinstance(json_string_or_path, str):
           # Check if it's a file path or a JSON string
           if json_string_or_path.endswith('.json') or os.path.exists(json_string_or_path):
-              with open(json_string_or_path, 'r') as f:
-                  return json.load(f)
+              return load_document_ai_file(json_string_or_path)
           else:
               # Assume it's a JSON string
-              return json.loads(json_string_or_path)
+              return parse_document_ai_json(json_string_or_path)
       else:
           # Assume it's already a dict
           return json_string_or_path
 
-  def extract_token_data(self, doc_ai_response: Dict) -> List[Dict[str, Any]]:
+  def extract_token_data(self, doc_ai_response: Dict) -> TokenTable:
       """
       Extract token data from Document AI response, including:
       - Text content
       - Bounding box coordinates
       - Position in document
+
+      Returns a columnar TokenTable; use `to_records()` for the list-of-dicts form.
       """
-      token_data = []
-      
       # Check if we're dealing with the root response or just the document part
       if 'document' in doc_ai_response:
           document = doc_ai_response['document']
@@ -46,124 +56,141 @@ class HandwritingAnalysisService:
       full_text = document.get('text', '')
       
       # Process each page
+      page_tables = []
+      last_end_index = 0
       for page in document.get('pages', []):
-          page_number = page.get('pageNumber', 1)
-          page_height = page.get('dimension', {}).get('height', 0)
-          page_width = page.get('dimension', {}).get('width', 0)
+          page_table, last_end_index = self.extract_page_tokens(page, full_text, last_end_index)
+          page_tables.append(page_table)
+      
+      return TokenTable.concat(page_tables)
+
+  def extract_page_tokens(self, page: Dict, full_text: str, last_end_index: int = 0) -> Tuple[TokenTable, int]:
+      """
+      Extract the tokens of a single page.
+
+      `last_end_index` is the end index of the last token kept so far, used
+      when a token omits its startIndex. Returns the page's TokenTable and the
+      updated end index to pass to the next page.
+      """
+      table, last_end_index, _ = self._extract_page(page, full_text, last_end_index)
+      return table, last_end_index
+
+  def _extract_page(self, page: Dict, full_text: str, last_end_index: int) -> Tuple[TokenTable, int, bool]:
+      """
+      extract_page_tokens, also reporting whether the incoming `last_end_index`
+      was used, i.e. whether the page's result depends on the pages before it.
+      """
+      used_carry = False
+      kept_on_page = False
+      columns = {name: [] for name in TokenTable.NUMERIC_COLUMNS}
+      texts = []
+      break_types = []
+      
+      page_number = page.get('pageNumber', 1)
+      
+      # Process tokens
+      for token_idx, token in enumerate(page.get('tokens', [])):
+          # Get text segment information
+          text_segments = token.get('layout', {}).get('textAnchor', {}).get('textSegments', [])
           
-          # Process tokens
-          for token_idx, token in enumerate(page.get('tokens', [])):
-              # Get text segment information
-              text_segments = token.get('layout', {}).get('textAnchor', {}).get('textSegments', [])
-              
-              if not text_segments:
-                  continue
-                  
-              # Extract text using start and end indices
-              segment = text_segments[0]
-  # Convert string indices to integers
-              start_index = int(segment.get('startIndex', 0)) if isinstance(segment.get('startIndex'), str) else segment.get('startIndex', 0)
-              end_index = int(segment.get('endIndex', 0)) if isinstance(segment.get('endIndex'), str) else segment.get('endIndex', 0)
-              
-              # Handle case where startIndex might not be provided
-              if 'startIndex' not in segment:
-                  start_index = 0 if token_idx == 0 else token_data[-1]['end_index']
-                  
-              # Extract text
-              token_text = full_text[start_index:end_index]
-              
-              # Skip tokens that are just whitespace or newlines
-              if token_text.strip() == '':
-                  continue
-                  
-              # Get bounding box vertices
-              vertices = token.get('layout', {}).get('boundingPoly', {}).get('vertices', [])
+          if not text_segments:
+              continue
               
-              if not vertices or len(vertices) < 4:
-                  continue
-                  
-              # Calculate token dimensions - handle case where x or y might not be in the vertex
-              x_values = [v.get('x', 0) for v in vertices if 'x' in v]
-              y_values = [v.get('y', 0) for v in vertices if 'y' in v]
+          # Extract text using start and end indices
+          segment = text_segments[0]
+          # Convert string indices to integers
+          start_index = int(segment.get('startIndex', 0)) if isinstance(segment.get('startIndex'), str) else segment.get('startIndex', 0)
+          end_index = int(segment.get('endIndex', 0)) if isinstance(segment.get('endIndex'), str) else segment.get('endIndex', 0)
+          
+          # Handle case where startIndex might not be provided
+          if 'startIndex' not in segment:
+              start_index = 0 if token_idx == 0 else last_end_index
+              used_carry = used_carry or (token_idx != 0 and not kept_on_page)
               
-              if not x_values or not y_values:
-                  continue
-                  
-              min_x = min(x_values)
-              max_x = max(x_values)
-              min_y = min(y_values)
-              max_y = max(y_values)
+          # Extract text
+          token_text = full_text[start_index:end_index]
+          
+          # Skip tokens that are just whitespace or newlines
+          if token_text.strip() == '':
+              continue
               
-              width = max_x - min_x
-              height = max_y - min_y
+          # Get bounding box vertices
+          vertices = token.get('layout', {}).get('boundingPoly', {}).get('vertices', [])
+          
+          if not vertices or len(vertices) < 4:
+              continue
               
-              # Get break type if available
-              break_type = token.get('detectedBreak', {}).get('type', None)
+          # Calculate token dimensions - handle case where x or y might not be in the vertex
+          x_values = [v.get('x', 0) for v in vertices if 'x' in v]
+          y_values = [v.get('y', 0) for v in vertices if 'y' in v]
+          
+          if not x_values or not y_values:
+              continue
               
-              # Store token data
-              token_data.append({
-                  'text': token_text,
-                  'start_index': start_index,
-                  'end_index': end_index,
-                  'page': page_number,
-                  'position': token_idx,
-                  'x_min': min_x,
-                  'x_max': max_x,
-                  'y_min': min_y,
-                  'y_max': max_y,
-                  'width': width,
-                  'height': height,
-                  'break_type': break_type,
-                  'confidence': token.get('layout', {}).get('confidence', 0)
-              })
-      
-      return token_data
+          min_x = min(x_values)
+          max_x = max(x_values)
+          min_y = min(y_values)
+          max_y = max(y_values)
+          
+          # Store token data
+          texts.append(token_text)
+          break_types.append(token.get('detectedBreak', {}).get('type', None))
+          columns['start_index'].append(start_index)
+          columns['end_index'].append(end_index)
+          columns['page'].append(page_number)
+          columns['position'].append(token_idx)
+          columns['x_min'].append(min_x)
+          columns['x_max'].append(max_x)
+          columns['y_min'].append(min_y)
+          columns['y_max'].append(max_y)
+          columns['width'].append(max_x - min_x)
+          columns['height'].append(max_y - min_y)
+          columns['confidence'].append(token.get('layout', {}).get('confidence', 0))
+          last_end_index = end_index
+          kept_on_page = True
+      
+      return TokenTable(columns, texts, break_types), last_end_index, used_carry
+
+  def calculate_spacing(self, token_data: TokenTable) -> SpacingTable:
+      """
+      Calculate spacing between consecutive tokens.
 
-  def calculate_spacing(self, token_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-      """Calculate spacing between consecutive tokens."""
-      spacing_data = []
+      Vectorized over the token columns: tokens are ordered with a lexsort on
+      (page, position) and each token is compared with the next one in bulk.
+      """
+      tokens = TokenTable.coerce(token_data)
+      if len(tokens) < 2:
+          return SpacingTable(tokens, [], [], [])
       
       # Sort tokens by position (should already be in order, but just to be sure)
-      sorted_tokens = sorted(token_data, key=lambda t: (t['page'], t['position']))
+      order = np.lexsort((tokens['position'], tokens['page']))
+      current, following = order[:-1], order[1:]
       
-      # Calculate spacing between consecutive tokens
-      for i in range(len(sorted_tokens) - 1):
-          current_token = sorted_tokens[i]
-          next_token = sorted_tokens[i + 1]
-          
-          # Only calculate spacing if tokens are on the same page and line
-          # We assume tokens on the same line have overlapping y-coordinates
-          current_y_range = (current_token['y_min'], current_token['y_max'])
-          next_y_range = (next_token['y_min'], next_token['y_max'])
-          
-          # Check for y-overlap to determine if tokens are on the same line
-          y_overlap = (
-              current_y_range[0] <= next_y_range[1] and 
-              current_y_range[1] >= next_y_range[0]
-          )
-          
-          # Only consider spacing between tokens on the same line
-          if y_overlap and current_token['page'] == next_token['page']:
-              # Calculate horizontal spacing
-              spacing = next_token['x_min'] - current_token['x_max']
-              
-              # Only consider positive spacing (tokens that follow each other horizontally)
-              if spacing >= 0:
-                  spacing_data.append({
-                      'left_token': current_token['text'],
-                      'right_token': next_token['text'],
-                      'position': current_token['position'],
-                      'spacing': spacing,
-                      'left_token_width': current_token['width'],
-                      'right_token_width': next_token['width'],
-                      'break_type': current_token['break_type']
-                  })
-      
-      return spacing_data
+      page = tokens['page']
+      y_min = tokens['y_min']
+      y_max = tokens['y_max']
+      
+      # Only calculate spacing if tokens are on the same page and line
+      # We assume tokens on the same line have overlapping y-coordinates
+      same_page = page[current] == page[following]
+      y_overlap = (y_min[current] <= y_max[following]) & (y_max[current] >= y_min[following])
+      
+      # Calculate horizontal spacing
+      spacing = tokens['x_min'][following] - tokens['x_max'][current]
+      
+      # Only consider positive spacing (tokens that follow each other horizontally)
+      keep = same_page & y_overlap & (spacing >= 0)
+      
+      return SpacingTable(tokens, current[keep], following[keep], spacing[keep])
 
-  def analyze_trends(self, token_data: List[Dict[str, Any]], spacing_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+  def fit_trends(self, token_data: TokenTable, spacing_data: SpacingTable) -> DocumentTrends:
+      """Fit width, height and spacing trends once; every later stage reuses the result."""
+      return DocumentTrends.fit(TokenTable.coerce(token_data), SpacingTable.coerce(spacing_data))
+
+  def analyze_trends(self, token_data: TokenTable, spacing_data: SpacingTable, fits: DocumentTrends = None) -> Dict[str, Any]:
       """Analyze trends in token sizes and spacing throughout the document."""
-      if not token_data or len(token_data) < 3:
+      token_data = TokenTable.coerce(token_data)
+      if len(token_data) < 3:
           return {
               "token_size_trend": "Insufficient data for token size analysis",
               "spacing_trend": "Insufficient data for spacing analysis",
@@ -172,149 +199,51 @@ class HandwritingAnalysisService:
               "spacing_slope": None
           }
       
-      # Analyze token size trends
-      positions = np.array([t['position'] for t in token_data])
-      widths = np.array([t['width'] for t in token_data])
-      heights = np.array([t['height'] for t in token_data])
-      
-      # Linear regression for width trend
-      if len(positions) > 1:
-          width_slope, width_intercept = np.polyfit(positions, widths, 1)
-          height_slope, height_intercept = np.polyfit(positions, heights, 1)
-          
-          # Calculate R² values for fit quality
-          width_mean = np.mean(widths)
-          height_mean = np.mean(heights)
-          width_r2 = 1 - (np.sum((widths - (width_slope * positions + width_intercept))**2) / 
-                          np.sum((widths - width_mean)**2))
-          height_r2 = 1 - (np.sum((heights - (height_slope * positions + height_intercept))**2) / 
-                           np.sum((heights - height_mean)**2))
-      else:
-          width_slope = height_slope = width_r2 = height_r2 = None
-      
-      # Analyze spacing trends
-      if spacing_data and len(spacing_data) > 1:
-          spacing_positions = np.array([s['position'] for s in spacing_data])
-          spacings = np.array([s['spacing'] for s in spacing_data])
-          spacing_slope, spacing_intercept = np.polyfit(spacing_positions, spacings, 1)
-          
-          # Calculate R² value for spacing fit quality
-          spacing_mean = np.mean(spacings)
-          spacing_r2 = 1 - (np.sum((spacings - (spacing_slope * spacing_positions + spacing_intercept))**2) / 
-                            np.sum((spacings - spacing_mean)**2))
-      else:
-          spacing_slope = spacing_r2 = None
-      
-      # Calculate percentage change from start to end
-      if len(positions) > 1:
-          predicted_start_width = width_slope * min(positions) + width_intercept
-          predicted_end_width = width_slope * max(positions) + width_intercept
-          width_pct_change = ((predicted_end_width - predicted_start_width) / predicted_start_width) * 100 if predicted_start_width != 0 else 0
-          
-          predicted_start_height = height_slope * min(positions) + height_intercept
-          predicted_end_height = height_slope * max(positions) + height_intercept
-          height_pct_change = ((predicted_end_height - predicted_start_height) / predicted_start_height) * 100 if predicted_start_height != 0 else 0
-      else:
-          width_pct_change = height_pct_change = 0
-      
-      if spacing_data and len(spacing_data) > 1:
-          predicted_start_spacing = spacing_slope * min(spacing_positions) + spacing_intercept
-          predicted_end_spacing = spacing_slope * max(spacing_positions) + spacing_intercept
-          spacing_pct_change = ((predicted_end_spacing - predicted_start_spacing) / predicted_start_spacing) * 100 if predicted_start_spacing != 0 else 0
-      else:
-          spacing_pct_change = 0
-      
-      # Determine trends based on slopes and confidence (using R²)
-      width_trend = "No clear trend"
-      if width_slope is not None:
-          if width_r2 > 0.5:  # Strong correlation
-              if width_slope < -0.5:
-                  width_trend = "Strongly decreasing"
-              elif width_slope < 0:
-                  width_trend = "Slightly decreasing"
-              elif width_slope > 0.5:
-                  width_trend = "Strongly increasing"
-              elif width_slope > 0:
-                  width_trend = "Slightly increasing"
-              else:
-                  width_trend = "Stable"
-          else:  # Weak correlation
-              if width_slope < 0:
-                  width_trend = "Weakly decreasing (inconsistent)"
-              elif width_slope > 0:
-                  width_trend = "Weakly increasing (inconsistent)"
-              else:
-                  width_trend = "Stable"
-      
-      height_trend = "No clear trend"
-      if height_slope is not None:
-          if height_r2 > 0.5:  # Strong correlation
-              if height_slope < -0.5:
-                  height_trend = "Strongly decreasing"
-              elif height_slope < 0:
-                  height_trend = "Slightly decreasing"
-              elif height_slope > 0.5:
-                  height_trend = "Strongly increasing"
-              elif height_slope > 0:
-                  height_trend = "Slightly increasing"
-              else:
-                  height_trend = "Stable"
-          else:  # Weak correlation
-              if height_slope < 0:
-                  height_trend = "Weakly decreasing (inconsistent)"
-              elif height_slope > 0:
-                  height_trend = "Weakly increasing (inconsistent)"
-              else:
-                  height_trend = "Stable"
-      
-      spacing_trend = "No clear trend"
-      if spacing_slope is not None:
-          if spacing_r2 > 0.5:  # Strong correlation
-              if spacing_slope < -0.5:
-                  spacing_trend = "Strongly decreasing"
-              elif spacing_slope < 0:
-                  spacing_trend = "Slightly decreasing"
-              elif spacing_slope > 0.5:
-                  spacing_trend = "Strongly increasing"
-              elif spacing_slope > 0:
-                  spacing_trend = "Slightly increasing"
-              else:
-                  spacing_trend = "Stable"
-          else:  # Weak correlation
-              if spacing_slope < 0:
-                  spacing_trend = "Weakly decreasing (inconsistent)"
-              elif spacing_slope > 0:
-                  spacing_trend = "Weakly increasing (inconsistent)"
-              else:
-                  spacing_trend = "Stable"
+      if fits is None:
+          fits = self.fit_trends(token_data, spacing_data)
+      return self.describe_trends(fits)
+
+  def describe_trends(self, fits: DocumentTrends) -> Dict[str, Any]:
+      """Turn fitted trends into the slopes, R², % changes and labels of the analysis response."""
+      width, height, spacing = fits.width, fits.height, fits.spacing
       
       return {
-          "token_width_trend": width_trend,
-          "token_height_trend": height_trend,
-          "spacing_trend": spacing_trend,
-          "token_width_slope": width_slope,
-          "token_height_slope": height_slope,
-          "spacing_slope": spacing_slope,
-          "width_r2": width_r2,
-          "height_r2": height_r2,
-          "spacing_r2": spacing_r2,
-          "width_pct_change": width_pct_change,
-          "height_pct_change": height_pct_change,
-          "spacing_pct_change": spacing_pct_change
+          "token_width_trend": classify_trend(width.slope, width.r2),
+          "token_height_trend": classify_trend(height.slope, height.r2),
+          "spacing_trend": classify_trend(spacing.slope, spacing.r2),
+          "token_width_slope": width.slope,
+          "token_height_slope": height.slope,
+          "spacing_slope": spacing.slope,
+          "width_r2": width.r2,
+          "height_r2": height.r2,
+          "spacing_r2": spacing.r2,
+          "width_pct_change": width.pct_change,
+          "height_pct_change": height.pct_change,
+          "spacing_pct_change": spacing.pct_change
       }
 
-  def summarize_results(self, token_data: List[Dict[str, Any]], spacing_data: List[Dict[str, Any]], trends: Dict[str, Any]) -> str:
+  def analyze_line_trends(self, token_data: TokenTable, line_index: LineIndex = None) -> Dict[str, Any]:
+      """Width, height and spacing slopes within each text line (see LineIndex.line_trends)."""
+      if line_index is None:
+          line_index = LineIndex.build(TokenTable.coerce(token_data))
+      return line_index.line_trends()
+
+  def summarize_results(self, token_data: TokenTable, spacing_data: SpacingTable, trends: Dict[str, Any], fits: DocumentTrends = None) -> str:
       """Generate a human-readable summary of the handwriting analysis."""
+      token_data = TokenTable.coerce(token_data)
+      spacing_data = SpacingTable.coerce(spacing_data)
+      if fits is None:
+          fits = self.fit_trends(token_data, spacing_data)
       
       summary = []
       summary.append("=== HANDWRITING COMPRESSION ANALYSIS SUMMARY ===\n")
       
       # Number of tokens analyzed
-      summary.append(f"• Analyzed {len(token_data)} tokens across {len(set(t['page'] for t in token_data))} pages")
+      summary.append(f"• Analyzed {len(token_data)} tokens across {len(np.unique(token_data['page']))} pages")
       
       # Token width analysis
       summary.append("\n== TOKEN WIDTH ANALYSIS ==")
-      avg_width = np.mean([t['width'] for t in token_data])
+      avg_width = fits.width.mean_y
       summary.append(f"• Average token width: {avg_width:.2f} pixels")
       
       if trends['token_width_slope'] is not None:
@@ -340,7 +269,7 @@ class HandwritingAnalysisService:
       
       # Token height analysis
       summary.append("\n== TOKEN HEIGHT ANALYSIS ==")
-      avg_height = np.mean([t['height'] for t in token_data])
+      avg_height = fits.height.mean_y
       summary.append(f"• Average token height: {avg_height:.2f} pixels")
       
       if trends['token_height_slope'] is not None:
@@ -365,9 +294,9 @@ class HandwritingAnalysisService:
           summary.append(f"• Interpretation: {significance.capitalize()} {direction} in token height")
       
       # Spacing analysis
-      if spacing_data and len(spacing_data) > 1 and trends['spacing_slope'] is not None:
+      if len(spacing_data) > 1 and trends['spacing_slope'] is not None:
           summary.append("\n== TOKEN SPACING ANALYSIS ==")
-          avg_spacing = np.mean([s['spacing'] for s in spacing_data])
+          avg_spacing = fits.spacing.mean_y
           summary.append(f"• Average spacing between tokens: {avg_spacing:.2f} pixels")
           
           change_per_token = trends['spacing_slope']
@@ -416,152 +345,45 @@ class HandwritingAnalysisService:
       
       return "\n".join(summary)
 
-  def visualize_trends(self, token_data: List[Dict[str, Any]], spacing_data: List[Dict[str, Any]], output_path="handwriting_analysis.png"):
-      """Create visualizations of token size and spacing trends."""
-      if not token_data or len(token_data) < 2:
+  def visualize_trends(self, token_data: TokenTable, spacing_data: SpacingTable, output_path=None, fits: DocumentTrends = None):
+      """
+      Create visualizations of token size and spacing trends.
+
+      Renders with the thread-safe TrendRenderer. Without `output_path` the
+      image goes to a unique temporary file, so concurrent calls never
+      overwrite each other.
+      """
+      token_data = TokenTable.coerce(token_data)
+      spacing_data = SpacingTable.coerce(spacing_data)
+      if len(token_data) < 2:
           print("Not enough data for visualization")
           return
       
-      plt.figure(figsize=(15, 12))
-      
-      # Plot token widths
-      plt.subplot(3, 1, 1)
-      positions = [t['position'] for t in token_data]
-      widths = [t['width'] for t in token_data]
-      texts = [t['text'] for t in token_data]
-      
-      plt.scatter(positions, widths, alpha=0.7, s=100)
-      
-      # Add text labels to points
-      for i, txt in enumerate(texts):
-          plt.annotate(txt, (positions[i], widths[i]), 
-                       textcoords="offset points", 
-                       xytext=(0, 10), 
-                       ha='center')
-      
-      if len(positions) > 1:
-          # Add trend line
-          slope, intercept = np.polyfit(positions, widths, 1)
-          trend_x = np.array([min(positions), max(positions)])
-          trend_y = slope * trend_x + intercept
-          plt.plot(trend_x, trend_y, 'r--', linewidth=2, 
-                   label=f'Slope: {slope:.2f} px/token')
-          
-          # Calculate and display R²
-          width_mean = np.mean(widths)
-          r2 = 1 - (np.sum((widths - (slope * np.array(positions) + intercept))**2) / 
-                    np.sum((widths - width_mean)**2))
-          plt.text(min(positions), max(widths) * 0.9, 
-                   f'R² = {r2:.3f}\nChange: {slope * len(positions):.1f} px', 
-                   bbox=dict(facecolor='white', alpha=0.5))
-          
-          plt.legend()
-      
-      plt.title('Token Width Trend', fontsize=14)
-      plt.xlabel('Token Position', fontsize=12)
-      plt.ylabel('Token Width (pixels)', fontsize=12)
-      plt.grid(True, alpha=0.3)
-      
-      # Plot token heights
-      plt.subplot(3, 1, 2)
-      heights = [t['height'] for t in token_data]
-      plt.scatter(positions, heights, alpha=0.7, color='green', s=100)
-      
-      # Add text labels to points
-      for i, txt in enumerate(texts):
-          plt.annotate(txt, (positions[i], heights[i]), 
-                       textcoords="offset points", 
-                       xytext=(0, 10), 
-                       ha='center')
-      
-      if len(positions) > 1:
-          # Add trend line
-          slope, intercept = np.polyfit(positions, heights, 1)
-          trend_x = np.array([min(positions), max(positions)])
-          trend_y = slope * trend_x + intercept
-          plt.plot(trend_x, trend_y, 'r--', linewidth=2, 
-                   label=f'Slope: {slope:.2f} px/token')
-          
-          # Calculate and display R²
-          height_mean = np.mean(heights)
-          r2 = 1 - (np.sum((heights - (slope * np.array(positions) + intercept))**2) / 
-                    np.sum((heights - height_mean)**2))
-          plt.text(min(positions), max(heights) * 0.9, 
-                   f'R² = {r2:.3f}\nChange: {slope * len(positions):.1f} px', 
-                   bbox=dict(facecolor='white', alpha=0.5))
-          
-          plt.legend()
-      
-      plt.title('Token Height Trend', fontsize=14)
-      plt.xlabel('Token Position', fontsize=12)
-      plt.ylabel('Token Height (pixels)', fontsize=12)
-      plt.grid(True, alpha=0.3)
-      
-      # Plot spacing between tokens
-      if spacing_data and len(spacing_data) > 1:
-          plt.subplot(3, 1, 3)
-          spacing_positions = [s['position'] for s in spacing_data]
-          spacings = [s['spacing'] for s in spacing_data]
-          left_tokens = [s['left_token'] for s in spacing_data]
-          right_tokens = [s['right_token'] for s in spacing_data]
-          labels = [f"{left}→{right}" for left, right in zip(left_tokens, right_tokens)]
-          
-          plt.scatter(spacing_positions, spacings, alpha=0.7, color='purple', s=100)
-          
-          # Add text labels to points
-          for i, txt in enumerate(labels):
-              plt.annotate(txt, (spacing_positions[i], spacings[i]), 
-                           textcoords="offset points", 
-                           xytext=(0, 10), 
-                           ha='center')
-          
-          # Add trend line
-          slope, intercept = np.polyfit(spacing_positions, spacings, 1)
-          trend_x = np.array([min(spacing_positions), max(spacing_positions)])
-          trend_y = slope * trend_x + intercept
-          plt.plot(trend_x, trend_y, 'r--', linewidth=2, 
-                   label=f'Slope: {slope:.2f} px/token')
-          
-          # Calculate and display R²
-          spacing_mean = np.mean(spacings)
-          r2 = 1 - (np.sum((spacings - (slope * np.array(spacing_positions) + intercept))**2) / 
-                    np.sum((spacings - spacing_mean)**2))
-          plt.text(min(spacing_positions), max(spacings) * 0.9, 
-                   f'R² = {r2:.3f}\nChange: {slope * len(spacing_positions):.1f} px', 
-                   bbox=dict(facecolor='white', alpha=0.5))
-          
-          plt.legend()
-          
-          plt.title('Token Spacing Trend', fontsize=14)
-          plt.xlabel('Position', fontsize=12)
-          plt.ylabel('Spacing Between Tokens (pixels)', fontsize=12)
-          plt.grid(True, alpha=0.3)
-      
-      plt.tight_layout()
-      plt.savefig(output_path)
-      plt.close()
-      return output_path
+      if fits is None:
+          fits = self.fit_trends(token_data, spacing_data)
+      return self.renderer.render_to_file(token_data, spacing_data, fits, output_path)
 
-  def analyze_handwriting_compression(self, json_data, output_path="handwriting_analysis.png"):
+  def analyze_handwriting_compression(self, json_data, output_path=None):
       """
       Main function to analyze whether handwriting shows compression over the document.
       
+      The visualization is not drawn here: the analysis is registered with the
+      renderer under its `document_hash` and rendered when first requested.
+      
       Args:
           json_data: Either a dict containing the Document AI response, a JSON string, or a file path
-          output_path: Where to save the visualization image
+          output_path: If given, also render the visualization to this path right away
           
       Returns:
           A dictionary containing analysis results and a text summary
       """
-      import os
-      
       # Load document data
       doc_data = self.load_document_ai_response(json_data)
       
       # Extract token information
       token_data = self.extract_token_data(doc_data)
       
-      if not token_data:
+      if len(token_data) == 0:
           return {
               "success": False,
               "error": "No valid tokens found in the document",
@@ -571,26 +393,33 @@ class HandwritingAnalysisService:
       # Calculate spacing between tokens
       spacing_data = self.calculate_spacing(token_data)
       
+      # Fit the trends once and share them between analysis, summary and plots
+      fits = self.fit_trends(token_data, spacing_data)
+      
       # Analyze trends
-      trends = self.analyze_trends(token_data, spacing_data)
+      trends = self.analyze_trends(token_data, spacing_data, fits)
+      line_trends = self.analyze_line_trends(token_data)
       
       # Generate summary
-      summary = self.summarize_results(token_data, spacing_data, trends)
+      summary = self.summarize_results(token_data, spacing_data, trends, fits)
       
-      # Create visualizations if we have enough data
+      # Make the visualization available for lazy rendering
+      document_hash = token_data.fingerprint()
       visualization_path = None
       if len(token_data) > 1:
-          visualization_path = self.visualize_trends(token_data, spacing_data, output_path)
-      
-      print(summary)
+          self.renderer.register(document_hash, token_data, spacing_data, fits)
+          if output_path is not None:
+              visualization_path = self.visualize_trends(token_data, spacing_data, output_path, fits)
       
       return {
           "success": True,
-          "token_data": token_data,
-          "spacing_data": spacing_data,
+          "token_data": token_data.to_records(),
+          "spacing_data": spacing_data.to_records(),
           "trends": trends,
+          "line_trends": line_trends,
           "summary": summary,
           "visualization_path": visualization_path,
+          "document_hash": document_hash,
           "token_count": len(token_data)
       }
   
@@ -757,9 +586,11 @@ def test_service():
       
       print("Analyzing from JSON string:")
       results = service.analyze_handwriting_compression(example_json)
+      print(results.get("summary", results.get("error")))
       
       print("\nAnalyzing from file:")
       file_results = service.analyze_handwriting_compression("example_document.json")
+      print(file_results.get("summary", file_results.get("error")))
       
       # Clean up the temp file
       os.remove("example_document.json")
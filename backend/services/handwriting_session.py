@@ -0,0 +1,162 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .handwriting_service import HandwritingAnalysisService
+from .token_table import TokenTable
+from .trend_engine import DocumentTrends, LinearTrend, fit_trends
+
+
+class HandwritingSession:
+    """
+    Incremental handwriting analysis for a sample that arrives page by page.
+
+    Each append only extracts and fits the new tokens: the width, height and
+    spacing trends are kept as running sufficient statistics, and the last
+    token seen is carried over so spacing stays continuous across batches of
+    the same page. After every append the trends are the same as analysing
+    everything appended so far in one go.
+    """
+
+    def __init__(self, service: HandwritingAnalysisService = None, keep_tokens: bool = False):
+        self.service = service or HandwritingAnalysisService()
+        self.keep_tokens = keep_tokens
+        self.fits = DocumentTrends(LinearTrend(), LinearTrend(), LinearTrend())
+        self.token_count = 0
+        self.spacing_count = 0
+        self.page_count = 0
+        self._pages = set()
+        self._last_token: Optional[TokenTable] = None
+        self._tables = []
+        self._lock = threading.Lock()
+
+    def extract(self, doc_ai_response) -> Tuple[TokenTable, int]:
+        """
+        The tokens of a Document AI response (dict, JSON string/bytes or path)
+        and its number of pages, without touching the session: the costly half
+        of append_response, which can run in another process.
+
+        Text anchors are resolved against that response's own text; pages keep
+        the response's own numbering until appended.
+        """
+        document = self.service.load_document_ai_response(doc_ai_response)
+        if 'document' in document:
+            document = document['document']
+
+        full_text = document.get('text', '')
+        pages = document.get('pages', [])
+        tables = []
+        last_end_index = 0
+        for page in pages:
+            table, last_end_index = self.service.extract_page_tokens(page, full_text, last_end_index)
+            tables.append(table)
+        return TokenTable.concat(tables), len(pages)
+
+    def append_response(self, doc_ai_response) -> Dict[str, Any]:
+        """
+        Append the pages of a Document AI response (dict, JSON string/bytes or path).
+
+        Its pages are numbered after the pages already in the session.
+        """
+        return self.append_extracted(*self.extract(doc_ai_response))
+
+    def append_extracted(self, tokens: TokenTable, page_count: int) -> Dict[str, Any]:
+        """Append extract()'s tokens, numbering their pages after the pages already in the session."""
+        with self._lock:
+            tokens.columns['page'] = tokens.columns['page'] + self.page_count
+            return self._append(tokens, page_count)
+
+    def append_page(self, page: Dict, full_text: str) -> Dict[str, Any]:
+        """Append one Document AI page whose text anchors index into `full_text`, numbered after the others."""
+        table, _ = self.service.extract_page_tokens(page, full_text)
+        return self.append_extracted(table, 1)
+
+    def append_tokens(self, tokens) -> Dict[str, Any]:
+        """Append an already extracted token batch (TokenTable or list of token dicts)."""
+        with self._lock:
+            return self._append(TokenTable.coerce(tokens))
+
+    def _append(self, tokens: TokenTable, new_pages: int = 0) -> Dict[str, Any]:
+        """Fit `tokens` and only then update the session, so a failing batch leaves it unchanged."""
+        page_count = self.page_count + new_pages
+        if len(tokens):
+            width, height = fit_trends(tokens['position'], [tokens['width'], tokens['height']])
+
+            # Spacing needs the previous batch's last token in front of this batch
+            if self._last_token is not None:
+                spacing_input = TokenTable.concat([self._last_token, tokens])
+            else:
+                spacing_input = tokens
+            spacing = self.service.calculate_spacing(spacing_input)
+            spacing_fit = LinearTrend.fit(spacing.position, spacing.spacing)
+
+            pages = self._pages.union(np.unique(tokens['page']).tolist())
+            order = np.lexsort((tokens['position'], tokens['page']))
+            last_token = tokens.take(order[-1:])
+
+            self.fits.width.merge(width)
+            self.fits.height.merge(height)
+            self.fits.spacing.merge(spacing_fit)
+            self.token_count += len(tokens)
+            self.spacing_count += len(spacing)
+            self._pages = pages
+            page_count = max(page_count, len(pages))
+            self._last_token = last_token
+            if self.keep_tokens:
+                self._tables.append(tokens)
+
+        self.page_count = page_count
+        return self.result()
+
+    def trends(self) -> Dict[str, Any]:
+        """Current trends, in the same format as HandwritingAnalysisService.analyze_trends."""
+        if self.token_count < 3:
+            return self.service.analyze_trends(TokenTable.empty(), [])
+        return self.service.describe_trends(self.fits)
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "trends": self.trends(),
+            "token_count": self.token_count,
+            "spacing_count": self.spacing_count,
+            "page_count": self.page_count,
+        }
+
+    def tokens(self) -> TokenTable:
+        """All appended tokens (only available with keep_tokens=True)."""
+        if not self.keep_tokens:
+            raise ValueError("Session was created without keep_tokens=True")
+        return TokenTable.concat(self._tables)
+
+
+class HandwritingSessionRegistry:
+    """Bounded, thread-safe map of session id -> HandwritingSession (least recently used evicted)."""
+
+    def __init__(self, service: HandwritingAnalysisService = None, max_sessions: int = 256):
+        self.service = service
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = HandwritingSession(self.service)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[HandwritingSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def close(self, session_id: str) -> Optional[HandwritingSession]:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
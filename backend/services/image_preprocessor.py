@@ -0,0 +1,214 @@
+import io
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+FORMAT_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+
+class PreparedImage:
+    """An image ready for OCR, plus what is needed to map OCR coordinates back."""
+
+    def __init__(self, content: bytes, mime_type: str, original_size, processed_size,
+                 original_bytes: int, elapsed: float, changed: bool):
+        self.content = content
+        self.mime_type = mime_type
+        self.original_size = original_size
+        self.processed_size = processed_size
+        self.original_bytes = original_bytes
+        self.elapsed = elapsed
+        self.changed = changed
+
+    @property
+    def scale_x(self) -> float:
+        """Factor from processed to original x coordinates."""
+        return self.original_size[0] / self.processed_size[0]
+
+    @property
+    def scale_y(self) -> float:
+        return self.original_size[1] / self.processed_size[1]
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.content)
+
+    def rescale_document(self, document: Dict) -> Dict:
+        """
+        Map the token bounding boxes of an OCR result back to original image
+        coordinates (in place), so widths, heights and spacing are measured in
+        the same pixels as without preprocessing.
+        """
+        if not self.changed:
+            return document
+        scale_x, scale_y = self.scale_x, self.scale_y
+        for page in document.get('pages', []):
+            dimension = page.get('dimension')
+            if dimension:
+                if 'width' in dimension:
+                    dimension['width'] = dimension['width'] * scale_x
+                if 'height' in dimension:
+                    dimension['height'] = dimension['height'] * scale_y
+            for token in page.get('tokens', []):
+                for vertex in token.get('layout', {}).get('boundingPoly', {}).get('vertices', []):
+                    if 'x' in vertex:
+                        vertex['x'] = vertex['x'] * scale_x
+                    if 'y' in vertex:
+                        vertex['y'] = vertex['y'] * scale_y
+        return document
+
+
+class ImagePreprocessor:
+    """
+    Shrinks handwriting photos before they are uploaded for OCR.
+
+    The image is rotated upright from its EXIF orientation, converted to
+    grayscale, downscaled so the page is at most `target_dpi` and re-encoded
+    as JPEG, PNG or WebP. When the image carries no (real) DPI information the
+    page is assumed to be `page_width_inches` wide (Letter). Images are never
+    upscaled, and if re-encoding would not make the upload smaller the
+    original bytes are sent unchanged.
+
+    Coordinates returned by OCR refer to the processed image; use
+    `PreparedImage.rescale_document` to bring them back to the (upright)
+    original resolution.
+    """
+
+    def __init__(self, target_dpi=200, page_width_inches=8.5, image_format='JPEG', quality=80,
+                 grayscale=True, min_bytes=200 * 1024):
+        """
+        Args:
+            target_dpi (int): Resolution to downscale to.
+            page_width_inches (float): Page width assumed when the image has no DPI metadata.
+            image_format (str): Output format, one of JPEG, PNG, WEBP.
+            quality (int): JPEG/WebP quality.
+            grayscale (bool): Convert to 8-bit grayscale.
+            min_bytes (int): Images smaller than this are sent as they are.
+        """
+        image_format = image_format.upper()
+        if image_format not in FORMAT_MIME_TYPES:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.target_dpi = target_dpi
+        self.page_width_inches = page_width_inches
+        self.image_format = image_format
+        self.quality = quality
+        self.grayscale = grayscale
+        self.min_bytes = min_bytes
+
+        self._lock = threading.Lock()
+        self._images = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._seconds = 0.0
+        # OCR latency of preprocessed vs. unprocessed uploads, for comparison
+        self._ocr_latency = {True: [0, 0.0], False: [0, 0.0]}
+
+    @classmethod
+    def from_environment(cls) -> Optional['ImagePreprocessor']:
+        """A preprocessor configured from PARKER_OCR_* variables, or None unless PARKER_OCR_PREPROCESS is set."""
+        if os.environ.get('PARKER_OCR_PREPROCESS', '').lower() not in ('1', 'true', 'yes'):
+            return None
+        return cls(
+            target_dpi=int(os.environ.get('PARKER_OCR_TARGET_DPI', 200)),
+            image_format=os.environ.get('PARKER_OCR_IMAGE_FORMAT', 'JPEG'),
+            quality=int(os.environ.get('PARKER_OCR_IMAGE_QUALITY', 80)),
+        )
+
+    def _scale(self, dpi, width: int) -> float:
+        # Cameras and screenshots write placeholder 72/96 DPI; only trust scanner values
+        if dpi and dpi[0] and float(dpi[0]) > 96:
+            source_dpi = float(dpi[0])
+        else:
+            source_dpi = width / self.page_width_inches
+        return min(1.0, self.target_dpi / source_dpi)
+
+    def prepare(self, content: bytes, mime_type: str) -> PreparedImage:
+        started = time.perf_counter()
+        if not mime_type.startswith('image/') or len(content) < self.min_bytes:
+            return self._unchanged(content, mime_type, None, started)
+
+        try:
+            image = Image.open(io.BytesIO(content))
+            raw_size = image.size
+            # EXIF orientations 5-8 are rotated by 90 degrees
+            rotated = image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+            original_size = raw_size[::-1] if rotated else raw_size
+            scale = self._scale(image.info.get('dpi'), original_size[0])
+
+            # Let the JPEG decoder skip detail we are going to throw away anyway
+            if image.format == 'JPEG' and scale < 0.5:
+                image.draft('L' if self.grayscale else 'RGB',
+                            (int(raw_size[0] * scale), int(raw_size[1] * scale)))
+            image = ImageOps.exif_transpose(image)
+        except Exception as e:
+            print(f"Image preprocessing skipped: {e}")
+            return self._unchanged(content, mime_type, None, started)
+
+        target = (max(1, round(original_size[0] * scale)), max(1, round(original_size[1] * scale)))
+
+        if self.grayscale:
+            image = image.convert('L')
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        if target != image.size:
+            image = image.resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+        output = io.BytesIO()
+        options = {'optimize': True}
+        if self.image_format in ('JPEG', 'WEBP'):
+            options['quality'] = self.quality
+        image.save(output, format=self.image_format, dpi=(self.target_dpi, self.target_dpi), **options)
+        processed = output.getvalue()
+
+        if len(processed) >= len(content):
+            return self._unchanged(content, mime_type, original_size, started)
+
+        prepared = PreparedImage(processed, FORMAT_MIME_TYPES[self.image_format], original_size, image.size,
+                                 len(content), time.perf_counter() - started, changed=True)
+        self._record(prepared)
+        return prepared
+
+    def _unchanged(self, content, mime_type, size, started) -> PreparedImage:
+        size = size or (1, 1)
+        prepared = PreparedImage(content, mime_type, size, size, len(content),
+                                 time.perf_counter() - started, changed=False)
+        self._record(prepared)
+        return prepared
+
+    def _record(self, prepared: PreparedImage):
+        with self._lock:
+            self._images += 1
+            self._bytes_in += prepared.original_bytes
+            self._bytes_out += len(prepared.content)
+            self._seconds += prepared.elapsed
+
+    def record_ocr_latency(self, prepared: PreparedImage, seconds: float):
+        """Note how long the OCR call for `prepared` took."""
+        with self._lock:
+            entry = self._ocr_latency[prepared.changed]
+            entry[0] += 1
+            entry[1] += seconds
+
+    def status(self) -> Dict:
+        with self._lock:
+            def mean_latency(changed):
+                count, total = self._ocr_latency[changed]
+                return total / count if count else None
+
+            preprocessed, unprocessed = mean_latency(True), mean_latency(False)
+            return {
+                "images": self._images,
+                "bytes_in": self._bytes_in,
+                "bytes_out": self._bytes_out,
+                "bytes_saved": self._bytes_in - self._bytes_out,
+                "preprocess_seconds": self._seconds,
+                "mean_ocr_latency_s": {"preprocessed": preprocessed, "unprocessed": unprocessed},
+                "ocr_latency_change_s": (preprocessed - unprocessed
+                                         if preprocessed is not None and unprocessed is not None else None),
+            }
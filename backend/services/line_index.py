@@ -0,0 +1,190 @@
+import numpy as np
+from typing import Any, Dict, List
+
+from .token_table import TokenTable
+
+
+class LineIndex:
+    """
+    Groups the tokens of a TokenTable into text lines.
+
+    Lines are found per page with a sweep over the token y-intervals in order
+    of their top edge: each token joins the open line whose band it overlaps
+    most (by at least `min_overlap` of the smaller height), otherwise it
+    starts a new line. A line is closed once the sweep has passed below its
+    band, so every token is only compared with the few lines still open, and
+    the whole build is O(n log n).
+
+    The result is CSR-style: `order` lists token rows grouped by line (left
+    to right inside a line) and `offsets[i]:offsets[i + 1]` is line i's slice
+    of it. `line_id[row]` maps a token row back to its line.
+    """
+
+    def __init__(self, tokens: TokenTable, line_id: np.ndarray, order: np.ndarray, offsets: np.ndarray):
+        self.tokens = tokens
+        self.line_id = line_id
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, tokens: TokenTable, min_overlap: float = 0.5) -> 'LineIndex':
+        n = len(tokens)
+        line_id = np.full(n, -1, dtype=np.int64)
+        # Sweep each page from top to bottom
+        sweep = np.lexsort((tokens['y_max'], tokens['y_min'], tokens['page']))
+        pages = tokens['page'].tolist()
+        y_min = tokens['y_min'].tolist()
+        y_max = tokens['y_max'].tolist()
+        line_top: List[float] = []
+        line_bottom: List[float] = []
+        line_size: List[int] = []
+        open_lines: List[int] = []
+        current_page = None
+        for row in sweep.tolist():
+            page, top, bottom = pages[row], y_min[row], y_max[row]
+            if page != current_page:
+                current_page = page
+                open_lines = []
+
+            # Close lines the sweep has moved past
+            open_lines = [line for line in open_lines if line_bottom[line] > top]
+
+            best, best_overlap = -1, 0.0
+            height = bottom - top
+            for line in open_lines:
+                overlap = min(bottom, line_bottom[line]) - max(top, line_top[line])
+                needed = min_overlap * min(height, line_bottom[line] - line_top[line])
+                if overlap >= needed and overlap > best_overlap:
+                    best, best_overlap = line, overlap
+
+            if best < 0:
+                best = len(line_top)
+                line_top.append(top)
+                line_bottom.append(bottom)
+                line_size.append(1)
+                open_lines.append(best)
+            else:
+                # The band is the running mean of its tokens, so it follows
+                # slanted handwriting without growing to swallow the next line
+                line_size[best] += 1
+                line_top[best] += (top - line_top[best]) / line_size[best]
+                line_bottom[best] += (bottom - line_bottom[best]) / line_size[best]
+            line_id[row] = best
+
+        # Tokens grouped by line, left to right within each line
+        order = np.lexsort((tokens['x_min'], line_id)) if n else np.zeros(0, dtype=np.int64)
+        counts = np.bincount(line_id, minlength=len(line_top)) if n else np.zeros(0, dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(tokens, line_id, order, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def line_sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def line_page(self) -> np.ndarray:
+        """Page number of each line."""
+        return self.tokens['page'][self.order[self.offsets[:-1]]] if len(self) else np.zeros(0, dtype=np.int64)
+
+    def line_rows(self, line: int) -> np.ndarray:
+        """Token rows of one line, left to right."""
+        return self.order[self.offsets[line]:self.offsets[line + 1]]
+
+    def line_texts(self) -> List[str]:
+        text = self.tokens.text
+        return [''.join(text[row] for row in self.line_rows(line)).strip() for line in range(len(self))]
+
+    def rank_in_line(self) -> np.ndarray:
+        """0-based position of each entry of `order` within its line."""
+        lines = self.line_id[self.order]
+        return np.arange(len(self.order)) - self.offsets[lines]
+
+    def gaps(self):
+        """
+        Horizontal gaps between neighbouring tokens of the same line.
+
+        Returns (line, rank, gap) arrays; overlapping neighbours (negative
+        gaps) are dropped, as in calculate_spacing.
+        """
+        order = self.order
+        lines = self.line_id[order]
+        same_line = lines[1:] == lines[:-1]
+        gap = self.tokens['x_min'][order[1:]] - self.tokens['x_max'][order[:-1]]
+        rank = self.rank_in_line()[:-1]
+        keep = same_line & (gap >= 0)
+        return lines[1:][keep], rank[keep], gap[keep]
+
+    def line_slopes(self, lines: np.ndarray, x: np.ndarray, y: np.ndarray, min_points: int = 3):
+        """
+        Least-squares slope of y against x for every line at once.
+
+        Per-line means and centred sums come from np.bincount, so there is no
+        Python loop over lines. Lines with fewer than `min_points` points (or
+        no x spread) get NaN.
+        """
+        count = np.bincount(lines, minlength=len(self)).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = np.bincount(lines, x, minlength=len(self)) / count
+            mean_y = np.bincount(lines, y, minlength=len(self)) / count
+            dx = x - mean_x[lines]
+            dy = y - mean_y[lines]
+            sxx = np.bincount(lines, dx * dx, minlength=len(self))
+            sxy = np.bincount(lines, dx * dy, minlength=len(self))
+            slope = sxy / sxx
+        slope[(count < min_points) | ~(sxx > 0)] = np.nan
+        return slope
+
+    def line_trends(self, min_tokens: int = 3) -> Dict[str, Any]:
+        """
+        Width, height and spacing slopes along each line (per token step).
+
+        Consistently negative slopes inside lines, i.e. writing that shrinks
+        towards the end of each line, is a classic sign of micrographia even
+        when the document-level trend is flat.
+        """
+        if len(self) == 0:
+            return {"line_count": 0, "lines_analyzed": 0, "lines": []}
+
+        lines = self.line_id[self.order]
+        rank = self.rank_in_line().astype(np.float64)
+        width_slope = self.line_slopes(lines, rank, self.tokens['width'][self.order], min_tokens)
+        height_slope = self.line_slopes(lines, rank, self.tokens['height'][self.order], min_tokens)
+        gap_lines, gap_rank, gap = self.gaps()
+        spacing_slope = self.line_slopes(gap_lines, gap_rank.astype(np.float64), gap, min_tokens - 1)
+
+        analyzed = ~np.isnan(width_slope)
+        shrinking = analyzed & (width_slope < 0) & (height_slope < 0)
+
+        def mean(values):
+            values = values[~np.isnan(values)]
+            return float(values.mean()) if values.size else None
+
+        def value(v):
+            return None if np.isnan(v) else float(v)
+
+        pages = self.line_page.tolist()
+        sizes = self.line_sizes.tolist()
+        texts = self.line_texts()
+        return {
+            "line_count": len(self),
+            "lines_analyzed": int(analyzed.sum()),
+            "mean_width_slope": mean(width_slope),
+            "mean_height_slope": mean(height_slope),
+            "mean_spacing_slope": mean(spacing_slope),
+            "shrinking_line_fraction": float(shrinking.sum() / analyzed.sum()) if analyzed.any() else None,
+            "lines": [
+                {
+                    "line": line,
+                    "page": pages[line],
+                    "token_count": sizes[line],
+                    "text": texts[line],
+                    "width_slope": value(width_slope[line]),
+                    "height_slope": value(height_slope[line]),
+                    "spacing_slope": value(spacing_slope[line]),
+                }
+                for line in range(len(self))
+            ],
+        }
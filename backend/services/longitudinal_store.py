@@ -0,0 +1,348 @@
+import json
+import math
+import numbers
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .trend_engine import LinearTrend
+
+SECONDS_PER_DAY = 86400.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    user_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    t REAL NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_by_user_metric ON observations (user_id, metric, t);
+CREATE TABLE IF NOT EXISTS aggregates (
+    user_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (user_id, metric)
+);
+"""
+
+
+class MetricAggregate:
+    """
+    Running statistics of one metric of one patient, updated in O(1) per observation.
+
+    Keeps the count, first/last/previous values, a rolling window of the most
+    recent values, a LinearTrend of value against time (slope per day) and a
+    two-sided CUSUM against the current baseline (the mean and standard
+    deviation since the last change point). A change point is flagged when
+    either CUSUM exceeds `h` standard deviations (with slack `k`); the
+    baseline then restarts from the new level. While the baseline is short its
+    standard deviation is widened as for a prediction interval, so that the
+    first few similar sessions don't make ordinary noise look like a change.
+    """
+
+    def __init__(self, window: int = 5, state: Optional[Dict] = None):
+        self.window = window
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.first_t = state.get('first_t')
+        self.first_value = state.get('first_value')
+        self.last_t = state.get('last_t')
+        self.last_value = state.get('last_value')
+        self.previous_value = state.get('previous_value')
+        self.recent: List[float] = state.get('recent', [])
+        self.trend = LinearTrend.from_dict(state['trend']) if state.get('trend') else LinearTrend()
+        # Baseline since the last change point (Welford)
+        self.baseline_n = state.get('baseline_n', 0)
+        self.baseline_mean = state.get('baseline_mean', 0.0)
+        self.baseline_m2 = state.get('baseline_m2', 0.0)
+        self.cusum_high = state.get('cusum_high', 0.0)
+        self.cusum_low = state.get('cusum_low', 0.0)
+        self.change_points = state.get('change_points', 0)
+        self.last_change_t = state.get('last_change_t')
+        self.last_change_flagged = state.get('last_change_flagged', False)
+
+    @property
+    def baseline_std(self) -> float:
+        return math.sqrt(self.baseline_m2 / (self.baseline_n - 1)) if self.baseline_n > 1 else 0.0
+
+    @property
+    def prediction_std(self) -> float:
+        """
+        The baseline standard deviation scaled to a new observation's 95%
+        prediction interval: sqrt(1 + 1/n) times the Student-t over the
+        normal quantile (Cornish-Fisher, within 2% from 4 degrees of freedom).
+        """
+        n = self.baseline_n
+        if n < 2:
+            return 0.0
+        z, dof = 1.959964, n - 1
+        t = z + (z ** 3 + z) / (4 * dof) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+        return self.baseline_std * math.sqrt(1 + 1 / n) * t / z
+
+    def add(self, t: float, value: float, k: float = 0.5, h: float = 5.0, min_baseline: int = 5) -> bool:
+        """Fold in one observation; returns whether it was flagged as a change point."""
+        changed = False
+        if self.baseline_n >= min_baseline:
+            # Constant baselines would make every deviation infinite; floor the scale
+            scale = max(self.prediction_std, 0.01 * abs(self.baseline_mean), 1e-9)
+            z = (value - self.baseline_mean) / scale
+            self.cusum_high = max(0.0, self.cusum_high + z - k)
+            self.cusum_low = max(0.0, self.cusum_low - z - k)
+            if self.cusum_high > h or self.cusum_low > h:
+                changed = True
+                self.change_points += 1
+                self.last_change_t = t
+                self.cusum_high = self.cusum_low = 0.0
+                self.baseline_n, self.baseline_mean, self.baseline_m2 = 0, 0.0, 0.0
+
+        self.baseline_n += 1
+        delta = value - self.baseline_mean
+        self.baseline_mean += delta / self.baseline_n
+        self.baseline_m2 += delta * (value - self.baseline_mean)
+
+        if self.count == 0:
+            self.first_t, self.first_value = t, value
+        self.previous_value = self.last_value
+        self.last_t, self.last_value = t, value
+        self.count += 1
+        self.recent = (self.recent + [value])[-self.window:]
+        # A single point about itself as pivot has all-zero sums; merging it skips a numpy fit
+        day = t / SECONDS_PER_DAY
+        self.trend.merge(LinearTrend(1, x_min=day, x_max=day, shift_x=day, shift_y=value))
+        self.last_change_flagged = changed
+        return changed
+
+    def state(self) -> Dict:
+        return {
+            'count': self.count, 'first_t': self.first_t, 'first_value': self.first_value,
+            'last_t': self.last_t, 'last_value': self.last_value, 'previous_value': self.previous_value,
+            'recent': self.recent, 'trend': self.trend.to_dict() if self.trend.n else None,
+            'baseline_n': self.baseline_n, 'baseline_mean': self.baseline_mean, 'baseline_m2': self.baseline_m2,
+            'cusum_high': self.cusum_high, 'cusum_low': self.cusum_low,
+            'change_points': self.change_points, 'last_change_t': self.last_change_t,
+            'last_change_flagged': self.last_change_flagged,
+        }
+
+    def summary(self) -> Dict:
+        """The trajectory of this metric as returned by the API."""
+        rolling_mean = sum(self.recent) / len(self.recent) if self.recent else None
+
+        def difference(a, b):
+            return a - b if a is not None and b is not None else None
+
+        return {
+            "count": self.count,
+            "first": {"t": self.first_t, "value": self.first_value},
+            "last": {"t": self.last_t, "value": self.last_value},
+            "delta_previous": difference(self.last_value, self.previous_value),
+            "delta_first": difference(self.last_value, self.first_value),
+            "rolling_mean": rolling_mean,
+            "rolling_window": len(self.recent),
+            "delta_rolling_mean": difference(self.last_value, rolling_mean),
+            "slope_per_day": self.trend.slope,
+            "trend_r2": self.trend.r2,
+            "baseline_mean": self.baseline_mean if self.baseline_n else None,
+            "baseline_std": self.baseline_std if self.baseline_n > 1 else None,
+            "change_points": self.change_points,
+            "last_change_t": self.last_change_t,
+            "change_detected": self.last_change_flagged,
+        }
+
+
+class LongitudinalStore:
+    """
+    Per-patient history of speech scores, speech features and handwriting
+    trend metrics, in SQLite.
+
+    Every write updates the metric's MetricAggregate (rolling mean, slope,
+    change points) in memory, so a patient's trajectory is answered from the
+    aggregates without reading past sessions. Observations and aggregate
+    states are written in batches: one transaction per `batch_size` writes or
+    `flush_interval` seconds (and on flush()/close()). Recently used
+    aggregates stay in memory, up to `max_cached`.
+    """
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 64, flush_interval: float = 5.0,
+                 window: int = 5, cusum_k: float = 0.5, cusum_h: float = 5.0, max_cached: int = 10000):
+        """
+        Args:
+            path: SQLite database file (None: in memory, lost on exit).
+            batch_size: Observations buffered before they are written.
+            flush_interval: Longest time, in seconds, an observation stays buffered (checked on write).
+            window: Number of recent values in the rolling mean.
+            cusum_k: CUSUM slack, in baseline standard deviations.
+            cusum_h: CUSUM alarm threshold, in baseline standard deviations.
+            max_cached: Aggregates kept in memory.
+        """
+        self.path = path or ':memory:'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.window = window
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.max_cached = max_cached
+        self._connection = None
+        self._lock = threading.RLock()
+        self._aggregates: 'OrderedDict[Tuple[str, str], MetricAggregate]' = OrderedDict()
+        self._dirty = set()
+        self._pending: List[Tuple[str, str, float, float]] = []
+        self._last_flush = time.monotonic()
+        self.writes = 0
+        self.flushes = 0
+
+    @classmethod
+    def from_environment(cls, **overrides) -> 'LongitudinalStore':
+        settings = {
+            'path': os.environ.get('PARKER_LONGITUDINAL_DB') or os.path.join(
+                os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')), 'parker', 'longitudinal.sqlite3'),
+            'batch_size': int(os.environ.get('PARKER_LONGITUDINAL_BATCH', 64)),
+            'flush_interval': float(os.environ.get('PARKER_LONGITUDINAL_FLUSH_INTERVAL', 5.0)),
+            'window': int(os.environ.get('PARKER_LONGITUDINAL_WINDOW', 5)),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.path != ':memory:' and os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _aggregate(self, user_id: str, metric: str, create: bool = True) -> Optional[MetricAggregate]:
+        """
+        The (cached) aggregate of a metric. A metric without history gets a new,
+        empty one, or None with `create=False`: reads must not cache anything
+        for names that were merely asked for.
+        """
+        key = (user_id, metric)
+        aggregate = self._aggregates.get(key)
+        if aggregate is not None:
+            self._aggregates.move_to_end(key)
+            return aggregate
+        row = self._db().execute('SELECT state FROM aggregates WHERE user_id = ? AND metric = ?',
+                                 key).fetchone()
+        if row is None and not create:
+            return None
+        aggregate = MetricAggregate(self.window, json.loads(row[0]) if row else None)
+        self._aggregates[key] = aggregate
+        while len(self._aggregates) > self.max_cached:
+            oldest = next(iter(self._aggregates))
+            if oldest in self._dirty:
+                self._flush()
+            self._aggregates.pop(oldest)
+        return aggregate
+
+    def record(self, user_id: str, values: Dict[str, Optional[float]], t: Optional[float] = None) -> Dict[str, bool]:
+        """
+        Add one session's metrics for `user_id` (missing and non-finite values are skipped).
+
+        Returns {metric: whether it was flagged as a change point}.
+        """
+        t = time.time() if t is None else float(t)
+        flags = {}
+        with self._lock:
+            for metric, value in values.items():
+                if not isinstance(value, numbers.Real) or not math.isfinite(value):
+                    continue
+                value = float(value)
+                aggregate = self._aggregate(user_id, metric)
+                flags[metric] = aggregate.add(t, value, self.cusum_k, self.cusum_h)
+                self._dirty.add((user_id, metric))
+                self._pending.append((user_id, metric, t, value))
+                self.writes += 1
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+        return flags
+
+    def _flush(self):
+        db = self._db()
+        states = [(user_id, metric, json.dumps(self._aggregates[(user_id, metric)].state()))
+                  for user_id, metric in self._dirty if (user_id, metric) in self._aggregates]
+        with db:
+            db.executemany('INSERT INTO observations (user_id, metric, t, value) VALUES (?, ?, ?, ?)',
+                           self._pending)
+            db.executemany('INSERT INTO aggregates (user_id, metric, state) VALUES (?, ?, ?) '
+                           'ON CONFLICT (user_id, metric) DO UPDATE SET state = excluded.state', states)
+        self._pending = []
+        self._dirty.clear()
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+
+    def flush(self):
+        with self._lock:
+            if self._pending or self._dirty:
+                self._flush()
+
+    def metrics(self, user_id: str) -> List[str]:
+        with self._lock:
+            cached = {metric for (user, metric) in self._aggregates if user == user_id}
+            stored = {row[0] for row in self._db().execute(
+                'SELECT metric FROM aggregates WHERE user_id = ?', (user_id,))}
+        return sorted(cached | stored)
+
+    def trajectory(self, user_id: str, metrics: Optional[Iterable[str]] = None, points: int = 0) -> Dict:
+        """
+        Rolling aggregates, slope and change points per metric for `user_id`,
+        plus the last `points` observations of each when asked for.
+        """
+        with self._lock:
+            names = list(metrics) if metrics else self.metrics(user_id)
+            result = {}
+            for metric in names:
+                aggregate = self._aggregate(user_id, metric, create=False)
+                if aggregate is not None and aggregate.count:
+                    result[metric] = aggregate.summary()
+            if points > 0 and result:
+                self.flush()
+                for metric, summary in result.items():
+                    rows = self._db().execute(
+                        'SELECT t, value FROM observations WHERE user_id = ? AND metric = ? '
+                        'ORDER BY t DESC LIMIT ?', (user_id, metric, points)).fetchall()
+                    summary["points"] = [{"t": t, "value": value} for t, value in reversed(rows)]
+        return {"user_id": user_id, "metrics": result}
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "writes": self.writes,
+                "flushes": self.flushes,
+                "pending": len(self._pending),
+                "cached_aggregates": len(self._aggregates),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                if self._pending or self._dirty:
+                    self._flush()
+                self._connection.close()
+                self._connection = None
+
+
+HANDWRITING_TREND_METRICS = ('token_width_slope', 'token_height_slope', 'spacing_slope',
+                             'width_pct_change', 'height_pct_change', 'spacing_pct_change')
+
+
+def speech_metrics(result: Dict) -> Dict[str, float]:
+    """The longitudinal metrics of one speech analysis: its score and scalar features."""
+    values = {'speech.score': result.get("score")}
+    for name, value in (result.get("features") or {}).items():
+        values[f'speech.{name}'] = value
+    return values
+
+
+def handwriting_metrics(result: Dict) -> Dict[str, float]:
+    """The longitudinal metrics of one handwriting analysis: its document and line trends."""
+    trends = result.get("trends") or {}
+    values = {f'handwriting.{name}': trends.get(name) for name in HANDWRITING_TREND_METRICS}
+    values['handwriting.shrinking_line_fraction'] = (result.get("line_trends") or {}).get("shrinking_line_fraction")
+    return values
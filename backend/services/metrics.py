@@ -0,0 +1,251 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Request and stage latencies, seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Request and response bodies, bytes (1 KB .. 64 MB)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in values]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observe() is a bisect plus two additions under a lock."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Sampled when rendered: `collect()` returns (label values, value) pairs."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 collect: Optional[Callable[[], Iterable[Tuple[Sequence[str], float]]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        try:
+            samples = list(self.collect()) if self.collect else []
+        except Exception as e:
+            print(f"Metric {self.name} could not be collected: {e}")
+            samples = []
+        for key, value in samples:
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class SampledCounter(Gauge):
+    """A counter whose running totals are kept elsewhere (e.g. by worker processes) and sampled when rendered."""
+
+    kind = 'counter'
+
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self, prefix: str = 'parker'):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None) -> Gauge:
+        return self._add(Gauge(f"{self.prefix}_{name}", documentation, labelnames, collect))
+
+    def sampled_counter(self, name, documentation, labelnames=(), collect=None) -> SampledCounter:
+        return self._add(SampledCounter(f"{self.prefix}_{name}", documentation, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class AnalysisMetrics:
+    """
+    The API server's metrics: per-endpoint requests, errors, latency and
+    payload sizes, admission queue waits and rejections, per-stage latency
+    of the speech and handwriting pipelines, and cache statistics reported by
+    the analysis workers.
+
+    Workers run in other processes, so their cache counters are sent back
+    with each task result (see analysis_tasks.worker_stats) and the latest
+    snapshot of every worker is summed here.
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        self.requests = self.registry.counter(
+            'http_requests_total', "HTTP requests by endpoint and status code.", ('endpoint', 'status'))
+        self.errors = self.registry.counter(
+            'http_request_errors_total', "HTTP requests answered with a 4xx/5xx status.", ('endpoint', 'status'))
+        self.latency = self.registry.histogram(
+            'http_request_duration_seconds', "Time to handle a request.", ('endpoint',))
+        self.request_size = self.registry.histogram(
+            'http_request_size_bytes', "Request body size.", ('endpoint',), SIZE_BUCKETS)
+        self.response_size = self.registry.histogram(
+            'http_response_size_bytes', "Response body size.", ('endpoint',), SIZE_BUCKETS)
+        self.admission_wait = self.registry.histogram(
+            'admission_wait_seconds', "Time a request waited in the admission queue for an analysis slot.",
+            ('endpoint',))
+        self.rejections = self.registry.counter(
+            'admission_rejections_total', "Requests turned away by admission control.", ('endpoint', 'reason'))
+        self.stages = self.registry.histogram(
+            'stage_duration_seconds', "Time spent in one analysis pipeline stage.", ('pipeline', 'stage'))
+        self.registry.sampled_counter('cache_hits_total', "Cache hits summed over the analysis processes.",
+                                      ('cache',), lambda: self._cache_samples('hits'))
+        self.registry.sampled_counter('cache_misses_total', "Cache misses summed over the analysis processes.",
+                                      ('cache',), lambda: self._cache_samples('misses'))
+        self.registry.gauge('cache_hit_ratio', "hits / (hits + misses) per cache.",
+                            ('cache',), self._cache_ratios)
+        self._worker_stats: Dict[int, Dict[str, Dict[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def observe_request(self, endpoint: str, status: int, seconds: float,
+                        request_bytes: int = 0, response_bytes: int = 0):
+        self.requests.inc(endpoint=endpoint, status=status)
+        if status >= 400:
+            self.errors.inc(endpoint=endpoint, status=status)
+        self.latency.observe(seconds, endpoint=endpoint)
+        self.request_size.observe(request_bytes, endpoint=endpoint)
+        self.response_size.observe(response_bytes, endpoint=endpoint)
+
+    def observe_admission(self, endpoint: str, waited: float):
+        self.admission_wait.observe(waited, endpoint=endpoint)
+
+    def observe_rejection(self, endpoint: str, reason: str):
+        self.rejections.inc(endpoint=endpoint, reason=reason)
+
+    def observe_stages(self, pipeline: str, timings: Optional[Dict[str, float]], scale: float = 1.0):
+        """Record stage timings (seconds, or milliseconds with scale=0.001)."""
+        for stage, value in (timings or {}).items():
+            if value is not None:
+                self.stages.observe(value * scale, pipeline=pipeline, stage=stage)
+
+    def record_worker(self, stats: Optional[Dict]):
+        """Keep the latest cache counters of one analysis process ({"pid": ..., "caches": {...}})."""
+        if stats:
+            with self._lock:
+                self._worker_stats[stats["pid"]] = stats.get("caches", {})
+
+    def _cache_totals(self) -> Dict[str, Dict[str, int]]:
+        totals: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for caches in self._worker_stats.values():
+                for cache, counts in caches.items():
+                    total = totals.setdefault(cache, {"hits": 0, "misses": 0})
+                    total["hits"] += counts.get("hits", 0)
+                    total["misses"] += counts.get("misses", 0)
+        return totals
+
+    def _cache_samples(self, field: str):
+        return [((cache,), counts[field]) for cache, counts in sorted(self._cache_totals().items())]
+
+    def _cache_ratios(self):
+        return [((cache,), counts["hits"] / (counts["hits"] + counts["misses"]))
+                for cache, counts in sorted(self._cache_totals().items()) if counts["hits"] + counts["misses"]]
+
+    def gauge(self, name, documentation, collect, labelnames=()) -> Gauge:
+        return self.registry.gauge(name, documentation, labelnames, collect)
+
+    def sampled_counter(self, name, documentation, collect, labelnames=()) -> SampledCounter:
+        return self.registry.sampled_counter(name, documentation, labelnames, collect)
+
+    def render(self) -> str:
+        return self.registry.render()
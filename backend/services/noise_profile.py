@@ -0,0 +1,251 @@
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _amp_to_db(x, top_db=80.0, eps=np.finfo(np.float64).eps):
+    """Convert STFT magnitudes to dB, clipped to `top_db` below each bin's peak (as noisereduce does)."""
+    x_db = 20 * np.log10(np.abs(x) + eps)
+    return np.maximum(x_db, np.max(x_db, axis=-1, keepdims=True) - top_db)
+
+
+def _smoothing_filter(n_grad_freq, n_grad_time):
+    """Triangular 2D filter used to smooth the spectral gate mask."""
+    smoothing_filter = np.outer(
+        np.concatenate([
+            np.linspace(0, 1, n_grad_freq + 1, endpoint=False),
+            np.linspace(1, 0, n_grad_freq + 2),
+        ])[1:-1],
+        np.concatenate([
+            np.linspace(0, 1, n_grad_time + 1, endpoint=False),
+            np.linspace(1, 0, n_grad_time + 2),
+        ])[1:-1],
+    )
+    return smoothing_filter / np.sum(smoothing_filter)
+
+
+class NoiseProfile:
+    """
+    Compact stationary noise spectrum for one user/device.
+
+    Holds the per-frequency mean and standard deviation of the noise in dB
+    (n_fft // 2 + 1 values each) plus the scalar floor level that was measured
+    when the profile was learned, which is what drift is checked against.
+    """
+
+    def __init__(self, mean_db, std_db, floor_db, sr, n_fft, updated_at=None, uses=0):
+        self.mean_db = np.asarray(mean_db, dtype=np.float32)
+        self.std_db = np.asarray(std_db, dtype=np.float32)
+        self.floor_db = float(floor_db)
+        self.sr = int(sr)
+        self.n_fft = int(n_fft)
+        self.updated_at = updated_at if updated_at is not None else time.time()
+        self.uses = int(uses)
+
+    def matches(self, sr, n_fft):
+        return self.sr == sr and self.n_fft == n_fft
+
+    def threshold(self, n_std_thresh):
+        return self.mean_db + self.std_db * n_std_thresh
+
+    def to_arrays(self):
+        return {
+            'mean_db': self.mean_db,
+            'std_db': self.std_db,
+            'meta': np.array([self.floor_db, self.sr, self.n_fft, self.updated_at, self.uses], dtype=np.float64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        floor_db, sr, n_fft, updated_at, uses = arrays['meta']
+        return cls(arrays['mean_db'], arrays['std_db'], floor_db, sr, n_fft, updated_at, uses)
+
+
+class NoiseProfileStore:
+    """
+    Learns and reuses stationary noise profiles keyed by user/device.
+
+    The first recording for a key estimates the noise statistics from the
+    recording itself (as `nr.reduce_noise(stationary=True)` does) and stores
+    them. Later recordings gate against the stored profile and skip
+    the estimation pass; the profile is re-learned when the measured noise
+    floor drifts more than `drift_db` away from the stored one.
+
+    Profiles live in a bounded in-memory LRU and, if `directory` is given, are
+    also written to disk, when learned or refreshed, so they survive restarts
+    and are shared between worker processes. A profile's `uses` only counts
+    on disk up to its last write.
+    """
+
+    def __init__(self, directory=None, max_profiles=1024, drift_db=6.0, floor_percentile=10):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.drift_db = drift_db
+        self.floor_percentile = floor_percentile
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.npz")
+
+    def get(self, key):
+        """Return the stored profile for `key`, or None."""
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is not None:
+                self._profiles.move_to_end(key)
+                return profile
+
+        if not self.directory:
+            return None
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as arrays:
+                profile = NoiseProfile.from_arrays(arrays)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable noise profile {path}: {e}")
+            return None
+
+        self._remember(key, profile)
+        return profile
+
+    def put(self, key, profile):
+        """Store `profile` for `key` in memory and, if configured, on disk."""
+        self._remember(key, profile)
+        if self.directory:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **profile.to_arrays())
+            os.replace(tmp_path, path)
+
+    def _remember(self, key, profile):
+        with self._lock:
+            self._profiles[key] = profile
+            self._profiles.move_to_end(key)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def measure_floor(self, sig_stft_db):
+        """Scalar noise floor: the mean level of the quietest frames, in dB."""
+        frame_levels = np.mean(sig_stft_db, axis=0)
+        return float(np.percentile(frame_levels, self.floor_percentile))
+
+    def learn(self, noise_stft_db, sr, n_fft, floor_db=None):
+        """Estimate a profile from the dB spectrogram of (the noise part of) a recording."""
+        return NoiseProfile(
+            mean_db=np.mean(noise_stft_db, axis=1),
+            std_db=np.std(noise_stft_db, axis=1),
+            floor_db=self.measure_floor(noise_stft_db) if floor_db is None else floor_db,
+            sr=sr,
+            n_fft=n_fft,
+        )
+
+    def reduce_noise(self, key, y, sr, prop_decrease=1.0, n_fft=1024, n_std_thresh=1.5,
+                     freq_mask_smooth_hz=500, time_mask_smooth_ms=50, chunk_size=600000, padding=30000):
+        """
+        Stationary spectral gating against the cached profile for `key`.
+
+        Gives the same output as `nr.reduce_noise(stationary=True)` with the
+        same defaults: the recording is gated in chunks of `chunk_size`
+        samples, each extended by `padding` samples of its neighbours (zeros
+        at the ends) and trimmed back after the inverse STFT, and the noise
+        statistics are those of the first `chunk_size` samples. They come from
+        the stored profile, though, so that STFT pass is skipped unless no
+        profile exists yet or the floor has drifted.
+        """
+        from scipy.signal import stft, istft, fftconvolve
+
+        win_length = n_fft
+        hop_length = win_length // 4
+        noverlap = win_length - hop_length
+
+        def spectrogram(signal):
+            return stft(signal, nfft=n_fft, noverlap=noverlap, nperseg=win_length, padded=False)[2]
+
+        def padded_chunk(start, end):
+            chunk = np.zeros(end - start + 2 * padding)
+            lo, hi = max(start - padding, 0), min(end + padding, len(y))
+            chunk[lo - start + padding:hi - start + padding] = y[lo:hi]
+            return chunk
+
+        y = np.asarray(y)
+        chunks = [(start, min(start + chunk_size, len(y))) for start in range(0, len(y), chunk_size)]
+        if not chunks:
+            return y.copy()
+
+        # The floor is measured on the frames of the first chunk that lie entirely inside the recording
+        first_stft = spectrogram(padded_chunk(*chunks[0]))
+        first_stft_db = _amp_to_db(first_stft)
+        inside = first_stft_db[:, -(-(padding + win_length // 2) // hop_length):
+                               (padding + chunks[0][1] - win_length // 2) // hop_length + 1]
+        floor_db = self.measure_floor(inside if inside.shape[1] else first_stft_db)
+
+        profile = self.get(key)
+        if profile is not None and not profile.matches(sr, n_fft):
+            profile = None
+
+        if profile is None or abs(floor_db - profile.floor_db) > self.drift_db:
+            with self._lock:
+                if profile is None:
+                    self.misses += 1
+                else:
+                    self.refreshes += 1
+            profile = self.learn(_amp_to_db(spectrogram(y[:chunk_size])), sr, n_fft, floor_db=floor_db)
+            profile.uses += 1
+            self.put(key, profile)
+        else:
+            # A hit only counts the use in memory; the file is rewritten when the profile is re-learned
+            with self._lock:
+                self.hits += 1
+                profile.uses += 1
+
+        threshold = profile.threshold(n_std_thresh)[:, np.newaxis]
+        n_grad_freq = int(freq_mask_smooth_hz / (sr / (n_fft / 2))) if freq_mask_smooth_hz else 1
+        n_grad_time = int(time_mask_smooth_ms / ((hop_length / sr) * 1000)) if time_mask_smooth_ms else 1
+        smoothing = None
+        if n_grad_freq > 1 or n_grad_time > 1:
+            smoothing = _smoothing_filter(max(n_grad_freq, 1), max(n_grad_time, 1))
+
+        y_denoised = np.zeros(len(y), dtype=y.dtype)
+        for number, (start, end) in enumerate(chunks):
+            if number == 0:
+                sig_stft, sig_stft_db = first_stft, first_stft_db
+            else:
+                sig_stft = spectrogram(padded_chunk(start, end))
+                sig_stft_db = _amp_to_db(sig_stft)
+
+            # Mask every bin that is above the noise threshold, keep (1 - prop_decrease) of the rest
+            sig_mask = sig_stft_db > threshold
+            sig_mask = sig_mask * prop_decrease + (1.0 - prop_decrease)
+            if smoothing is not None:
+                sig_mask = fftconvolve(sig_mask, smoothing, mode="same")
+
+            _, denoised = istft(sig_stft * sig_mask, nfft=n_fft, noverlap=noverlap, nperseg=win_length)
+            denoised = denoised[padding:padding + end - start]
+            y_denoised[start:start + len(denoised)] = denoised
+        return y_denoised
+
+    def status(self):
+        with self._lock:
+            return {
+                "cached_profiles": len(self._profiles),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "persistent": bool(self.directory),
+            }
@@ -0,0 +1,237 @@
+import hashlib
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import msgpack
+
+from .document_ai_parser import DocumentSubset
+
+FORMAT_VERSION = 1
+
+
+def compact_document(document: Dict) -> bytes:
+    """
+    Encode the token-relevant part of a Document AI document as zlib'd msgpack.
+
+    Per page only the page number, dimension and, per token, the first text
+    segment (start/end index), the bounding-box vertex coordinates, the layout
+    confidence and the detected break type are kept. Absent fields are stored
+    as None so `expand_document` gives extract_token_data exactly the same
+    input; tokens without a text anchor keep their slot because the token
+    index is used as its position.
+    """
+    if 'document' in document:
+        document = document['document']
+
+    pages = []
+    for page in document.get('pages', []):
+        tokens = []
+        for token in page.get('tokens', []):
+            layout = token.get('layout', {})
+            segments = layout.get('textAnchor', {}).get('textSegments', [])
+            if not segments:
+                tokens.append(None)
+                continue
+            segment = segments[0]
+            start = segment.get('startIndex')
+            end = segment.get('endIndex')
+            vertices = layout.get('boundingPoly', {}).get('vertices', [])
+            tokens.append([
+                None if start is None else int(start),
+                None if end is None else int(end),
+                [v.get('x') for v in vertices],
+                [v.get('y') for v in vertices],
+                layout.get('confidence'),
+                token.get('detectedBreak', {}).get('type'),
+            ])
+        pages.append({
+            'pageNumber': page.get('pageNumber'),
+            'dimension': page.get('dimension'),
+            'tokens': tokens,
+        })
+
+    payload = {'version': FORMAT_VERSION, 'text': document.get('text', ''), 'pages': pages}
+    return zlib.compress(msgpack.packb(payload, use_bin_type=True), 6)
+
+
+def expand_document(blob: bytes) -> DocumentSubset:
+    """Rebuild the Document AI dict shape from `compact_document` output."""
+    payload = msgpack.unpackb(zlib.decompress(blob), raw=False)
+    if payload.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported OCR cache format: {payload.get('version')}")
+
+    pages = []
+    for compact_page in payload['pages']:
+        tokens = []
+        for compact_token in compact_page['tokens']:
+            if compact_token is None:
+                tokens.append({'layout': {}})
+                continue
+            start, end, xs, ys, confidence, break_type = compact_token
+            segment = {}
+            if start is not None:
+                segment['startIndex'] = start
+            if end is not None:
+                segment['endIndex'] = end
+            vertices = []
+            for x, y in zip(xs, ys):
+                vertex = {}
+                if x is not None:
+                    vertex['x'] = x
+                if y is not None:
+                    vertex['y'] = y
+                vertices.append(vertex)
+            layout = {'textAnchor': {'textSegments': [segment]}, 'boundingPoly': {'vertices': vertices}}
+            if confidence is not None:
+                layout['confidence'] = confidence
+            token = {'layout': layout}
+            if break_type is not None:
+                token['detectedBreak'] = {'type': break_type}
+            tokens.append(token)
+
+        page = {'tokens': tokens}
+        if compact_page['pageNumber'] is not None:
+            page['pageNumber'] = compact_page['pageNumber']
+        if compact_page['dimension'] is not None:
+            page['dimension'] = compact_page['dimension']
+        pages.append(page)
+
+    return {'text': payload['text'], 'pages': pages}
+
+
+class OcrResponseCache:
+    """
+    Size-bounded cache of Document AI responses, keyed by image content.
+
+    The key is a SHA-256 of the image bytes, mime type and processor name, so
+    re-submitting the same image (retries, re-analysis after the analysis code
+    changed) needs no OCR call. Entries are stored compacted (see
+    `compact_document`), one file each under `directory`, or in memory when no
+    directory is given. The least recently used entries are evicted once the
+    total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._blobs: Dict[str, bytes] = {}  # memory-only mode
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_index()
+
+    @staticmethod
+    def key(content: bytes, mime_type: str, processor_name: str) -> str:
+        digest = hashlib.sha256()
+        for part in (mime_type.encode('utf-8'), processor_name.encode('utf-8')):
+            digest.update(len(part).to_bytes(4, 'big'))
+            digest.update(part)
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.ocr")
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files already on disk (oldest access first)."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.ocr'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-len('.ocr')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[DocumentSubset]:
+        """The cached document for `key`, or None."""
+        blob = self._read(key)
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return expand_document(blob)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            with self._lock:
+                blob = self._blobs.get(key)
+                if blob is not None:
+                    self._entries.move_to_end(key)
+                return blob
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            return None
+        with self._lock:
+            # The file may have been written by another worker process
+            if key not in self._entries:
+                self._entries[key] = len(blob)
+                self._total_bytes += len(blob)
+            self._entries.move_to_end(key)
+        return blob
+
+    def put(self, key: str, document: Dict):
+        """Store the token-relevant subset of `document` under `key`."""
+        blob = compact_document(document)
+        if self.directory:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(blob)
+            self._total_bytes += len(blob)
+            if not self.directory:
+                self._blobs[key] = blob
+            self._evict()
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+            self._blobs.pop(key, None)
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._blobs.pop(key, None)
+            self.evictions += 1
+            if self.directory:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,270 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from google.api_core import exceptions as google_exceptions
+from tenacity import (Retrying, retry_if_exception_type, stop_after_attempt,
+                      stop_after_delay, wait_random_exponential)
+
+from .document_ai_parser import parse_document_ai_json
+from .ocr_cache import OcrResponseCache
+from .image_preprocessor import ImagePreprocessor, PreparedImage
+
+if TYPE_CHECKING:
+    # The generated Document AI client takes ~0.25 s to import; only processes
+    # that actually OCR (and preload) load it
+    from google.cloud import documentai_v1 as documentai
+
+logger = logging.getLogger('DocumentAIClient')
+
+# Transient failures worth another attempt; everything else (bad request,
+# permission denied, ...) is raised straight away.
+RETRYABLE_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.Aborted,
+)
+
+
+class DocumentAIClient:
+    """
+    Shared, concurrent client for the Document AI OCR processor.
+
+    One DocumentProcessorServiceClient (and so one gRPC channel) is created
+    and reused for every request. Pages can be submitted concurrently, up to
+    `max_concurrency` in flight at once. Each page gets a total `deadline`
+    (seconds) covering all of its attempts; transient errors are retried with
+    exponential backoff and full jitter.
+
+    Set `endpoint` to "host:port" to talk plain-text gRPC to a local stand-in
+    server (see fake_document_ai.py) instead of Google. With a `cache`,
+    process() answers repeated images from it without any OCR call. With a
+    `preprocessor`, images are shrunk before upload and the token boxes of
+    the result are mapped back to original image coordinates.
+    """
+
+    def __init__(self, project_id="161834410341", location="us", processor_id="70bb36ae806d4e58",
+                 credentials_path=None, endpoint=None, max_concurrency=4, deadline=60.0,
+                 attempt_timeout=30.0, max_attempts=5, backoff_max=8.0, language_hints=("en", "us"),
+                 cache: Optional[OcrResponseCache] = None, preprocessor: Optional[ImagePreprocessor] = None):
+        """
+        Args:
+            project_id (str): Google Cloud Project ID.
+            location (str): Processing location (e.g., "us", "eu").
+            processor_id (str): Document AI processor ID.
+            credentials_path (str): Service account JSON file; defaults to the environment's credentials.
+            endpoint (str): "host:port" of a local, insecure Document AI server.
+            max_concurrency (int): Maximum number of requests in flight.
+            deadline (float): Seconds allowed per page, across all attempts.
+            attempt_timeout (float): Seconds allowed for a single attempt.
+            max_attempts (int): Maximum attempts per page.
+            backoff_max (float): Upper bound of the backoff between attempts, in seconds.
+            language_hints (tuple): OCR language hints sent with every request.
+            cache (OcrResponseCache): Optional cache of responses keyed by image content.
+            preprocessor (ImagePreprocessor): Optional image shrinking before upload.
+        """
+        self.processor_name = f"projects/{project_id}/locations/{location}/processors/{processor_id}"
+        self.location = location
+        self.credentials_path = credentials_path
+        self.endpoint = endpoint
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff_max = backoff_max
+        self.language_hints = list(language_hints)
+        self.cache = cache
+        self.preprocessor = preprocessor
+
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='documentai')
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+
+    @classmethod
+    def from_environment(cls, **overrides) -> 'DocumentAIClient':
+        """Build a client from PARKER_DOCUMENT_AI_* / PARKER_OCR_* environment variables."""
+        settings = {
+            'credentials_path': os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'),
+            'endpoint': os.environ.get('PARKER_DOCUMENT_AI_ENDPOINT'),
+            'max_concurrency': int(os.environ.get('PARKER_OCR_CONCURRENCY', 4)),
+            'deadline': float(os.environ.get('PARKER_OCR_DEADLINE', 60.0)),
+            'attempt_timeout': float(os.environ.get('PARKER_OCR_ATTEMPT_TIMEOUT', 30.0)),
+            'max_attempts': int(os.environ.get('PARKER_OCR_MAX_ATTEMPTS', 5)),
+            'cache': OcrResponseCache(
+                directory=os.environ.get('PARKER_OCR_CACHE_DIR'),
+                max_bytes=int(os.environ.get('PARKER_OCR_CACHE_MAX_MB', 256)) * 1024 * 1024,
+            ),
+            'preprocessor': ImagePreprocessor.from_environment(),
+        }
+        for key, env in (('project_id', 'PARKER_DOCUMENT_AI_PROJECT'),
+                         ('location', 'PARKER_DOCUMENT_AI_LOCATION'),
+                         ('processor_id', 'PARKER_DOCUMENT_AI_PROCESSOR')):
+            if os.environ.get(env):
+                settings[key] = os.environ[env]
+        settings.update(overrides)
+        return cls(**settings)
+
+    @property
+    def client(self) -> 'documentai.DocumentProcessorServiceClient':
+        """The underlying gRPC client, created once on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self) -> 'documentai.DocumentProcessorServiceClient':
+        from google.cloud import documentai_v1 as documentai
+
+        if self.endpoint:
+            import grpc
+            from google.cloud.documentai_v1.services.document_processor_service.transports import (
+                DocumentProcessorServiceGrpcTransport)
+            # Same unlimited message sizes as the transport's own Google channel
+            channel = grpc.insecure_channel(self.endpoint, options=[('grpc.max_receive_message_length', -1),
+                                                                    ('grpc.max_send_message_length', -1)])
+            transport = DocumentProcessorServiceGrpcTransport(channel=channel)
+            logger.info(f"Using local Document AI server at {self.endpoint}")
+            return documentai.DocumentProcessorServiceClient(transport=transport)
+
+        credentials = None
+        if self.credentials_path and os.path.exists(self.credentials_path):
+            from google.oauth2 import service_account
+            credentials = service_account.Credentials.from_service_account_file(self.credentials_path)
+        from google.api_core.client_options import ClientOptions
+        options = ClientOptions(api_endpoint=f"{self.location}-documentai.googleapis.com")
+        return documentai.DocumentProcessorServiceClient(credentials=credentials, client_options=options)
+
+    def build_request(self, content: bytes, mime_type: str) -> 'documentai.ProcessRequest':
+        from google.cloud import documentai_v1 as documentai
+
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        ocr_config = documentai.OcrConfig(hints=documentai.OcrConfig.Hints(language_hints=self.language_hints))
+        return documentai.ProcessRequest(
+            name=self.processor_name,
+            raw_document=documentai.RawDocument(content=content, mime_type=mime_type),
+            process_options=documentai.ProcessOptions(ocr_config=ocr_config),
+            imageless_mode=True,
+        )
+
+    def process_raw(self, content: bytes, mime_type: str = "image/jpeg") -> 'documentai.Document':
+        """
+        OCR one page and return the Document proto.
+
+        Raises the last google.api_core exception once the attempts or the
+        deadline run out.
+        """
+        request = self.build_request(content, mime_type)
+        started = time.monotonic()
+        attempts = 0
+
+        retrying = Retrying(
+            retry=retry_if_exception_type(RETRYABLE_ERRORS),
+            stop=stop_after_attempt(self.max_attempts) | stop_after_delay(self.deadline),
+            wait=wait_random_exponential(multiplier=0.5, max=self.backoff_max),
+            reraise=True,
+        )
+        try:
+            for attempt in retrying:
+                with attempt:
+                    attempts += 1
+                    remaining = self.deadline - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise google_exceptions.DeadlineExceeded(
+                            f"OCR deadline of {self.deadline}s exceeded after {attempts - 1} attempts")
+                    # Our own retry loop replaces the library's default retry policy
+                    response = self.client.process_document(
+                        request=request, retry=None, timeout=min(self.attempt_timeout, remaining))
+        except Exception:
+            self._count(attempts, failed=True)
+            raise
+
+        self._count(attempts)
+        return response.document
+
+    def cached(self, content: bytes, mime_type: str = "image/jpeg") -> Tuple[Optional[str], Optional[Dict]]:
+        """(cache key of the image, its cached OCR result or None); (None, None) without a cache."""
+        if self.cache is None:
+            return None, None
+        key = self.cache.key(content, mime_type, self.processor_name)
+        return key, self.cache.get(key)
+
+    def process(self, content: bytes, mime_type: str = "image/jpeg", cache_key: Optional[str] = None,
+                prepared: Optional[PreparedImage] = None) -> Dict:
+        """
+        OCR one page and return it in the Document AI JSON shape used by the analysis services.
+
+        The cache is keyed by the original image. A caller that already looked
+        `content` up with cached() passes the `cache_key` it got (the lookup
+        is not repeated) and may pass its own preprocessing of `content` as
+        `prepared`: that image is uploaded and the token boxes are mapped back
+        to `content`'s coordinates before the result is cached.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if self.cache is not None and cache_key is None:
+            cache_key, cached = self.cached(content, mime_type)
+            if cached is not None:
+                return cached
+
+        if prepared is None and self.preprocessor is not None:
+            prepared = self.preprocessor.prepare(content, mime_type)
+            started = time.perf_counter()
+            document = self.process_raw(prepared.content, prepared.mime_type)
+            self.preprocessor.record_ocr_latency(prepared, time.perf_counter() - started)
+        elif prepared is not None:
+            document = self.process_raw(prepared.content, prepared.mime_type)
+        else:
+            document = self.process_raw(content, mime_type)
+        from google.cloud import documentai_v1 as documentai
+        result = parse_document_ai_json(documentai.Document.to_json(document, use_integers_for_enums=False))
+        if prepared is not None:
+            prepared.rescale_document(result)
+        if self.cache is not None:
+            self.cache.put(cache_key, result)
+        return result
+
+    def submit(self, content: bytes, mime_type: str = "image/jpeg", **options) -> Future:
+        """Queue a page; the returned future resolves to the same dict as process() (same options)."""
+        return self._executor.submit(self.process, content, mime_type, **options)
+
+    def process_many(self, pages: Sequence[Tuple[bytes, str]]) -> List[Dict]:
+        """OCR several (content, mime_type) pages concurrently, results in input order."""
+        futures = [self.submit(content, mime_type) for content, mime_type in pages]
+        return [future.result() for future in futures]
+
+    def _count(self, attempts: int, failed: bool = False):
+        with self._stats_lock:
+            self._requests += 1
+            self._retries += max(attempts - 1, 0)
+            if failed:
+                self._failures += 1
+
+    def status(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "endpoint": self.endpoint or f"{self.location}-documentai.googleapis.com",
+                "max_concurrency": self.max_concurrency,
+                "deadline_s": self.deadline,
+                "requests": self._requests,
+                "retries": self._retries,
+                "failures": self._failures,
+                "cache": self.cache.status() if self.cache is not None else None,
+                "preprocessing": self.preprocessor.status() if self.preprocessor is not None else None,
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._client is not None:
+            self._client.transport.close()
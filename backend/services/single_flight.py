@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def request_key(*parts) -> str:
+    """Stable hash of a request's payload and parameters (bytes, str or None parts)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b'\x00'
+        elif isinstance(part, str):
+            part = part.encode('utf-8')
+        elif not isinstance(part, bytes):
+            part = str(part).encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class IdempotencyConflict(ValueError):
+    """An idempotency key was reused for a different request."""
+
+
+class _Call:
+    def __init__(self, event):
+        self.event = event
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls: while `fn` runs for a key, other
+    callers with the same key wait for that call's result (or exception)
+    instead of starting their own.
+
+    Results are shared between the callers, so they must not be mutated.
+    In `cooperative` mode (gevent front end without monkey patching) waiters
+    park on a gevent Event instead of blocking the hub.
+    """
+
+    def __init__(self, cooperative: bool = False):
+        self.cooperative = cooperative
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _event(self):
+        if self.cooperative:
+            from gevent.event import Event
+            return Event()
+        return threading.Event()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(result of fn, whether it was shared with an identical call already in flight)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call(self._event())
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "waiting": sum(call.waiters for call in self._calls.values()),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+            }
+
+
+class IdempotencyCache:
+    """
+    Completed results by client-supplied idempotency key, kept for `ttl`
+    seconds (at most `max_entries`, least recently stored evicted).
+
+    Each entry remembers the hash of the request it answered, so reusing a
+    key for a different payload can be refused instead of replaying the
+    wrong result.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires, request hash, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_environment(cls, **overrides) -> 'IdempotencyCache':
+        settings = {
+            'ttl': float(os.environ.get('PARKER_IDEMPOTENCY_TTL', 600)),
+            'max_entries': int(os.environ.get('PARKER_IDEMPOTENCY_MAX_ENTRIES', 1024)),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def get(self, key: str, request_hash: str) -> Optional[Any]:
+        """
+        The stored result for `key`, or None.
+
+        Raises IdempotencyConflict if `key` was used for a different request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] != request_hash:
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: str, request_hash: str, result: Any):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, request_hash, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
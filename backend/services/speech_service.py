@@ -1,23 +1,95 @@
-import librosa
+import io
+import os
+import time
+import wave
 import numpy as np
-import soundfile as sf
-from scipy.signal import butter, lfilter
-import noisereduce as nr
 import tempfile
+from .noise_profile import NoiseProfileStore
 
 class SpeechAnalysisService:
-    def __init__(self):
-        pass
+    # librosa, scipy.signal and noisereduce take seconds to import (numba,
+    # scipy.stats) and are only needed once audio is analyzed, so they are
+    # imported on first use. Preload them with services.startup.preload().
+
+    def __init__(self, noise_profiles=None):
+        # Learned per user/device noise spectra, reused for stationary denoising
+        self.noise_profiles = noise_profiles if noise_profiles is not None else NoiseProfileStore()
+        self.warm_up_seconds = None
+        self.warm_up_ok = None
+
+    def status(self):
+        return {
+            "status": "Service is running.",
+            "warm_up_s": self.warm_up_seconds,
+            "warm_up_ok": self.warm_up_ok,
+            "numba_cache_dir": os.environ.get('NUMBA_CACHE_DIR'),
+        }
+
+    @staticmethod
+    def synthetic_vowel(seconds=3.0, sr=16000, f0=120.0, seed=0):
+        """
+        WAV bytes of a sustained /a/-like vowel: a harmonic series on a slightly
+        jittered f0, shaped by three formant peaks, with a little breath noise.
+        """
+        rng = np.random.default_rng(seed)
+        t = np.arange(int(seconds * sr)) / sr
+        # 5 Hz vibrato keeps pitch tracking and LPC on realistic input
+        phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.01 * np.sin(2 * np.pi * 5 * t))) / sr
+        y = np.zeros_like(t)
+        for harmonic in range(1, int(4000 // f0)):
+            frequency = harmonic * f0
+            gain = sum(np.exp(-((frequency - formant) / 120.0) ** 2) for formant in (700, 1220, 2600))
+            y += (gain + 0.05) / harmonic * np.sin(harmonic * phase)
+        y += 0.01 * rng.standard_normal(len(t))
+        y = 0.5 * y / np.max(np.abs(y))
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sr)
+            f.writeframes((y * 32767).astype('<i2').tobytes())
+        return buffer.getvalue()
+
+    def warm_up(self, seconds=3.0):
+        """
+        Run one analysis on a synthetic vowel so librosa's numba kernels are
+        compiled (or loaded from NUMBA_CACHE_DIR) and the FFT plans are built
+        before the first real request. Returns the seconds it took.
+        """
+        started = time.perf_counter()
+        results = self.analyze_audio(self.synthetic_vowel(seconds))
+        if results is not None:
+            self.calculate_updrs_score(results)
+        self.warm_up_seconds = round(time.perf_counter() - started, 3)
+        self.warm_up_ok = results is not None
+        return self.warm_up_seconds
 
     def butter_bandpass(self, lowcut=80, highcut=500, fs=16000, order=5):
+        from scipy.signal import butter
+
         nyq = 0.5 * fs
         low = lowcut / nyq
         high = highcut / nyq
         b, a = butter(order, [low, high], btype='band')
         return b, a
 
-    def analyze_audio(self, audio_bytes):
-        """Analyze audio with enhanced PD-specific feature extraction"""
+    def analyze_audio(self, audio_bytes, noise_key=None):
+        """
+        Analyze audio with enhanced PD-specific feature extraction
+
+        Args:
+            audio_bytes (bytes): Raw audio file content.
+            noise_key (str): Optional user/device key. When given, the stationary
+                noise profile learned from earlier recordings with the same key is
+                reused instead of being re-estimated.
+        """
+        import librosa
+        from scipy.signal import lfilter
+
+        # Seconds per stage, returned with the results (for the stage histograms in /metrics)
+        timings = {}
+        stage = time.perf_counter()
         try:
             # Save temporary file
             with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmpfile:
@@ -31,29 +103,46 @@ class SpeechAnalysisService:
             if sr != 16000:
                 y = librosa.resample(y, orig_sr=sr, target_sr=16000)
                 sr = 16000
+            timings['decode'] = time.perf_counter() - stage
 
             # Validate audio length
             if len(y)/sr < 3:
                 return None
                 
             # Enhanced noise reduction
-            y_denoised = nr.reduce_noise(
-                y=y, sr=sr, stationary=True, 
-                prop_decrease=0.9, n_fft=1024
-            )
+            stage = time.perf_counter()
+            if noise_key:
+                y_denoised = self.noise_profiles.reduce_noise(
+                    noise_key, y, sr,
+                    prop_decrease=0.9, n_fft=1024
+                )
+            else:
+                import noisereduce as nr
+                y_denoised = nr.reduce_noise(
+                    y=y, sr=sr, stationary=True, 
+                    prop_decrease=0.9, n_fft=1024
+                )
             
+            timings['denoise'] = time.perf_counter() - stage
+
             # Bandpass filter focused on speech frequencies
+            stage = time.perf_counter()
             b, a = self.butter_bandpass(fs=sr)
             y_filtered = lfilter(b, a, y_denoised)
+            timings['filter'] = time.perf_counter() - stage
 
             # Feature extraction --------
             # 1. Pitch analysis with tremor detection
+            stage = time.perf_counter()
             pitches = librosa.yin(y_filtered, fmin=50, fmax=300, sr=sr)
             valid_pitches = pitches[(pitches > 0) & (pitches < 300)]
             pitch_mean = np.mean(valid_pitches) if len(valid_pitches) > 0 else 0
             pitch_var = np.std(valid_pitches) if len(valid_pitches) > 0 else 0
 
+            timings['pitch'] = time.perf_counter() - stage
+
             # 2. Volume analysis with tremor modulation
+            stage = time.perf_counter()
             rms = librosa.feature.rms(y=y_filtered, frame_length=2048, hop_length=512)
             rms_mean = np.mean(rms)  # Convert to scalar
             volume_var = np.std(rms) * 100  # Convert to percentage
@@ -63,7 +152,10 @@ class SpeechAnalysisService:
             rms_db = librosa.amplitude_to_db(rms, ref=np.max)
             volume_var_db = np.std(rms_db)  # Volume variability in dB
 
+            timings['volume'] = time.perf_counter() - stage
+
             # 3. Formant analysis with LPC stabilization
+            stage = time.perf_counter()
             formants = []
             for i in range(0, len(y_filtered), int(sr*0.03)):  # 30ms windows
                 frame = y_filtered[i:i+int(sr*0.03)]
@@ -79,6 +171,7 @@ class SpeechAnalysisService:
 
             formant_mean = np.mean(formants) if formants else 0
             formant_var = np.std(formants) if formants else 0
+            timings['formants'] = time.perf_counter() - stage
 
             # 4. Additional features: Jitter, Shimmer, HNR
             # Jitter (pitch perturbation)
@@ -88,11 +181,13 @@ class SpeechAnalysisService:
             shimmer = np.mean(np.abs(np.diff(rms_db))) / np.mean(rms_db)
 
             # Harmonic-to-noise ratio (HNR)
+            stage = time.perf_counter()
             y_harmonic, y_percussive = librosa.effects.hpss(y_filtered)
             if np.sum(y_harmonic) > 0:  # Check if harmonic component exists
                 hnr = 10 * np.log10(np.sum(y_harmonic**2) / np.sum(y_percussive**2))
             else:
                 hnr = 0  # Default value if no harmonic content
+            timings['hnr'] = time.perf_counter() - stage
 
             # Return results as scalar values
             return {
@@ -106,7 +201,8 @@ class SpeechAnalysisService:
                 'formant_variability': float(formant_var),
                 'jitter': float(jitter),
                 'shimmer': float(shimmer),
-                'hnr': float(hnr)
+                'hnr': float(hnr),
+                'timings': timings
             }
 
         except Exception as e:
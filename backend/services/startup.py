@@ -0,0 +1,108 @@
+import importlib
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+# Heavy modules the analysis code imports on first use, in dependency order.
+# librosa loads its submodules lazily, so the ones the speech analysis uses
+# are listed explicitly.
+PRELOAD_MODULES = (
+    'numpy',
+    'scipy.signal',
+    'numba',
+    'librosa',
+    'librosa.core',
+    'librosa.feature',
+    'librosa.effects',
+    'noisereduce',
+    'matplotlib.backends.backend_agg',
+    'matplotlib.figure',
+    'google.cloud.documentai_v1',
+    'PIL.Image',
+)
+
+
+def configure_jit_cache(directory: Optional[str] = None) -> str:
+    """
+    Point numba's on-disk cache at a persistent, writable directory.
+
+    librosa's kernels are compiled with cache=True; by default numba stores
+    them next to the installed sources, which is often read-only or rebuilt
+    with the image, so every deploy or recycled worker compiled them again.
+    Must run before numba is imported. An existing NUMBA_CACHE_DIR wins.
+    """
+    directory = (directory or os.environ.get('PARKER_NUMBA_CACHE_DIR')
+                 or os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'parker', 'numba'))
+    os.environ.setdefault('NUMBA_CACHE_DIR', directory)
+    os.makedirs(os.environ['NUMBA_CACHE_DIR'], exist_ok=True)
+    return os.environ['NUMBA_CACHE_DIR']
+
+
+def preload(modules: Iterable[str] = PRELOAD_MODULES) -> Dict[str, float]:
+    """
+    Import `modules` now and return the seconds each one took.
+
+    Meant for the master process before it forks its analysis workers: the
+    imported code and data are then shared copy-on-write instead of being
+    loaded again by every worker on its first request. Missing optional
+    modules are skipped.
+    """
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Preload skipped {name}: {e}")
+            continue
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, Optional[float]]:
+    """
+    Resident (RSS) and proportional (PSS) memory of a process in MB.
+
+    PSS divides pages shared with other processes (e.g. copy-on-write pages
+    inherited from a preloading master) between them, so summing it over
+    workers does not count shared pages twice. Linux only; None elsewhere.
+    """
+    usage = {"rss_mb": None, "pss_mb": None}
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(':')
+                if field in ("Rss", "Pss"):
+                    usage[f"{field.lower()}_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return usage
+
+
+def boot_report(started: float, worker_pids: List[int] = (), preloaded: Optional[Dict[str, float]] = None,
+                warm_up: Optional[float] = None) -> Dict:
+    """Startup time (from `started`, a time.perf_counter() value) and memory of this process and its workers."""
+    report = {
+        "startup_s": round(time.perf_counter() - started, 3),
+        "master": memory_usage(),
+        "workers": {pid: memory_usage(pid) for pid in worker_pids},
+    }
+    if preloaded is not None:
+        report["preload_s"] = round(sum(preloaded.values()), 3)
+    if warm_up is not None:
+        report["warm_up_s"] = warm_up
+    return report
+
+
+def format_boot_line(report: Dict) -> str:
+    """One log line summarizing a boot_report()."""
+    line = f"Booted in {report['startup_s']:.2f}s"
+    if "preload_s" in report:
+        line += f" (preload {report['preload_s']:.2f}s)"
+    if "warm_up_s" in report:
+        line += f" (warm-up {report['warm_up_s']:.2f}s)"
+    line += f"; master RSS {report['master']['rss_mb']} MB"
+    for pid, usage in report["workers"].items():
+        line += f"; worker {pid} RSS {usage['rss_mb']} MB (PSS {usage['pss_mb']} MB)"
+    return line
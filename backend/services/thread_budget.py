@@ -0,0 +1,126 @@
+import os
+import sys
+from contextlib import contextmanager
+
+# Environment variables read by the native thread pools when they start.
+# They only take effect if set before numpy/scipy/numba are first imported.
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'BLIS_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'NUMBA_NUM_THREADS',
+)
+
+
+class ThreadBudget:
+    """
+    Explicit thread budget for the BLAS/OpenMP/numba pools used by analysis.
+
+    Modes:
+        latency:    each analysis worker gets cpu_count // workers threads, so a
+                    single request can use intra-op parallelism.
+        throughput: each analysis worker is pinned to one thread, so more
+                    requests can run side by side without oversubscribing cores.
+
+    An explicit `threads` value overrides the mode. Defaults come from
+    PARKER_ANALYSIS_THREADS, PARKER_THREAD_MODE and PARKER_ANALYSIS_WORKERS.
+    """
+
+    MODES = ('latency', 'throughput')
+
+    def __init__(self, threads=None, mode=None, workers=None):
+        self.cpu_count = os.cpu_count() or 1
+        self.mode = (mode or os.environ.get('PARKER_THREAD_MODE', 'latency')).lower()
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown thread mode '{self.mode}', expected one of {self.MODES}")
+
+        self.workers = max(1, int(workers or os.environ.get('PARKER_ANALYSIS_WORKERS', 1)))
+
+        threads = threads or os.environ.get('PARKER_ANALYSIS_THREADS')
+        if threads:
+            self.threads = max(1, int(threads))
+        elif self.mode == 'throughput':
+            self.threads = 1
+        else:
+            self.threads = max(1, self.cpu_count // self.workers)
+
+        self._limiter = None
+
+    def configure_environment(self):
+        """Export the budget to the native pools' env vars (call before numpy is imported)."""
+        for name in THREAD_ENV_VARS:
+            os.environ.setdefault(name, str(self.threads))
+
+    def apply(self):
+        """Apply the budget to the already-loaded BLAS/OpenMP pools of this process."""
+        from threadpoolctl import threadpool_limits
+
+        self._limiter = threadpool_limits(limits=self.threads)
+        self._set_numba_threads()
+        return self
+
+    @staticmethod
+    def _loaded_numba():
+        """numba if something has finished importing it, else None (never imports it)."""
+        numba = sys.modules.get('numba')
+        # Another thread may be halfway through importing it
+        if numba is None or not hasattr(numba, 'set_num_threads'):
+            return None
+        return numba
+
+    def _set_numba_threads(self):
+        # Importing numba costs ~0.2 s; until something else loads it, the
+        # NUMBA_NUM_THREADS exported by configure_environment() already applies
+        numba = self._loaded_numba()
+        if numba is None:
+            return None
+
+        previous = numba.get_num_threads()
+        numba.set_num_threads(min(self.threads, numba.config.NUMBA_NUM_THREADS))
+        return previous
+
+    @contextmanager
+    def limit(self):
+        """
+        Hold the numba thread count for the duration of one analysis.
+
+        numba's setting is per calling thread, so it is applied on every
+        request; the BLAS/OpenMP limits are process-wide and set by apply().
+        """
+        previous = self._set_numba_threads()
+        try:
+            yield self
+        finally:
+            if previous is not None:
+                import numba
+                numba.set_num_threads(previous)
+
+    def status(self):
+        status = {
+            "mode": self.mode,
+            "threads": self.threads,
+            "workers": self.workers,
+            "cpu_count": self.cpu_count,
+            "applied": self._limiter is not None,
+        }
+
+        try:
+            from threadpoolctl import threadpool_info
+            status["threadpools"] = [
+                {
+                    "user_api": pool.get("user_api"),
+                    "internal_api": pool.get("internal_api"),
+                    "num_threads": pool.get("num_threads"),
+                }
+                for pool in threadpool_info()
+            ]
+        except ImportError:
+            status["threadpools"] = []
+
+        numba = self._loaded_numba()
+        status["numba_threads"] = numba.get_num_threads() if numba is not None else None
+
+        return status
@@ -0,0 +1,216 @@
+import hashlib
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+def whole_numbers(column: np.ndarray) -> np.ndarray:
+    """
+    `column` as int64 when every value is a whole number, else unchanged.
+
+    Document AI boxes are in integer pixels, so coordinates, sizes and gaps
+    go out in JSON as 702 rather than 702.0, as they did before the columns
+    became float64.
+    """
+    if column.dtype.kind == 'f' and np.isfinite(column).all() and (column == np.trunc(column)).all():
+        return column.astype(np.int64)
+    return column
+
+
+class TokenTable:
+    """
+    Columnar (struct-of-arrays) view of the tokens extracted from a document.
+
+    Numeric fields are stored as one NumPy array per column, the token text and
+    detected break type as plain lists. Every analysis stage reads the columns
+    directly; `to_records()` rebuilds the old list-of-dicts shape for JSON
+    responses.
+    """
+
+    INT_COLUMNS = ('start_index', 'end_index', 'page', 'position')
+    FLOAT_COLUMNS = ('x_min', 'x_max', 'y_min', 'y_max', 'width', 'height', 'confidence')
+    NUMERIC_COLUMNS = INT_COLUMNS + FLOAT_COLUMNS
+    # Pixel geometry: written as integers when whole (see whole_numbers)
+    GEOMETRY_COLUMNS = ('x_min', 'x_max', 'y_min', 'y_max', 'width', 'height')
+    # Key order of the records produced by to_records()
+    RECORD_KEYS = ('text', 'start_index', 'end_index', 'page', 'position',
+                   'x_min', 'x_max', 'y_min', 'y_max', 'width', 'height',
+                   'break_type', 'confidence')
+
+    def __init__(self, columns: Dict[str, Sequence], text: List[str], break_type: List[Optional[str]]):
+        self.columns = {}
+        for name in self.INT_COLUMNS:
+            self.columns[name] = np.asarray(columns.get(name, ()), dtype=np.int64)
+        for name in self.FLOAT_COLUMNS:
+            self.columns[name] = np.asarray(columns.get(name, ()), dtype=np.float64)
+        self.text = list(text)
+        self.break_type = list(break_type)
+
+    @classmethod
+    def empty(cls) -> 'TokenTable':
+        return cls({}, [], [])
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> 'TokenTable':
+        """Build a table from the list-of-dicts token format."""
+        records = list(records)
+        columns = {name: [r[name] for r in records] for name in cls.NUMERIC_COLUMNS}
+        return cls(columns, [r['text'] for r in records], [r.get('break_type') for r in records])
+
+    @classmethod
+    def coerce(cls, token_data) -> 'TokenTable':
+        """Accept either a TokenTable or the legacy list of token dicts."""
+        if isinstance(token_data, cls):
+            return token_data
+        return cls.from_records(token_data or [])
+
+    @classmethod
+    def concat(cls, tables: Sequence['TokenTable']) -> 'TokenTable':
+        """Concatenate tables in order (e.g. per-page tables into a document)."""
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+        columns = {name: np.concatenate([t.columns[name] for t in tables]) for name in cls.NUMERIC_COLUMNS}
+        text = [s for t in tables for s in t.text]
+        break_type = [b for t in tables for b in t.break_type]
+        return cls(columns, text, break_type)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __getitem__(self, name: str):
+        if name == 'text':
+            return self.text
+        if name == 'break_type':
+            return self.break_type
+        return self.columns[name]
+
+    def fingerprint(self) -> str:
+        """Stable content hash of the table, used to key cached renderings."""
+        digest = hashlib.sha256()
+        for name in self.NUMERIC_COLUMNS:
+            digest.update(np.ascontiguousarray(self.columns[name]).tobytes())
+        digest.update('\x00'.join(self.text).encode('utf-8'))
+        digest.update('\x00'.join(b or '' for b in self.break_type).encode('utf-8'))
+        return digest.hexdigest()
+
+    def take(self, indices) -> 'TokenTable':
+        """Return a new table with the rows at `indices`, in that order."""
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = {name: column[indices] for name, column in self.columns.items()}
+        return TokenTable(columns, [self.text[i] for i in indices], [self.break_type[i] for i in indices])
+
+    def to_columns(self) -> Dict[str, Any]:
+        """
+        Compact JSON view: one array per field (NumPy arrays, serialized by
+        NumpyJSONProvider without per-value Python conversion).
+        """
+        columns = {'text': self.text, 'break_type': self.break_type}
+        columns.update(self._json_columns())
+        return columns
+
+    def _json_columns(self) -> Dict[str, np.ndarray]:
+        columns = dict(self.columns)
+        for name in self.GEOMETRY_COLUMNS:
+            columns[name] = whole_numbers(columns[name])
+        return columns
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Compatibility view: one dict per token, with native Python values."""
+        values = {name: column.tolist() for name, column in self._json_columns().items()}
+        values['text'] = self.text
+        values['break_type'] = self.break_type
+        rows = zip(*(values[key] for key in self.RECORD_KEYS))
+        return [dict(zip(self.RECORD_KEYS, row)) for row in rows]
+
+
+class SpacingTable:
+    """
+    Columnar spacing measurements between consecutive tokens on the same line.
+
+    `left` and `right` are row indices into the TokenTable the spacing was
+    computed from, so token text and break types are looked up from it instead
+    of being copied per pair.
+    """
+
+    RECORD_KEYS = ('left_token', 'right_token', 'position', 'spacing',
+                   'left_token_width', 'right_token_width', 'break_type')
+
+    def __init__(self, tokens: TokenTable, left, right, spacing):
+        self.tokens = tokens
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.spacing = np.asarray(spacing, dtype=np.float64)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> 'SpacingTable':
+        """
+        Build a table from the list-of-dicts spacing format.
+
+        The pairs get their own two-row-per-pair token table so the left/right
+        text, widths and position survive the round trip.
+        """
+        records = list(records)
+        n = len(records)
+        columns = {name: np.zeros(2 * n) for name in TokenTable.NUMERIC_COLUMNS}
+        columns['position'] = np.repeat([r['position'] for r in records], 2)
+        columns['width'][0::2] = [r['left_token_width'] for r in records]
+        columns['width'][1::2] = [r['right_token_width'] for r in records]
+        text = [s for r in records for s in (r['left_token'], r['right_token'])]
+        break_type = [b for r in records for b in (r.get('break_type'), None)]
+        tokens = TokenTable(columns, text, break_type)
+        return cls(tokens, np.arange(0, 2 * n, 2), np.arange(1, 2 * n, 2), [r['spacing'] for r in records])
+
+    @classmethod
+    def coerce(cls, spacing_data) -> 'SpacingTable':
+        """Accept either a SpacingTable or the legacy list of spacing dicts."""
+        if isinstance(spacing_data, cls):
+            return spacing_data
+        return cls.from_records(spacing_data or [])
+
+    def __len__(self) -> int:
+        return len(self.spacing)
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.tokens.columns['position'][self.left]
+
+    @property
+    def left_width(self) -> np.ndarray:
+        return self.tokens.columns['width'][self.left]
+
+    @property
+    def right_width(self) -> np.ndarray:
+        return self.tokens.columns['width'][self.right]
+
+    @property
+    def left_text(self) -> List[str]:
+        return [self.tokens.text[i] for i in self.left]
+
+    @property
+    def right_text(self) -> List[str]:
+        return [self.tokens.text[i] for i in self.right]
+
+    def to_columns(self) -> Dict[str, Any]:
+        """Compact JSON view: token row indices (into the token columns) plus the measurements."""
+        return {
+            'left': self.left,
+            'right': self.right,
+            'position': self.position,
+            'spacing': whole_numbers(self.spacing),
+        }
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Compatibility view: one dict per token pair, with native Python values."""
+        break_types = self.tokens.break_type
+        rows = zip(
+            self.left_text,
+            self.right_text,
+            self.position.tolist(),
+            whole_numbers(self.spacing).tolist(),
+            whole_numbers(self.left_width).tolist(),
+            whole_numbers(self.right_width).tolist(),
+            [break_types[i] for i in self.left],
+        )
+        return [dict(zip(self.RECORD_KEYS, row)) for row in rows]
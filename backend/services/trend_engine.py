@@ -0,0 +1,216 @@
+import numpy as np
+from typing import Dict, Optional, Sequence
+
+
+class LinearTrend:
+    """
+    Least-squares line y = slope * x + intercept kept as sufficient statistics.
+
+    Only n, Σx, Σy, Σxy, Σx², Σy² and the x range are stored, so slope,
+    intercept, R² and the fitted start-to-end % change come out in closed form,
+    and two trends over disjoint data can be merged (used for incremental
+    sessions).
+
+    The sums are taken about a pivot (shift_x, shift_y), normally the means of
+    the first batch, so the closed-form variances don't lose precision to
+    cancellation when positions or sizes are large.
+    """
+
+    def __init__(self, n=0, sum_x=0.0, sum_y=0.0, sum_xy=0.0, sum_xx=0.0, sum_yy=0.0,
+                 x_min=np.inf, x_max=-np.inf, shift_x=0.0, shift_y=0.0):
+        self.n = int(n)
+        self.shift_x = float(shift_x)
+        self.shift_y = float(shift_y)
+        self.sum_x = float(sum_x)
+        self.sum_y = float(sum_y)
+        self.sum_xy = float(sum_xy)
+        self.sum_xx = float(sum_xx)
+        self.sum_yy = float(sum_yy)
+        self.x_min = float(x_min)
+        self.x_max = float(x_max)
+
+    @classmethod
+    def fit(cls, x, y) -> 'LinearTrend':
+        return fit_trends(x, [y])[0]
+
+    def update(self, x, y) -> 'LinearTrend':
+        """Add more (x, y) observations in place."""
+        return self.merge(LinearTrend.fit(x, y))
+
+    def merge(self, other: 'LinearTrend') -> 'LinearTrend':
+        """Fold the statistics of `other` into this trend in place."""
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.shift_x, self.shift_y = other.shift_x, other.shift_y
+
+        # Re-express the other trend's sums about this trend's pivot
+        dx = other.shift_x - self.shift_x
+        dy = other.shift_y - self.shift_y
+        n = other.n
+        self.sum_xy += other.sum_xy + dx * other.sum_y + dy * other.sum_x + n * dx * dy
+        self.sum_xx += other.sum_xx + 2 * dx * other.sum_x + n * dx * dx
+        self.sum_yy += other.sum_yy + 2 * dy * other.sum_y + n * dy * dy
+        self.sum_x += other.sum_x + n * dx
+        self.sum_y += other.sum_y + n * dy
+        self.n += n
+        self.x_min = min(self.x_min, other.x_min)
+        self.x_max = max(self.x_max, other.x_max)
+        return self
+
+    def copy(self) -> 'LinearTrend':
+        return LinearTrend(self.n, self.sum_x, self.sum_y, self.sum_xy, self.sum_xx, self.sum_yy,
+                           self.x_min, self.x_max, self.shift_x, self.shift_y)
+
+    @property
+    def defined(self) -> bool:
+        """A line needs at least two observations."""
+        return self.n > 1
+
+    @property
+    def mean_x(self) -> float:
+        return self.shift_x + self.sum_x / self.n if self.n else 0.0
+
+    @property
+    def mean_y(self) -> float:
+        return self.shift_y + self.sum_y / self.n if self.n else 0.0
+
+    @property
+    def _sxx(self) -> float:
+        return self.sum_xx - self.sum_x * self.sum_x / self.n
+
+    @property
+    def _sxy(self) -> float:
+        return self.sum_xy - self.sum_x * self.sum_y / self.n
+
+    @property
+    def _syy(self) -> float:
+        return self.sum_yy - self.sum_y * self.sum_y / self.n
+
+    @property
+    def slope(self) -> Optional[float]:
+        if not self.defined:
+            return None
+        sxx = self._sxx
+        return self._sxy / sxx if sxx > 0 else 0.0
+
+    @property
+    def intercept(self) -> Optional[float]:
+        if not self.defined:
+            return None
+        return self.mean_y - self.slope * self.mean_x
+
+    @property
+    def r2(self) -> Optional[float]:
+        """
+        Coefficient of determination of the fitted line.
+
+        A constant y has nothing to explain, which would be 0/0; it is reported
+        as 0.0 so the value stays JSON-serializable.
+        """
+        if not self.defined:
+            return None
+        syy = self._syy
+        if syy <= 0:
+            return 0.0
+        residual = max(syy - self.slope * self._sxy, 0.0)
+        return 1 - residual / syy
+
+    def predict(self, x):
+        return self.slope * x + self.intercept
+
+    @property
+    def pct_change(self) -> float:
+        """Fitted change from the first to the last x, as % of the fitted start."""
+        if not self.defined:
+            return 0
+        start = self.predict(self.x_min)
+        end = self.predict(self.x_max)
+        return ((end - start) / start) * 100 if start != 0 else 0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "n": self.n, "sum_x": self.sum_x, "sum_y": self.sum_y, "sum_xy": self.sum_xy,
+            "sum_xx": self.sum_xx, "sum_yy": self.sum_yy, "x_min": self.x_min, "x_max": self.x_max,
+            "shift_x": self.shift_x, "shift_y": self.shift_y,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, float]) -> 'LinearTrend':
+        return cls(**data)
+
+
+def fit_trends(x, ys: Sequence) -> list:
+    """
+    Fit several series that share the same x in a single pass.
+
+    The rows [1, x, y1, y2, ...] (each centred on its mean) are stacked and
+    their Gram matrix is taken with one matrix product, which yields n, Σx,
+    Σy, Σxy, Σx² and Σy² for every series at once.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if x.size == 0:
+        return [LinearTrend() for _ in ys]
+
+    ys = [np.asarray(y, dtype=np.float64) for y in ys]
+    shifts = [x.mean()] + [y.mean() for y in ys]
+    rows = np.vstack([np.ones_like(x)] + [series - shift for series, shift in zip([x] + ys, shifts)])
+    gram = rows @ rows.T
+    x_min, x_max = x.min(), x.max()
+
+    trends = []
+    for i in range(2, rows.shape[0]):
+        trends.append(LinearTrend(
+            n=x.size,
+            sum_x=gram[0, 1],
+            sum_y=gram[0, i],
+            sum_xy=gram[1, i],
+            sum_xx=gram[1, 1],
+            sum_yy=gram[i, i],
+            x_min=x_min,
+            x_max=x_max,
+            shift_x=shifts[0],
+            shift_y=shifts[i - 1],
+        ))
+    return trends
+
+
+class DocumentTrends:
+    """Width, height and spacing trends of one document, each fit exactly once."""
+
+    def __init__(self, width: LinearTrend, height: LinearTrend, spacing: LinearTrend):
+        self.width = width
+        self.height = height
+        self.spacing = spacing
+
+    @classmethod
+    def fit(cls, tokens, spacing) -> 'DocumentTrends':
+        """Fit a TokenTable and its SpacingTable."""
+        width, height = fit_trends(tokens['position'], [tokens['width'], tokens['height']])
+        spacing_trend, = fit_trends(spacing.position, [spacing.spacing])
+        return cls(width, height, spacing_trend)
+
+    def copy(self) -> 'DocumentTrends':
+        return DocumentTrends(self.width.copy(), self.height.copy(), self.spacing.copy())
+
+
+def classify_trend(slope, r2) -> str:
+    """Describe a fitted slope, using R² to tell consistent trends from noise."""
+    if slope is None:
+        return "No clear trend"
+    if r2 > 0.5:  # Strong correlation
+        if slope < -0.5:
+            return "Strongly decreasing"
+        elif slope < 0:
+            return "Slightly decreasing"
+        elif slope > 0.5:
+            return "Strongly increasing"
+        elif slope > 0:
+            return "Slightly increasing"
+        return "Stable"
+    # Weak correlation
+    if slope < 0:
+        return "Weakly decreasing (inconsistent)"
+    elif slope > 0:
+        return "Weakly increasing (inconsistent)"
+    return "Stable"
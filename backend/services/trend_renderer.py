@@ -0,0 +1,168 @@
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from .token_table import TokenTable, SpacingTable
+from .trend_engine import DocumentTrends
+
+
+class TrendRenderer:
+    """
+    Renders the width/height/spacing trend figure for an analysed document.
+
+    Uses matplotlib's object-oriented Agg API (no pyplot global state), so
+    several requests can render at the same time. Analyses are registered by
+    document hash and only rendered when the image is first asked for; the
+    PNG is then cached in memory (and optionally in `cache_dir`).
+
+    Large documents are decimated: at most `max_points` points are drawn per
+    subplot and at most `max_annotations` of them get a text label.
+    """
+
+    def __init__(self, cache_dir=None, max_documents=64, max_cached_bytes=64 * 1024 * 1024,
+                 max_points=5000, max_annotations=100):
+        self.cache_dir = cache_dir
+        self.max_documents = max_documents
+        self.max_cached_bytes = max_cached_bytes
+        self.max_points = max_points
+        self.max_annotations = max_annotations
+        self._documents = OrderedDict()
+        self._images = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def register(self, doc_hash: str, tokens: TokenTable, spacing: SpacingTable, fits: DocumentTrends):
+        """Remember an analysis so it can be rendered later by hash."""
+        with self._lock:
+            self._documents[doc_hash] = (tokens, spacing, fits)
+            self._documents.move_to_end(doc_hash)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def has(self, doc_hash: str) -> bool:
+        with self._lock:
+            if doc_hash in self._images or doc_hash in self._documents:
+                return True
+        return bool(self.cache_dir) and os.path.exists(self._cache_path(doc_hash))
+
+    def _cache_path(self, doc_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{doc_hash}.png")
+
+    def render(self, doc_hash: str, render_png=None) -> Optional[bytes]:
+        """
+        PNG bytes for a registered document, rendered on first use. None if unknown.
+
+        `render_png(tokens, spacing, fits)` replaces self.render_png, e.g. to
+        draw in a worker process.
+        """
+        with self._lock:
+            image = self._images.get(doc_hash)
+            if image is not None:
+                self._images.move_to_end(doc_hash)
+                return image
+            document = self._documents.get(doc_hash)
+
+        if self.cache_dir and os.path.exists(self._cache_path(doc_hash)):
+            with open(self._cache_path(doc_hash), 'rb') as f:
+                image = f.read()
+        elif document is not None:
+            image = (render_png or self.render_png)(*document)
+            if self.cache_dir:
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(image)
+                os.replace(tmp_path, self._cache_path(doc_hash))
+        else:
+            return None
+
+        self._remember(doc_hash, image)
+        return image
+
+    def _remember(self, doc_hash: str, image: bytes):
+        with self._lock:
+            if doc_hash in self._images:
+                return
+            self._images[doc_hash] = image
+            self._cached_bytes += len(image)
+            while self._cached_bytes > self.max_cached_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def render_to_file(self, tokens: TokenTable, spacing: SpacingTable, fits: DocumentTrends, output_path=None) -> str:
+        """Render straight to a file. Without `output_path` a unique temp file is used."""
+        if output_path is None:
+            fd, output_path = tempfile.mkstemp(prefix='handwriting_analysis_', suffix='.png')
+            os.close(fd)
+        with open(output_path, 'wb') as f:
+            f.write(self.render_png(tokens, spacing, fits))
+        return output_path
+
+    def _sample(self, count: int, limit: int) -> np.ndarray:
+        """Evenly spaced indices, at most `limit` of them."""
+        if count <= limit:
+            return np.arange(count)
+        return np.unique(np.linspace(0, count - 1, limit).astype(np.int64))
+
+    def _plot_trend(self, ax, x, y, label, trend, color, title, xlabel, ylabel):
+        shown = self._sample(len(x), self.max_points)
+        ax.scatter(x[shown], y[shown], alpha=0.7, s=100 if len(shown) < 500 else 10, color=color)
+
+        # Add text labels to (a subset of) the points
+        for i in self._sample(len(x), self.max_annotations):
+            ax.annotate(label(i), (x[i], y[i]),
+                        textcoords="offset points",
+                        xytext=(0, 10),
+                        ha='center')
+
+        if trend.defined:
+            # Add trend line
+            trend_x = np.array([trend.x_min, trend.x_max])
+            ax.plot(trend_x, trend.predict(trend_x), 'r--', linewidth=2,
+                    label=f'Slope: {trend.slope:.2f} px/token')
+
+            # Display R²
+            ax.text(x.min(), y.max() * 0.9,
+                    f'R² = {trend.r2:.3f}\nChange: {trend.slope * trend.n:.1f} px',
+                    bbox=dict(facecolor='white', alpha=0.5))
+            ax.legend()
+
+        ax.set_title(title, fontsize=14)
+        ax.set_xlabel(xlabel, fontsize=12)
+        ax.set_ylabel(ylabel, fontsize=12)
+        ax.grid(True, alpha=0.3)
+
+    def render_png(self, tokens: TokenTable, spacing: SpacingTable, fits: DocumentTrends) -> bytes:
+        """Draw the three trend subplots and return them as PNG bytes."""
+        # matplotlib is only needed when an image is actually requested
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        figure = Figure(figsize=(15, 12))
+        FigureCanvasAgg(figure)
+
+        positions = tokens['position']
+        token_label = tokens.text.__getitem__
+        self._plot_trend(figure.add_subplot(3, 1, 1), positions, tokens['width'], token_label,
+                         fits.width, None, 'Token Width Trend', 'Token Position', 'Token Width (pixels)')
+        self._plot_trend(figure.add_subplot(3, 1, 2), positions, tokens['height'], token_label,
+                         fits.height, 'green', 'Token Height Trend', 'Token Position', 'Token Height (pixels)')
+
+        # Plot spacing between tokens
+        if len(spacing) > 1:
+            text = spacing.tokens.text
+            pair_label = lambda i: f"{text[spacing.left[i]]}→{text[spacing.right[i]]}"
+            self._plot_trend(figure.add_subplot(3, 1, 3), spacing.position, spacing.spacing, pair_label,
+                             fits.spacing, 'purple', 'Token Spacing Trend', 'Position', 'Spacing Between Tokens (pixels)')
+
+        figure.tight_layout()
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png')
+        return buffer.getvalue()
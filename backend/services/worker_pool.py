@@ -0,0 +1,183 @@
+import functools
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _report_pid(pids):
+    """Worker initializer: tell the front end this worker's PID."""
+    pids.put(os.getpid())
+
+
+class AnalysisWorkerPool:
+    """
+    Runs CPU-bound analysis in worker processes so the web front end stays responsive.
+
+    With `workers=0` tasks run in this process: inline in the calling thread
+    (development server), or in cooperative mode on the hub's threadpool. Otherwise a fork-context ProcessPoolExecutor is used; fork it with
+    start() before the server accepts connections, so the workers inherit the
+    services configured in analysis_tasks and no background threads (gRPC,
+    thread pools) exist yet.
+
+    In `cooperative` mode (gevent front end, no monkey patching) waiting for a
+    result is handed to the gevent hub's native threadpool, so only the
+    requesting greenlet waits while others - /health, uploads - keep running.
+    Blocking I/O that should not occupy a process can use run_blocking().
+
+    If a worker dies (OOM kill, crash in a C extension) the executor is
+    broken for good; it is replaced by a freshly forked one, the task that
+    was running fails and later tasks run on the new workers.
+    """
+
+    def __init__(self, workers: int = 0, cooperative: bool = False, io_threads: int = 16):
+        self.workers = max(0, int(workers))
+        self.cooperative = cooperative
+        self.io_threads = io_threads
+        self._executor = None
+        self._pids: List[int] = []
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._restarts = 0
+
+    @classmethod
+    def from_environment(cls, **overrides) -> 'AnalysisWorkerPool':
+        settings = {
+            'workers': int(os.environ.get('PARKER_ANALYSIS_WORKERS', 0)),
+            'io_threads': int(os.environ.get('PARKER_IO_THREADS', 16)),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        context = multiprocessing.get_context('fork')
+        pids = context.Queue()
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                       initializer=_report_pid, initargs=(pids,))
+        # ProcessPoolExecutor forks every worker on the first submit
+        executor.submit(os.getpid).result()
+        self._pids = []
+        try:
+            for _ in range(self.workers):
+                self._pids.append(pids.get(timeout=30))
+        except queue.Empty:
+            pass
+        return executor
+
+    def start(self) -> 'AnalysisWorkerPool':
+        """Fork the worker processes now (a no-op with workers=0)."""
+        if self.workers and self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._create_executor()
+        if self.cooperative:
+            import gevent
+            gevent.get_hub().threadpool.maxsize = self.io_threads
+        return self
+
+    def _wait(self, function: Callable, *args):
+        if self.cooperative:
+            import gevent
+            return gevent.get_hub().threadpool.apply(function, args)
+        return function(*args)
+
+    def _replace(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Swap a broken executor for a new one (once, however many callers noticed)."""
+        with self._lock:
+            if self._executor is broken:
+                print(f"Analysis worker pool broken (a worker died); forking {self.workers} new worker(s)")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+                self._restarts += 1
+            return self._executor
+
+    def _submit(self, task: Callable, *args, **kwargs):
+        if self._executor is None:
+            self.start()
+        executor = self._executor
+        try:
+            return executor, executor.submit(task, *args, **kwargs)
+        except BrokenProcessPool:
+            # Broken by an earlier task; this one hasn't run yet
+            executor = self._replace(executor)
+            return executor, executor.submit(task, *args, **kwargs)
+
+    def run(self, task: Callable, *args, **kwargs) -> Any:
+        """Run a module-level (picklable) task in a worker process and return its result."""
+        with self._lock:
+            self._submitted += 1
+        try:
+            if not self.workers:
+                # Off the hub even without workers: inline DSP would stall every greenlet
+                result = self._wait(functools.partial(task, *args, **kwargs))
+            else:
+                executor, future = self._submit(task, *args, **kwargs)
+                try:
+                    result = self._wait(future.result)
+                except BrokenProcessPool:
+                    self._replace(executor)
+                    raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        with self._lock:
+            self._completed += 1
+        return result
+
+    def run_blocking(self, function: Callable, *args) -> Any:
+        """Run blocking (I/O) code in this process without stalling other greenlets."""
+        return self._wait(function, *args)
+
+    def gather(self, calls: Dict[str, Callable[[], Any]]) -> Dict[str, Tuple[Any, Optional[Exception]]]:
+        """
+        Run independent calls concurrently and wait for all of them: on greenlets
+        in cooperative mode, else on threads. Each name maps to (result, None)
+        or (None, exception), so one failing call doesn't lose the others.
+        """
+        outcomes: Dict[str, Tuple[Any, Optional[Exception]]] = {}
+
+        def call(name, function):
+            try:
+                outcomes[name] = (function(), None)
+            except Exception as e:
+                outcomes[name] = (None, e)
+
+        if self.cooperative:
+            import gevent
+            gevent.joinall([gevent.spawn(call, name, function) for name, function in calls.items()])
+        else:
+            threads = [threading.Thread(target=call, args=item, daemon=True) for item in calls.items()]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return {name: outcomes[name] for name in calls}
+
+    def worker_pids(self) -> List[int]:
+        """PIDs of the forked worker processes (empty before start() or with workers=0)."""
+        if self._executor is None:
+            return []
+        return sorted(self._pids)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "cooperative": self.cooperative,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "restarts": self._restarts,
+                "in_flight": self._submitted - self._completed - self._failed,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
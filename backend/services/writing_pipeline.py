@@ -0,0 +1,315 @@
+import base64
+import binascii
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from .handwriting_service import HandwritingAnalysisService
+from .image_preprocessor import ImagePreprocessor
+from .ocr_client import DocumentAIClient
+from .token_table import TokenTable
+
+
+class WritingPipeline:
+    """
+    Uploaded handwriting image(s) -> OCR -> tokens -> spacing -> trends.
+
+    Pages are handled as a pipeline: while page i is being OCR'd (on the
+    client's worker threads) page i + 1 is decoded and preprocessed. The
+    I/O-bound half (recognize) and the CPU-bound half (extract: tokens,
+    spacing, trends) are separate steps so they can run in different
+    processes. Every stage is timed and the timings are returned with the
+    result.
+
+    Token extraction is a pure-Python loop per token. For uploads of at
+    least `parallel_min_pages` pages and `parallel_min_tokens` tokens the
+    front end can split it with split_pages() into contiguous, token-balanced
+    runs, extract them on several analysis workers (extract_page_run) and
+    merge them with merge_pages(); the result is that of the sequential loop.
+    """
+
+    # Response shapes, smallest first: trends and per-document line statistics;
+    # plus every line's trends; plus the token and spacing columns
+    DETAIL_LEVELS = ('summary', 'lines', 'tokens')
+
+    def __init__(self, handwriting_service: HandwritingAnalysisService, ocr_client: DocumentAIClient,
+                 preprocessor: Optional[ImagePreprocessor] = None, parallel_min_pages: int = 8,
+                 parallel_min_tokens: int = 20000):
+        """
+        Args:
+            handwriting_service: Service used for extraction, spacing and trends.
+            ocr_client: Document AI client (its own preprocessor should be unset when `preprocessor` is given).
+            preprocessor: Optional image shrinking before OCR.
+            parallel_min_pages: Pages an upload needs before split_pages() splits its extraction.
+            parallel_min_tokens: Tokens an upload needs before split_pages() splits its extraction.
+        """
+        self.handwriting_service = handwriting_service
+        self.ocr_client = ocr_client
+        self.preprocessor = preprocessor
+        self.parallel_min_pages = parallel_min_pages
+        self.parallel_min_tokens = parallel_min_tokens
+
+    @staticmethod
+    def pages_from_request(data: Dict) -> List[Dict]:
+        """
+        The uploaded pages of a /writing-analysis request.
+
+        Either a single page as top-level "content" and "mimeType", or several
+        as "pages": [{"content": ..., "mimeType": ...}, ...]. Content is base64.
+        """
+        if 'pages' in data:
+            pages = data['pages']
+            if not isinstance(pages, list) or not pages:
+                raise ValueError("'pages' must be a non-empty list")
+        else:
+            pages = [data]
+        for number, page in enumerate(pages, start=1):
+            for field in ("content", "mimeType"):
+                if not isinstance(page, dict) or field not in page:
+                    raise ValueError(f"Missing required field: {field} (page {number})")
+        return pages
+
+    @classmethod
+    def detail_from_request(cls, data: Dict, args: Optional[Dict] = None) -> str:
+        """The requested response detail: ?detail=... or a "detail" field, "summary" by default."""
+        detail = (args or {}).get('detail') or data.get('detail') or 'summary'
+        if detail not in cls.DETAIL_LEVELS:
+            raise ValueError(f"'detail' must be one of {', '.join(cls.DETAIL_LEVELS)}")
+        return detail
+
+    @staticmethod
+    def shape(result: Dict[str, Any], artifacts: Optional[tuple], detail: str = 'summary') -> Dict[str, Any]:
+        """
+        The response for `detail`. Token and spacing detail is columnar (one
+        array per field); spacing rows refer to tokens by index.
+        """
+        shaped = dict(result)
+        if detail == 'summary' and result.get("line_trends"):
+            shaped["line_trends"] = {key: value for key, value in result["line_trends"].items() if key != "lines"}
+        if detail == 'tokens' and artifacts is not None:
+            token_data, spacing_data, _ = artifacts
+            shaped["token_data"] = token_data.to_columns()
+            shaped["spacing_data"] = spacing_data.to_columns()
+        return shaped
+
+    @staticmethod
+    def decode(content: str) -> bytes:
+        if isinstance(content, str) and content.startswith('data:'):
+            # data:image/jpeg;base64,....
+            content = content.split(',', 1)[-1]
+        try:
+            return base64.b64decode(content, validate=True)
+        except (binascii.Error, TypeError) as e:
+            raise ValueError(f"content is not valid base64: {e}")
+
+    def run(self, pages: List[Dict]) -> Dict[str, Any]:
+        """Analyze the pages and make the result's visualization available by document hash."""
+        result, artifacts = self.analyze(pages)
+        self.register(result, artifacts)
+        return result
+
+    def register(self, result: Dict[str, Any], artifacts: Optional[tuple]):
+        """Hand an analysis' (tokens, spacing, fits) to the renderer for lazy plotting."""
+        if artifacts is not None:
+            self.handwriting_service.renderer.register(result["document_hash"], *artifacts)
+
+    def analyze(self, pages: List[Dict]) -> Tuple[Dict[str, Any], Optional[tuple]]:
+        """
+        The JSON-ready result plus the (tokens, spacing, fits) needed to plot it
+        (None when there are too few tokens); recognize() then extract().
+        Nothing is registered.
+        """
+        return self.extract(*self.recognize(pages))
+
+    def recognize(self, pages: List[Dict]) -> Tuple[List[Dict], Dict[str, Any]]:
+        """
+        Decode, preprocess and OCR the pages: mostly waiting on Document AI, so
+        the server runs it in its own process (see AnalysisWorkerPool.run_blocking)
+        and hands only extract() to the analysis workers.
+
+        Returns the OCR documents in page order (token boxes in original image
+        coordinates) and the stage statistics extract() completes.
+        """
+        started = time.perf_counter()
+        timings = {"decode": 0.0, "preprocess": 0.0, "ocr_wait": 0.0}
+        bytes_in = bytes_out = 0
+
+        # Decode/preprocess page by page, handing each to OCR before touching the next
+        submitted = []
+        for page in pages:
+            stage = time.perf_counter()
+            content = self.decode(page["content"])
+            mime_type = page["mimeType"]
+            timings["decode"] += time.perf_counter() - stage
+            bytes_in += len(content)
+
+            # Looked up by the upload itself, so a hit skips preprocessing too and
+            # preprocessor settings don't change the key
+            cache_key, cached = self.ocr_client.cached(content, mime_type)
+            if cached is not None:
+                done = Future()
+                done.set_result(cached)
+                submitted.append((done, None, time.perf_counter()))
+                continue
+
+            prepared = None
+            if self.preprocessor is not None:
+                stage = time.perf_counter()
+                prepared = self.preprocessor.prepare(content, mime_type)
+                timings["preprocess"] += time.perf_counter() - stage
+            bytes_out += len(prepared.content) if prepared is not None else len(content)
+
+            future = self.ocr_client.submit(content, mime_type, cache_key=cache_key, prepared=prepared)
+            submitted.append((future, prepared, time.perf_counter()))
+
+        documents = []
+        ocr_latency = []
+        for future, prepared, submitted_at in submitted:
+            stage = time.perf_counter()
+            document = future.result()
+            timings["ocr_wait"] += time.perf_counter() - stage
+            ocr_latency.append(time.perf_counter() - submitted_at)
+            if prepared is not None:
+                # The client has already mapped the boxes back to original coordinates
+                self.preprocessor.record_ocr_latency(prepared, ocr_latency[-1])
+            documents.append(document)
+
+        return documents, {
+            "timings": timings,
+            "seconds": time.perf_counter() - started,
+            "upload_bytes": bytes_in,
+            "ocr_bytes": bytes_out,
+            "ocr_latency": ocr_latency,
+        }
+
+    def extract_tokens(self, documents: List[Dict]) -> TokenTable:
+        """The tokens of all documents' pages in order, pages numbered on across documents."""
+        tables = []
+        page_offset = 0
+        for document in documents:
+            full_text = document.get('text', '')
+            last_end_index = 0
+            for page in document.get('pages', []):
+                table, last_end_index = self.handwriting_service.extract_page_tokens(page, full_text, last_end_index)
+                table.columns['page'] = table.columns['page'] + page_offset
+                tables.append(table)
+            page_offset += len(document.get('pages', []))
+        return TokenTable.concat(tables)
+
+    def split_pages(self, documents: List[Dict], parts: int) -> Optional[List[List[Tuple[Dict, str, bool]]]]:
+        """
+        The documents' pages as up to `parts` contiguous runs with about equal
+        token counts, for extract_page_run(); None when the upload is below
+        the parallel thresholds or `parts` < 2 (extract() then does it all).
+
+        A run item is (page, its document's text, whether it continues the
+        document of the item before it).
+        """
+        items = [(page, document.get('text', ''), number > 0)
+                 for document in documents for number, page in enumerate(document.get('pages', []))]
+        counts = [len(page.get('tokens', [])) for page, _, _ in items]
+        total = sum(counts)
+        parts = min(parts, len(items))
+        if parts < 2 or len(items) < self.parallel_min_pages or total < self.parallel_min_tokens:
+            return None
+
+        runs, run, seen = [], [], 0
+        for item, count in zip(items, counts):
+            run.append(item)
+            seen += count
+            if len(runs) < parts - 1 and seen >= total * (len(runs) + 1) / parts:
+                runs.append(run)
+                run = []
+        if run:
+            runs.append(run)
+        return runs
+
+    def extract_page_run(self, run: List[Tuple[Dict, str, bool]]) -> List[Tuple[TokenTable, int, bool]]:
+        """
+        Extract one run of split_pages(), as if it started a document: per page
+        its TokenTable (document page numbers), end index and whether it used
+        the end index carried in from the page before it.
+        """
+        results = []
+        last_end_index = 0
+        for page, full_text, continues in run:
+            if not continues:
+                last_end_index = 0
+            table, last_end_index, used_carry = self.handwriting_service._extract_page(page, full_text,
+                                                                                       last_end_index)
+            results.append((table, last_end_index, used_carry))
+        return results
+
+    def merge_pages(self, runs: List[List[Tuple[Dict, str, bool]]],
+                    results: List[List[Tuple[TokenTable, int, bool]]]) -> TokenTable:
+        """
+        Concatenate the extracted runs in page order, exactly as extract_tokens():
+        a run's first page that used its carried end index, which the run did
+        not have, is extracted again here with the real one.
+        """
+        tables = []
+        page_offset = pages_seen = 0
+        last_end_index = 0
+        for run, run_results in zip(runs, results):
+            for position, ((page, full_text, continues), (table, end_index, used_carry)) in enumerate(
+                    zip(run, run_results)):
+                if not continues:
+                    page_offset, last_end_index = pages_seen, 0
+                elif position == 0 and used_carry:
+                    table, end_index, _ = self.handwriting_service._extract_page(page, full_text, last_end_index)
+                # A page without kept tokens passes the carry on unchanged
+                if len(table):
+                    last_end_index = end_index
+                table.columns['page'] = table.columns['page'] + page_offset
+                tables.append(table)
+                pages_seen += 1
+        return TokenTable.concat(tables)
+
+    def extract(self, documents: List[Dict], recognition: Dict[str, Any],
+                token_data: Optional[TokenTable] = None) -> Tuple[Dict[str, Any], Optional[tuple]]:
+        """
+        Tokens, spacing and trends of recognize()'s documents: the CPU-bound
+        part, run in an analysis worker. Returns (result, artifacts) as analyze().
+
+        `token_data` are the documents' tokens when they were already
+        extracted (see split_pages); recognition["timings"] then has "extract".
+        """
+        started = time.perf_counter()
+        timings = dict(recognition["timings"])
+
+        if token_data is None:
+            stage = time.perf_counter()
+            token_data = self.extract_tokens(documents)
+            timings["extract"] = time.perf_counter() - stage
+        page_count = sum(len(document.get('pages', [])) for document in documents)
+
+        stage = time.perf_counter()
+        spacing_data = self.handwriting_service.calculate_spacing(token_data)
+        timings["spacing"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        fits = self.handwriting_service.fit_trends(token_data, spacing_data)
+        trends = self.handwriting_service.analyze_trends(token_data, spacing_data, fits)
+        line_trends = self.handwriting_service.analyze_line_trends(token_data)
+        timings["trends"] = time.perf_counter() - stage
+
+        document_hash = None
+        artifacts = None
+        if len(token_data) > 1:
+            document_hash = token_data.fingerprint()
+            artifacts = (token_data, spacing_data, fits)
+
+        timings["total"] = recognition["seconds"] + time.perf_counter() - started
+        result = {
+            "trends": trends,
+            "line_trends": line_trends,
+            "token_count": len(token_data),
+            "spacing_count": len(spacing_data),
+            "page_count": page_count,
+            "document_hash": document_hash,
+            "upload_bytes": recognition["upload_bytes"],
+            "ocr_bytes": recognition["ocr_bytes"],
+            "timings_ms": {name: round(seconds * 1000, 3) for name, seconds in timings.items()},
+            "ocr_latency_ms": [round(seconds * 1000, 3) for seconds in recognition["ocr_latency"]],
+        }
+        return result, artifacts
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.document_ai_parser import load_document_ai_file, parse_document_ai_json  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'test-data')
+NAMES = ['lamb-text.json', 'horse-text.json']
+
+
+def kept_fields(data):
+    """What the selective parser should return for a fully decoded response."""
+    document = dict(data)
+    document.update(document.pop('document', {}))
+    subset = {}
+    if 'text' in document:
+        subset['text'] = document['text']
+    if 'pages' in document:
+        subset['pages'] = []
+        for page in document['pages']:
+            kept = {key: page[key] for key in ('pageNumber', 'dimension') if key in page}
+            if 'tokens' in page:
+                kept['tokens'] = [
+                    dict({'layout': token.get('layout', {})},
+                         **({'detectedBreak': token['detectedBreak']} if 'detectedBreak' in token else {}))
+                    for token in page['tokens']
+                ]
+            subset['pages'].append(kept)
+    return subset
+
+
+def read(name):
+    with open(os.path.join(TEST_DATA, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_matches_json_load(name):
+    with open(os.path.join(TEST_DATA, name), 'r', encoding='utf-8') as f:
+        expected = kept_fields(json.load(f))
+    assert load_document_ai_file(os.path.join(TEST_DATA, name)) == expected
+    assert parse_document_ai_json(read(name).encode('utf-8')) == expected
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_document_wrapper_is_unwrapped(name):
+    data = json.loads(read(name))
+    response = json.dumps({'document': data, 'humanReviewStatus': {'state': 'SKIPPED'}}, indent=1)
+    assert parse_document_ai_json(response) == kept_fields(data)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_truncated_input_raises(name):
+    text = read(name).rstrip()
+    for end in range(len(text)):
+        with pytest.raises(json.JSONDecodeError):
+            parse_document_ai_json(text[:end])
+
+
+def test_trailing_data_raises():
+    with pytest.raises(json.JSONDecodeError):
+        parse_document_ai_json(read('lamb-text.json') + '{}')
+
+
+def test_escaped_quotes_and_brackets_in_strings():
+    tricky = 'say \\"}], then \\\\" and [{"'
+    page = {
+        'pageNumber': 1,
+        'image': {'content': tricky * 50, 'mimeType': 'image/png'},
+        'blocks': [{'layout': {'textAnchor': {'content': tricky}}}],
+        'lines': [tricky, {'nested': [tricky, {'deeper': tricky}]}],
+        'tokens': [{'layout': {'textAnchor': {'textSegments': [{'endIndex': '3'}]}, 'note': tricky},
+                    'detectedBreak': {'type': 'SPACE'}, 'provenance': {'text': tricky}}],
+        'dimension': {'width': 10, 'height': 20, 'unit': tricky},
+    }
+    data = {
+        'uri': tricky,
+        'entities': [{'mentionText': tricky, 'properties': [{'type': tricky}]}],
+        'shardInfo': {'text': tricky, 'nested': {'text': tricky, 'deeper': {'text': tricky}}},
+        'text': tricky + '\n' + 'ünïcødé ✓',
+        'pages': [page, dict(page, pageNumber=2)],
+        'revisions': [],
+        'empty': {},
+        'flag': True,
+        'nothing': None,
+        'count': -1.5e3,
+        'escaped\\"key': tricky,
+    }
+    for text in (json.dumps(data), json.dumps(data, indent=2), json.dumps(data, ensure_ascii=False)):
+        parsed = parse_document_ai_json(text)
+        assert parsed == kept_fields(json.loads(text))
+        assert parsed['text'] == data['text']
@@ -0,0 +1,126 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.handwriting_service import HandwritingAnalysisService  # noqa: E402
+from services.handwriting_session import HandwritingSession  # noqa: E402
+from services.token_table import TokenTable  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'test-data')
+
+
+@pytest.fixture(scope='module')
+def service():
+    return HandwritingAnalysisService()
+
+
+def one_shot(service, tokens):
+    """(trends, spacing pair count) of analysing the whole table at once."""
+    spacing = service.calculate_spacing(tokens)
+    if len(tokens) < 3:
+        return service.analyze_trends(tokens, spacing), len(spacing)
+    return service.describe_trends(service.fit_trends(tokens, spacing)), len(spacing)
+
+
+def assert_same_trends(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, float):
+            assert actual[key] == pytest.approx(value, rel=1e-9, abs=1e-12, nan_ok=True), key
+        else:
+            assert actual[key] == value, key
+
+
+def written_pages(rng, pages):
+    """A token table of `pages` pages of text lines, in (page, position) order, with a few overlapping tokens."""
+    columns = {name: [] for name in TokenTable.NUMERIC_COLUMNS}
+    for page in range(1, pages + 1):
+        position = 0
+        for line in range(int(rng.integers(1, 6))):
+            x = float(rng.integers(50, 150))
+            y = 150.0 * line + float(rng.integers(-10, 10))
+            for _ in range(int(rng.integers(1, 12))):
+                width, height = float(rng.integers(10, 200)), float(rng.integers(20, 80))
+                columns['page'].append(page)
+                columns['position'].append(position)
+                columns['x_min'].append(x)
+                columns['x_max'].append(x + width)
+                columns['y_min'].append(y)
+                columns['y_max'].append(y + height)
+                columns['width'].append(width)
+                columns['height'].append(height)
+                position += 1
+                # Now and then the next token starts inside this one (negative gap)
+                x += width + float(rng.integers(-40, 60))
+    count = len(columns['page'])
+    columns['start_index'] = columns['end_index'] = np.zeros(count)
+    columns['confidence'] = rng.random(count)
+    return TokenTable(columns, [f"w{i}" for i in range(count)], ['SPACE'] * count)
+
+
+@pytest.mark.parametrize('names', [
+    ['lamb-text.json'],
+    ['lamb-text.json', 'horse-text.json'],
+    ['horse-text.json', 'lamb-text.json', 'lamb-text.json', 'horse-text.json', 'lamb-text.json'],
+])
+def test_page_appends_match_one_shot(service, names):
+    session = HandwritingSession(service)
+    tables = []
+    for number, name in enumerate(names, start=1):
+        document = service.load_document_ai_response(os.path.join(TEST_DATA, name))
+        for page in document['pages']:
+            result = session.append_page(page, document['text'])
+            table, _ = service.extract_page_tokens(page, document['text'])
+            table.columns['page'] = np.full(len(table), number)
+            tables.append(table)
+
+    tokens = TokenTable.concat(tables)
+    trends, spacing_count = one_shot(service, tokens)
+    assert_same_trends(result["trends"], trends)
+    assert result["token_count"] == len(tokens)
+    assert result["spacing_count"] == spacing_count
+    assert result["page_count"] == len(names)
+
+
+@pytest.mark.parametrize('seed', range(15))
+def test_batch_appends_carry_the_last_token(service, seed):
+    rng = np.random.default_rng(seed)
+    tokens = written_pages(rng, int(rng.integers(1, 4)))
+    # Batches cut anywhere: mid-line, at line ends and at page breaks
+    cuts = np.sort(rng.choice(np.arange(1, len(tokens)), size=min(len(tokens) - 1, int(rng.integers(1, 8))),
+                              replace=False))
+    batches = np.split(np.arange(len(tokens)), cuts)
+
+    session = HandwritingSession(service)
+    for batch in batches:
+        result = session.append_tokens(tokens.take(batch))
+
+    trends, spacing_count = one_shot(service, tokens)
+    assert_same_trends(result["trends"], trends)
+    assert result["token_count"] == len(tokens)
+    assert result["spacing_count"] == spacing_count
+    assert result["page_count"] == len(set(tokens['page'].tolist()))
+
+
+def test_carry_pairs_tokens_across_batches(service):
+    tokens = written_pages(np.random.default_rng(0), 2)
+    spacing = service.calculate_spacing(tokens)
+    # Cut between the two tokens of a spacing pair: only the carried token can produce it
+    left = int(spacing.left[len(spacing) // 2])
+    session = HandwritingSession(service)
+    session.append_tokens(tokens.take(np.arange(left + 1)))
+    result = session.append_tokens(tokens.take(np.arange(left + 1, len(tokens))))
+    assert result["spacing_count"] == len(spacing)
+
+
+def test_no_spacing_across_pages(service):
+    tokens = written_pages(np.random.default_rng(1), 2)
+    first_page = tokens['page'] == 1
+    session = HandwritingSession(service)
+    session.append_tokens(tokens.take(np.flatnonzero(first_page)))
+    result = session.append_tokens(tokens.take(np.flatnonzero(~first_page)))
+    _, spacing_count = one_shot(service, tokens)
+    assert result["spacing_count"] == spacing_count
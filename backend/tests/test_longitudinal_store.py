@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.longitudinal_store import SECONDS_PER_DAY, LongitudinalStore  # noqa: E402
+
+
+def record_series(store, user_id, metric, values, start=1.7e9, days=1.0):
+    times = [start + i * days * SECONDS_PER_DAY for i in range(len(values))]
+    flags = [store.record(user_id, {metric: value}, t=t)[metric] for t, value in zip(times, values)]
+    return times, flags
+
+
+def test_slope_matches_polyfit():
+    store = LongitudinalStore(batch_size=4)
+    values = np.random.default_rng(1).normal(20.0, 2.0, 30) + 0.3 * np.arange(30)
+    times, _ = record_series(store, 'p1', 'speech.score', values, days=1.5)
+
+    summary = store.trajectory('p1')["metrics"]["speech.score"]
+    slope, _ = np.polyfit(np.asarray(times) / SECONDS_PER_DAY, values, 1)
+    assert summary["slope_per_day"] == pytest.approx(slope, rel=1e-9)
+    assert summary["count"] == 30
+
+
+def test_level_shift_flags_one_change_point():
+    store = LongitudinalStore()
+    rng = np.random.default_rng(2)
+    values = np.concatenate([rng.normal(10.0, 0.5, 20), rng.normal(20.0, 0.5, 20)])
+    _, flags = record_series(store, 'p1', 'handwriting.spacing_slope', values)
+
+    assert sum(flags) == 1
+    assert flags.index(True) >= 20
+    assert store.trajectory('p1')["metrics"]["handwriting.spacing_slope"]["change_points"] == 1
+
+
+def test_unknown_metrics_are_not_cached():
+    store = LongitudinalStore()
+    record_series(store, 'p1', 'speech.score', [1.0, 2.0])
+
+    result = store.trajectory('p1', metrics=['speech.score', 'speech.unknown'])
+    assert list(result["metrics"]) == ['speech.score']
+    assert store.trajectory('p2', metrics=['speech.score'])["metrics"] == {}
+    assert store.status()["cached_aggregates"] == 1
+    assert store.metrics('p1') == ['speech.score']
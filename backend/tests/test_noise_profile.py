@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.noise_profile import NoiseProfileStore  # noqa: E402
+
+SR = 16000
+
+
+def recording(rng, noise_level, seconds=1.0):
+    t = np.arange(int(SR * seconds)) / SR
+    return 0.3 * np.sin(2 * np.pi * 220 * t) * (t > 0.5) + noise_level * rng.standard_normal(len(t))
+
+
+def test_hits_do_not_rewrite_the_profile(tmp_path):
+    rng = np.random.default_rng(0)
+    store = NoiseProfileStore(directory=str(tmp_path))
+    store.reduce_noise('u:d', recording(rng, 0.01), SR)
+    path = store._path('u:d')
+    written = os.stat(path).st_mtime_ns
+    os.utime(path, ns=(written - 10 ** 9, written - 10 ** 9))
+
+    for _ in range(3):
+        store.reduce_noise('u:d', recording(rng, 0.01), SR)
+
+    assert os.stat(path).st_mtime_ns == written - 10 ** 9
+    assert store.status()["hits"] == 3
+    assert store.get('u:d').uses == 4
+    # The file still holds the profile as learned
+    assert NoiseProfileStore(directory=str(tmp_path)).get('u:d').uses == 1
+
+
+def test_refresh_rewrites_the_profile(tmp_path):
+    rng = np.random.default_rng(1)
+    store = NoiseProfileStore(directory=str(tmp_path))
+    store.reduce_noise('u:d', recording(rng, 0.01), SR)
+    learned = store.get('u:d').floor_db
+
+    # 40 dB louder noise is well past drift_db
+    store.reduce_noise('u:d', recording(rng, 1.0), SR)
+
+    assert store.status()["refreshes"] == 1
+    reloaded = NoiseProfileStore(directory=str(tmp_path)).get('u:d')
+    assert reloaded.floor_db > learned + store.drift_db
+    assert reloaded.uses == 1
@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from google.cloud import documentai_v1 as documentai  # noqa: E402
+
+from services.document_ai_parser import parse_document_ai_json  # noqa: E402
+from services.fake_document_ai import DEFAULT_RESPONSES_DIR, FakeDocumentAIServer  # noqa: E402
+from services.ocr_client import DocumentAIClient  # noqa: E402
+
+RESPONSES = {name: os.path.join(DEFAULT_RESPONSES_DIR, name) for name in ('lamb-text.json', 'horse-text.json')}
+
+
+def expected_result(path):
+    document = FakeDocumentAIServer.load_document(path)
+    return parse_document_ai_json(documentai.Document.to_json(document, use_integers_for_enums=False))
+
+
+@pytest.fixture
+def server():
+    server = FakeDocumentAIServer().start()
+    for name, path in RESPONSES.items():
+        server.add_response(name.encode('utf-8'), path)
+    yield server
+    server.stop()
+
+
+def make_client(server, **options):
+    return DocumentAIClient(endpoint=server.endpoint, deadline=10.0, attempt_timeout=5.0,
+                            backoff_max=0.05, **options)
+
+
+def test_process_matches_recorded_response(server):
+    client = make_client(server)
+    try:
+        for name, path in RESPONSES.items():
+            result = client.process(name.encode('utf-8'), 'image/jpeg')
+            assert result == expected_result(path)
+    finally:
+        client.close()
+    assert server.calls == len(RESPONSES)
+
+
+def test_unavailable_is_retried(server):
+    server.fail_first = 2
+    client = make_client(server, max_attempts=5)
+    try:
+        result = client.process(b'lamb-text.json', 'image/jpeg')
+        status = client.status()
+    finally:
+        client.close()
+    assert result == expected_result(RESPONSES['lamb-text.json'])
+    assert server.calls == 3
+    assert status["requests"] == 1
+    assert status["retries"] == 2
+    assert status["failures"] == 0
+
+
+def test_unavailable_past_max_attempts_raises(server):
+    from google.api_core import exceptions as google_exceptions
+
+    server.fail_first = 10
+    client = make_client(server, max_attempts=3)
+    try:
+        with pytest.raises(google_exceptions.ServiceUnavailable):
+            client.process(b'lamb-text.json', 'image/jpeg')
+        status = client.status()
+    finally:
+        client.close()
+    assert server.calls == 3
+    assert status["failures"] == 1
+
+
+def test_process_many_keeps_input_order(server):
+    names = ['horse-text.json', 'lamb-text.json', 'lamb-text.json', 'horse-text.json', 'lamb-text.json']
+    # Slow calls so that several pages are in flight at once
+    server.latency = 0.05
+    client = make_client(server, max_concurrency=4)
+    try:
+        results = client.process_many([(name.encode('utf-8'), 'image/jpeg') for name in names])
+    finally:
+        client.close()
+    assert results == [expected_result(RESPONSES[name]) for name in names]
+    assert server.max_in_flight > 1
@@ -0,0 +1,91 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import analysis_tasks  # noqa: E402
+from services.handwriting_service import HandwritingAnalysisService  # noqa: E402
+from services.worker_pool import AnalysisWorkerPool  # noqa: E402
+from services.writing_pipeline import WritingPipeline  # noqa: E402
+
+
+def random_document(rng, pages, text_length=4000):
+    """A Document AI-shaped document whose tokens sometimes omit startIndex or text segments."""
+    text = ''.join(rng.choice(list('abcdefgh ')) for _ in range(text_length))
+    position = 0
+    document_pages = []
+    for number in range(1, pages + 1):
+        tokens = []
+        for _ in range(int(rng.integers(0, 40))):
+            end = min(text_length, position + int(rng.integers(1, 8)))
+            segment = {'endIndex': str(end)}
+            # A missing startIndex falls back on the last kept token's end, possibly on an earlier page
+            if rng.random() > 0.3:
+                segment['startIndex'] = str(position)
+            anchor = {'textSegments': [segment]} if rng.random() > 0.1 else {}
+            x, y = (int(v) for v in rng.integers(0, 2000, 2))
+            w, h = (int(v) for v in rng.integers(5, 200, 2))
+            tokens.append({'layout': {
+                'textAnchor': anchor,
+                'confidence': float(rng.random()),
+                'boundingPoly': {'vertices': [{'x': x, 'y': y}, {'x': x + w, 'y': y},
+                                              {'x': x + w, 'y': y + h}, {'x': x, 'y': y + h}]},
+            }, 'detectedBreak': {'type': 'SPACE'}})
+            position = end
+        document_pages.append({'pageNumber': number, 'dimension': {'width': 2500, 'height': 3000},
+                               'tokens': tokens})
+    return {'text': text, 'pages': document_pages}
+
+
+def assert_same_columns(actual, expected):
+    actual, expected = actual.to_columns(), expected.to_columns()
+    assert actual.keys() == expected.keys()
+    for name in expected:
+        np.testing.assert_array_equal(np.asarray(actual[name]), np.asarray(expected[name]), err_msg=name)
+
+
+@pytest.fixture
+def pipeline():
+    return WritingPipeline(HandwritingAnalysisService(), ocr_client=None, parallel_min_pages=2, parallel_min_tokens=1)
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('parts', [2, 3, 5])
+def test_split_extraction_matches_sequential(pipeline, seed, parts):
+    rng = np.random.default_rng(seed)
+    # One long document (runs split inside it) and several short ones (runs split between them)
+    documents = [random_document(rng, int(rng.integers(1, 12))) for _ in range(int(rng.integers(1, 4)))]
+
+    runs = pipeline.split_pages(documents, parts)
+    if runs is None:
+        assert sum(len(document['pages']) for document in documents) < 2
+        return
+    assert len(runs) <= parts
+    assert [item[0] for run in runs for item in run] == [page for document in documents for page in document['pages']]
+    merged = pipeline.merge_pages(runs, [pipeline.extract_page_run(run) for run in runs])
+    assert_same_columns(merged, pipeline.extract_tokens(documents))
+
+
+def test_split_respects_thresholds():
+    pipeline = WritingPipeline(HandwritingAnalysisService(), ocr_client=None,
+                               parallel_min_pages=8, parallel_min_tokens=100)
+    rng = np.random.default_rng(0)
+    small = [random_document(rng, 3)]
+    assert pipeline.split_pages(small, 4) is None
+    large = [random_document(rng, 10)]
+    assert pipeline.split_pages(large, 1) is None
+    assert pipeline.split_pages(large, 4) is not None
+
+
+def test_extraction_on_worker_processes(pipeline):
+    documents = [random_document(np.random.default_rng(7), 9)]
+    analysis_tasks.configure(writing_pipeline=pipeline)
+    pool = AnalysisWorkerPool(workers=2).start()
+    try:
+        runs = pipeline.split_pages(documents, pool.workers)
+        results = [pool.run(analysis_tasks.extract_page_run, run) for run in runs]
+    finally:
+        pool.shutdown()
+    assert_same_columns(pipeline.merge_pages(runs, results), pipeline.extract_tokens(documents))
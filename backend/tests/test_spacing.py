@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.handwriting_service import HandwritingAnalysisService  # noqa: E402
+from services.token_table import SpacingTable, TokenTable  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'test-data')
+
+
+def reference_spacing(tokens):
+    """The per-pair loop calculate_spacing used before it was vectorized."""
+    left, right, spacings = [], [], []
+    page, y_min, y_max = tokens['page'], tokens['y_min'], tokens['y_max']
+    x_min, x_max = tokens['x_min'], tokens['x_max']
+    order = np.lexsort((tokens['position'], page))
+    for current, following in zip(order[:-1], order[1:]):
+        y_overlap = y_min[current] <= y_max[following] and y_max[current] >= y_min[following]
+        if y_overlap and page[current] == page[following]:
+            spacing = x_min[following] - x_max[current]
+            if spacing >= 0:
+                left.append(current)
+                right.append(following)
+                spacings.append(spacing)
+    return SpacingTable(tokens, left, right, spacings)
+
+
+def random_tokens(rng, count):
+    """Tokens out of (page, position) order, with shared positions, overlapping lines and overlapping boxes."""
+    x_min = rng.integers(0, 2000, count).astype(float)
+    # A few lines per page, so that many neighbours overlap vertically
+    y_min = (rng.integers(0, 8, count) * 100 + rng.integers(-30, 30, count)).astype(float)
+    width = rng.integers(0, 300, count).astype(float)
+    height = rng.integers(0, 120, count).astype(float)
+    columns = {
+        'page': rng.integers(1, 4, count),
+        'position': rng.integers(0, max(1, count // 2), count),
+        'x_min': x_min, 'x_max': x_min + width,
+        'y_min': y_min, 'y_max': y_min + height,
+        'width': width, 'height': height,
+        'confidence': rng.random(count),
+    }
+    text = [f"t{i}" for i in range(count)]
+    return TokenTable(columns, text, ['SPACE'] * count)
+
+
+def assert_same_spacing(actual, expected):
+    np.testing.assert_array_equal(actual.left, expected.left)
+    np.testing.assert_array_equal(actual.right, expected.right)
+    np.testing.assert_array_equal(actual.spacing, expected.spacing)
+    assert actual.to_records() == expected.to_records()
+
+
+@pytest.fixture
+def service():
+    return HandwritingAnalysisService()
+
+
+@pytest.mark.parametrize('name', ['lamb-text.json', 'horse-text.json'])
+def test_matches_loop_on_test_data(service, name):
+    document = service.load_document_ai_response(os.path.join(TEST_DATA, name))
+    tokens = service.extract_token_data(document)
+    assert len(tokens) > 1
+    assert_same_spacing(service.calculate_spacing(tokens), reference_spacing(tokens))
+
+
+@pytest.mark.parametrize('seed', range(25))
+def test_matches_loop_on_random_tables(service, seed):
+    rng = np.random.default_rng(seed)
+    tokens = random_tokens(rng, int(rng.integers(2, 400)))
+    assert_same_spacing(service.calculate_spacing(tokens), reference_spacing(tokens))
+
+
+@pytest.mark.parametrize('count', [0, 1])
+def test_too_few_tokens(service, count):
+    tokens = random_tokens(np.random.default_rng(0), count)
+    spacing = service.calculate_spacing(tokens)
+    assert len(spacing) == 0
+    assert spacing.to_records() == []
@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.handwriting_service import HandwritingAnalysisService  # noqa: E402
+from services.token_table import TokenTable  # noqa: E402
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'test-data')
+
+
+def tokens_and_spacing():
+    service = HandwritingAnalysisService()
+    tokens = service.extract_token_data(service.load_document_ai_response(os.path.join(TEST_DATA, 'lamb-text.json')))
+    return tokens, service.calculate_spacing(tokens)
+
+
+def test_pixel_geometry_is_written_as_integers():
+    tokens, spacing = tokens_and_spacing()
+    record = tokens.to_records()[0]
+    for name in TokenTable.GEOMETRY_COLUMNS:
+        assert type(record[name]) is int, name
+    assert type(record["confidence"]) is float
+    pair = spacing.to_records()[0]
+    for name in ('spacing', 'left_token_width', 'right_token_width'):
+        assert type(pair[name]) is int, name
+    assert '.0,' not in json.dumps(tokens.to_records()[:3])
+
+
+def test_columns_and_records_agree():
+    tokens, spacing = tokens_and_spacing()
+    columns = tokens.to_columns()
+    records = tokens.to_records()
+    for name in TokenTable.GEOMETRY_COLUMNS:
+        assert columns[name].dtype == np.int64, name
+        assert columns[name].tolist() == [record[name] for record in records]
+    assert spacing.to_columns()['spacing'].tolist() == [pair['spacing'] for pair in spacing.to_records()]
+
+
+def test_fractional_geometry_stays_float():
+    tokens, _ = tokens_and_spacing()
+    tokens.columns['x_min'] = tokens.columns['x_min'] + 0.5
+    assert tokens.to_columns()['x_min'].dtype == np.float64
+    assert type(tokens.to_records()[0]['x_min']) is float
+    # Other whole-valued columns are still integers
+    assert type(tokens.to_records()[0]['x_max']) is int
@@ -0,0 +1,176 @@
+import base64
+import importlib.util
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from services.fake_document_ai import DEFAULT_RESPONSES_DIR, FakeDocumentAIServer  # noqa: E402
+
+LAMB = os.path.join(DEFAULT_RESPONSES_DIR, 'lamb-text.json')
+HORSE = os.path.join(DEFAULT_RESPONSES_DIR, 'horse-text.json')
+
+
+def png(width):
+    """A blank page; the fake server answers it with whatever response it was given for these bytes."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, 50), 'white').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def page(content):
+    return {"content": base64.b64encode(content).decode('ascii'), "mimeType": "image/png"}
+
+
+@pytest.fixture(scope='module')
+def ocr():
+    with FakeDocumentAIServer() as server:
+        yield server
+
+
+@pytest.fixture(scope='module')
+def server(ocr, tmp_path_factory):
+    """The backend-server module, configured against the fake OCR server (loaded by path: the name has a hyphen)."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('PARKER_DOCUMENT_AI_ENDPOINT', ocr.endpoint)
+        patch.setenv('PARKER_LONGITUDINAL_DB', str(tmp_path_factory.mktemp('longitudinal') / 'store.sqlite3'))
+        patch.setenv('PARKER_ANALYSIS_WORKERS', '0')
+        for name in ('PARKER_OCR_PREPROCESS', 'PARKER_OCR_CACHE_DIR', 'PARKER_PLOT_CACHE_DIR'):
+            patch.delenv(name, raising=False)
+        spec = importlib.util.spec_from_file_location('backend_server', os.path.join(BACKEND_DIR, 'backend-server.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    yield module
+    module.ocr_client.close()
+
+
+@pytest.fixture(scope='module')
+def pages(ocr):
+    lamb, horse = png(100), png(101)
+    ocr.add_response(lamb, LAMB)
+    ocr.add_response(horse, HORSE)
+    return lamb, horse
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def analyze(client, body, **query):
+    response = client.post('/writing-analysis', json=body, query_string=query)
+    return response.status_code, response.get_json()
+
+
+def test_single_page(client, pages):
+    status, result = analyze(client, page(pages[0]))
+    assert status == 200, result
+    assert result["status"] == "success"
+    assert result["page_count"] == 1
+    assert result["token_count"] > 0
+    assert set(result["trends"]) >= {"token_width_slope", "token_height_slope", "spacing_slope"}
+    assert "lines" not in result["line_trends"]
+    assert "token_data" not in result
+
+
+def test_pages_add_up(client, pages):
+    counts = [analyze(client, page(content))[1]["token_count"] for content in pages]
+    status, result = analyze(client, {"pages": [page(content) for content in pages]})
+    assert status == 200, result
+    assert result["page_count"] == 2
+    assert result["token_count"] == sum(counts)
+
+
+@pytest.mark.parametrize('detail', ['summary', 'lines', 'tokens'])
+@pytest.mark.parametrize('in_query', [False, True])
+def test_detail_levels(client, pages, detail, in_query):
+    body = {"pages": [page(content) for content in pages]}
+    if in_query:
+        status, result = analyze(client, body, detail=detail)
+    else:
+        status, result = analyze(client, dict(body, detail=detail))
+    assert status == 200, result
+    assert ("lines" in result["line_trends"]) == (detail != 'summary')
+    assert ("token_data" in result) == (detail == 'tokens')
+    if detail == 'tokens':
+        tokens = result["token_data"]
+        assert len(tokens["text"]) == result["token_count"]
+        assert sorted(set(tokens["page"])) == [1, 2]
+        assert len(result["spacing_data"]["spacing"]) == result["spacing_count"]
+
+
+def test_visualization(client, pages):
+    _, result = analyze(client, page(pages[0]))
+    response = client.get(f"/writing-analysis/{result['document_hash']}/visualization")
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG')
+
+
+def test_visualization_of_unknown_document(client):
+    response = client.get(f"/writing-analysis/{'0' * 64}/visualization")
+    assert response.status_code == 404
+    assert "error" in response.get_json()
+
+
+def test_bad_base64(client, ocr):
+    calls = ocr.calls
+    status, result = analyze(client, {"content": "not base64!", "mimeType": "image/png"})
+    assert status == 400
+    assert "base64" in result["error"]
+    assert ocr.calls == calls
+
+
+@pytest.mark.parametrize('in_query', [False, True])
+def test_bad_detail(client, pages, ocr, in_query):
+    calls = ocr.calls
+    if in_query:
+        status, result = analyze(client, page(pages[0]), detail='everything')
+    else:
+        status, result = analyze(client, dict(page(pages[0]), detail='everything'))
+    assert status == 400
+    assert "detail" in result["error"]
+    assert ocr.calls == calls
+
+
+def test_missing_content(client):
+    status, result = analyze(client, {"pages": [{"mimeType": "image/png"}]})
+    assert status == 400
+    assert "content" in result["error"]
+
+
+def test_shared_results_are_counters(client):
+    exposition = client.get('/metrics').get_data(as_text=True)
+    for name in ('parker_requests_coalesced_total', 'parker_idempotent_replays_total'):
+        assert f"# TYPE {name} counter" in exposition
+        assert f"\n{name} " in exposition
+
+
+def test_session_page_errors(client):
+    session_id = client.post('/writing-session').get_json()["session_id"]
+    response = client.post(f'/writing-session/{session_id}/pages', json={"document": "{not json"})
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "failed"
+
+
+def test_speech_errors(client):
+    for body in ({}, {"content": "not base64!"}):
+        response = client.post('/speech-analysis', json=body)
+        assert response.status_code == 400
+        assert response.get_json()["status"] == "failed"
+
+
+def test_full_queue_is_rejected(server, client, pages, monkeypatch):
+    controller = server.admission['writing']
+    monkeypatch.setattr(controller, '_pending', controller.max_concurrent + controller.max_queue)
+    for url in ('/writing-analysis', '/writing-session/unknown/pages'):
+        response = client.post(url, json=page(pages[0]))
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+        assert response.get_json()["reason"] == "queue_full"
+    exposition = client.get('/metrics').get_data(as_text=True)
+    assert 'parker_admission_rejections_total{endpoint="/writing-analysis",reason="queue_full"}' in exposition